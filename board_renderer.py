@@ -0,0 +1,196 @@
+# board_renderer.py
+# コネクトフォー / 立体コネクトフォー共通の盤面画像レンダラー（Pillowがある場合のみ有効）
+
+import asyncio
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:  # Pillow 未導入時は絵文字の盤面表示のみ
+    Image = None
+    ImageDraw = None
+
+PILLOW_AVAILABLE = Image is not None
+
+# 描画設定
+CELL_SIZE = 40          # 1マスの大きさ(px)
+DISC_MARGIN = 4         # マスの縁と駒の間隔
+LABEL_HEIGHT = 18       # 列番号・層名の帯の高さ
+LAYER_GAP = 12          # 立体盤面の層と層の間隔
+BOARD_COLOR = (32, 86, 196)
+BACKGROUND_COLOR = (47, 49, 54)  # Discordのダークテーマに合わせる
+LABEL_COLOR = (230, 230, 230)
+DISC_COLORS = {
+    "empty": (235, 235, 235),
+    "red": (221, 46, 68),
+    "yellow": (253, 203, 88),
+}
+
+IMAGE_CACHE_SIZE = 512  # エンコード済みPNGを保持する局面数
+
+# エンコード済み画像のキャッシュ {局面キー: PNGバイト列}（スレッドプールから触るのでロック付き）
+_image_cache: "OrderedDict[Tuple, bytes]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+# PNGエンコードでイベントループを止めないためのスレッドプール
+_executor: Optional[ThreadPoolExecutor] = None
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="board-renderer")
+    return _executor
+
+# =============================
+# スプライト（サイズごとに1度だけ描画）
+# =============================
+@lru_cache(maxsize=None)
+def _disc_sprite(color: str) -> "Image.Image":
+    """駒1個分の透過スプライト"""
+    sprite = Image.new("RGBA", (CELL_SIZE, CELL_SIZE), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(sprite)
+    draw.ellipse(
+        (DISC_MARGIN, DISC_MARGIN, CELL_SIZE - DISC_MARGIN - 1, CELL_SIZE - DISC_MARGIN - 1),
+        fill=DISC_COLORS[color]
+    )
+    return sprite
+
+@lru_cache(maxsize=None)
+def _grid_sprite(rows: int, cols: int, label: str = "") -> "Image.Image":
+    """空の盤面（穴あきのボードと列番号）"""
+    grid = Image.new("RGB", (cols * CELL_SIZE, rows * CELL_SIZE + LABEL_HEIGHT), BACKGROUND_COLOR)
+    draw = ImageDraw.Draw(grid)
+    if label:
+        draw.text((2, 3), label, fill=LABEL_COLOR)
+    else:
+        for col in range(cols):
+            draw.text((col * CELL_SIZE + CELL_SIZE // 2 - 3, 3), str(col + 1), fill=LABEL_COLOR)
+    draw.rectangle((0, LABEL_HEIGHT, cols * CELL_SIZE - 1, LABEL_HEIGHT + rows * CELL_SIZE - 1), fill=BOARD_COLOR)
+    empty = _disc_sprite("empty")
+    for row in range(rows):
+        for col in range(cols):
+            grid.paste(empty, (col * CELL_SIZE, LABEL_HEIGHT + row * CELL_SIZE), empty)
+    return grid
+
+@lru_cache(maxsize=None)
+def _cube_sprite(size: int) -> "Image.Image":
+    """立体盤面の空の全層（上の層から左に並べる）"""
+    layer_width = size * CELL_SIZE
+    cube = Image.new(
+        "RGB",
+        (size * layer_width + (size - 1) * LAYER_GAP, size * CELL_SIZE + LABEL_HEIGHT),
+        BACKGROUND_COLOR
+    )
+    for i in range(size):
+        layer = _grid_sprite(size, size, f"Layer {size - i}")
+        cube.paste(layer, (i * (layer_width + LAYER_GAP), 0))
+    return cube
+
+# =============================
+# 描画とエンコード
+# =============================
+def _encode(image: "Image.Image") -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)  # 速度優先の圧縮
+    return buffer.getvalue()
+
+def _cached(key: Tuple, draw) -> bytes:
+    with _cache_lock:
+        png = _image_cache.get(key)
+        if png is not None:
+            _image_cache.move_to_end(key)
+            return png
+    png = _encode(draw())
+    with _cache_lock:
+        _image_cache[key] = png
+        if len(_image_cache) > IMAGE_CACHE_SIZE:
+            _image_cache.popitem(last=False)
+    return png
+
+def draw_connectfour(rows: int, cols: int, height: int, bitboards: Tuple[int, int]) -> bytes:
+    """コネクトフォーの盤面をPNGにする（bit = 列 * height + 下からの行）"""
+    def draw():
+        image = _grid_sprite(rows, cols).copy()
+        for player, color in enumerate(("red", "yellow")):
+            sprite = _disc_sprite(color)
+            bitboard = bitboards[player]
+            while bitboard:
+                bit = (bitboard & -bitboard).bit_length() - 1
+                bitboard &= bitboard - 1
+                col, row_from_bottom = divmod(bit, height)
+                top = LABEL_HEIGHT + (rows - 1 - row_from_bottom) * CELL_SIZE
+                image.paste(sprite, (col * CELL_SIZE, top), sprite)
+        return image
+    return _cached(("connectfour", rows, cols, bitboards[0], bitboards[1]), draw)
+
+def draw_connect4_3d(position_hash: int, bitboards: Tuple[int, int], size: int = 4) -> bytes:
+    """立体コネクトフォーの盤面をPNGにする（bit = x + size*y + size*size*z、z=size-1 が最下段）"""
+    def draw():
+        image = _cube_sprite(size).copy()
+        layer_width = size * CELL_SIZE + LAYER_GAP
+        for player, color in enumerate(("red", "yellow")):
+            sprite = _disc_sprite(color)
+            bitboard = bitboards[player]
+            while bitboard:
+                cell = (bitboard & -bitboard).bit_length() - 1
+                bitboard &= bitboard - 1
+                x, y, z = cell % size, cell // size % size, cell // (size * size)
+                # 表示は z の大きい層（Layer size）から左に並べる
+                left = (size - 1 - z) * layer_width + x * CELL_SIZE
+                image.paste(sprite, (left, LABEL_HEIGHT + y * CELL_SIZE), sprite)
+        return image
+    return _cached(("connect4_3d", size, position_hash), draw)
+
+async def render_connectfour_png(game) -> Optional[bytes]:
+    """ConnectFourGame の盤面画像（Pillowがなければ None）"""
+    if not PILLOW_AVAILABLE:
+        return None
+    config = game.config
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), draw_connectfour, config.rows, config.cols, config.height, tuple(game.bitboards)
+    )
+
+async def render_connect4_3d_png(game) -> Optional[bytes]:
+    """Connect4_3DGame の盤面画像（Pillowがなければ None）"""
+    if not PILLOW_AVAILABLE:
+        return None
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), draw_connect4_3d, game.zobrist_hash, tuple(game.bitboards), game.size
+    )
+
+# ベンチマーク
+def benchmark_render(images: int = 300) -> Dict[str, float]:
+    """1秒あたりの描画枚数（キャッシュなし / キャッシュ命中）"""
+    import random
+    import time
+
+    results = {}
+    rng = random.Random(1)
+    for name in ("connectfour", "connect4_3d"):
+        positions = []
+        for _ in range(images):
+            if name == "connectfour":
+                bitboards = tuple(sum(1 << (c * 7 + r) for c in range(7) for r in range(6)
+                                      if rng.random() < 0.3) for _ in range(2))
+                positions.append(lambda b=bitboards: draw_connectfour(6, 7, 7, b))
+            else:
+                bitboards = (rng.getrandbits(64) & rng.getrandbits(64), 0)
+                bitboards = (bitboards[0], rng.getrandbits(64) & ~bitboards[0] & rng.getrandbits(64))
+                positions.append(lambda b=bitboards: draw_connect4_3d(hash(b), b))
+        _image_cache.clear()
+        start = time.perf_counter()
+        for render in positions:
+            render()
+        results[f"{name}_uncached"] = images / (time.perf_counter() - start)
+        start = time.perf_counter()
+        for render in positions[-IMAGE_CACHE_SIZE:]:
+            render()
+        results[f"{name}_cached"] = min(images, IMAGE_CACHE_SIZE) / (time.perf_counter() - start)
+    return results
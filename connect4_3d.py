@@ -2,8 +2,15 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import asyncio
+import io
+import random
+import time
 from typing import List, Optional, Dict, Set, Tuple
 from datetime import datetime
+from functools import lru_cache
+from operator import xor
+
+from board_renderer import render_connect4_3d_png
 
 # グローバル変数の定義
 connect4_3d_bot = None
@@ -12,7 +19,16 @@ connect4_3d_bot = None
 EMPTY = "⚪"  # 空きマス
 RED = "🔴"    # プレイヤー1
 YELLOW = "🟡" # プレイヤー2
-NUMBERS = ["1️⃣", "2️⃣", "3️⃣", "4️⃣"]  # 座標番号
+NUMBERS = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣"]  # 座標番号
+
+# 盤面の一辺と並べる数（/立体コネクトフォー の size で選ぶ）
+CUBE_PRESETS = {
+    "4x4x4": (4, 4),  # 標準
+    "5x5x5": (5, 4),
+    "5x5x5-5": (5, 5),  # 五目
+}
+MAX_BUTTON_COLUMNS = 16  # これを超える盤面はボタンではなくセレクトメニューで列を選ぶ
+MAX_SELECT_OPTIONS = 25  # Discordのセレクトメニューの選択肢の上限
 
 # エラーメッセージの定数
 ERROR_MESSAGES = {
@@ -60,9 +76,143 @@ class GameStats:
             f"📊 勝率: {self.stats['wins'] / max(1, self.stats['total_games']):.1%}"
         )
 
+# =============================
+# 勝ちラインの索引とビットボード（盤面サイズごとに生成してキャッシュ）
+# =============================
+# 一辺 n の立方体で、マス (x, y, z) の番号は x + n*y + n*n*z で、整数のビット位置と一致する。
+# z は n-1 が最下段（駒は z=n-1 から積み上がる）。列番号は x + n*y。
+# 4×4×4 の四目並べには勝ちラインが76本あり、各マスは4本または7本のラインに属する。
+#
+# 重力方向（z）を保ったまま x-y 平面を回転・反転する8通り（二面体群 D4）は勝ちラインを保存する。
+# 8通りそれぞれで変換した盤面のZobristハッシュを差分更新し、その最小値を正規化ハッシュとする。
+DIRECTIONS = [
+    (dx, dy, dz)
+    for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+    if (dx, dy, dz) > (0, 0, 0)  # 逆向きの重複を除いた13方向
+]
+
+def transform_xy(x: int, y: int, symmetry: int, size: int = 4) -> Tuple[int, int]:
+    """対称変換 symmetry（0〜7: bit0=x反転, bit1=y反転, bit2=x/y入れ替え）を適用する"""
+    if symmetry & 4:
+        x, y = y, x
+    if symmetry & 1:
+        x = size - 1 - x
+    if symmetry & 2:
+        y = size - 1 - y
+    return x, y
+
+def count_win_lines(size: int, connect: int) -> int:
+    """勝ちラインの本数の理論値（方向ごとに、動く軸は size-connect+1 通り、動かない軸は size 通り）"""
+    total = 0
+    for direction in DIRECTIONS:
+        lines = 1
+        for d in direction:
+            lines *= size if d == 0 else size - connect + 1
+        total += lines
+    return total
+
+class CubeConfig:
+    """立方体の一辺と並べる数ごとの、勝ちライン・対称変換・Zobrist乱数の表"""
+
+    def __init__(self, size: int, connect: int):
+        self.size = size
+        self.connect = connect
+        self.columns = size * size
+        self.cells = size * size * size
+        self.full_board = (1 << self.cells) - 1
+
+        # 勝ちラインと、マス -> そのマスを通るライン
+        self.win_lines = self._generate_win_lines()
+        self.line_masks = [sum(1 << cell for cell in line) for line in self.win_lines]
+        self.cell_lines: List[List[int]] = [[] for _ in range(self.cells)]
+        for line_id, line in enumerate(self.win_lines):
+            for cell in line:
+                self.cell_lines[cell].append(line_id)
+        self.cell_line_masks = [[self.line_masks[line] for line in lines] for lines in self.cell_lines]
+
+        # 対称変換 -> 列番号・マス番号の写像
+        self.symmetry_columns = [
+            [x + size * y for x, y in (transform_xy(col % size, col // size, s, size) for col in range(self.columns))]
+            for s in range(8)
+        ]
+        self.symmetry_cells = [
+            [self.symmetry_columns[s][cell % self.columns] + self.columns * (cell // self.columns)
+             for cell in range(self.cells)]
+            for s in range(8)
+        ]
+        self.inverse_symmetry = [
+            next(t for t in range(8)
+                 if all(self.symmetry_columns[t][self.symmetry_columns[s][col]] == col for col in range(self.columns)))
+            for s in range(8)
+        ]
+
+        # プロセス間でハッシュ値が一致するよう、乱数の種は固定する
+        rng = random.Random(f"connect4_3d-zobrist-{size}-{connect}")
+        zobrist = [[rng.getrandbits(64) for _ in range(self.cells)] for _ in range(2)]
+        # zobrist_symmetric[player][cell] = 8通りの対称変換後のマスに対応する乱数
+        self.zobrist_symmetric = [
+            [tuple(zobrist[player][self.symmetry_cells[s][cell]] for s in range(8)) for cell in range(self.cells)]
+            for player in range(2)
+        ]
+
+    def cell_index(self, x: int, y: int, z: int) -> int:
+        """座標をマス番号に変換する"""
+        return x + self.size * y + self.columns * z
+
+    def _generate_win_lines(self) -> List[Tuple[int, ...]]:
+        """13方向 × 全始点から、盤内に収まる connect マスの並びを全て列挙する"""
+        size, connect = self.size, self.connect
+        lines = []
+        for dx, dy, dz in DIRECTIONS:
+            for x in range(size):
+                for y in range(size):
+                    for z in range(size):
+                        cells = [(x + dx * i, y + dy * i, z + dz * i) for i in range(connect)]
+                        if all(0 <= c < size for cell in cells for c in cell):
+                            lines.append(tuple(self.cell_index(*cell) for cell in cells))
+        return lines
+
+    def compute_hash_keys(self, bitboards: Tuple[int, int]) -> Tuple[int, ...]:
+        """盤面全体から8通りのZobristハッシュを計算する（差分更新の初期値用）"""
+        keys = [0] * 8
+        for player in range(2):
+            bitboard = bitboards[player]
+            while bitboard:
+                cell = (bitboard & -bitboard).bit_length() - 1
+                bitboard &= bitboard - 1
+                for s in range(8):
+                    keys[s] ^= self.zobrist_symmetric[player][cell][s]
+        return tuple(keys)
+
+@lru_cache(maxsize=None)
+def get_cube_config(size: int = 4, connect: int = 4) -> CubeConfig:
+    """盤面設定を生成してキャッシュする"""
+    if not 2 <= size <= len(NUMBERS):
+        raise ValueError(f"盤面の一辺は2〜{len(NUMBERS)}で指定してください")
+    if not 2 <= connect <= size:
+        raise ValueError("並べる数が盤面サイズに対して不正です")
+    return CubeConfig(size, connect)
+
+# 標準の 4×4×4 四目並べの表（CPU対戦はこの盤面を前提にする）
+DEFAULT_CONFIG = get_cube_config(4, 4)
+WIN_LINES = DEFAULT_CONFIG.win_lines
+LINE_MASKS = DEFAULT_CONFIG.line_masks
+CELL_LINES = DEFAULT_CONFIG.cell_lines
+CELL_LINE_MASKS = DEFAULT_CONFIG.cell_line_masks
+FULL_BOARD = DEFAULT_CONFIG.full_board
+SYMMETRY_COLUMNS = DEFAULT_CONFIG.symmetry_columns
+SYMMETRY_CELLS = DEFAULT_CONFIG.symmetry_cells
+INVERSE_SYMMETRY = DEFAULT_CONFIG.inverse_symmetry
+ZOBRIST_SYMMETRIC = DEFAULT_CONFIG.zobrist_symmetric
+cell_index = DEFAULT_CONFIG.cell_index
+compute_hash_keys = DEFAULT_CONFIG.compute_hash_keys
+
 class Connect4_3DGame:
-    def __init__(self, player1: discord.User, player2: discord.User):
-        self.board = [[[EMPTY for _ in range(4)] for _ in range(4)] for _ in range(4)]
+    def __init__(self, player1: discord.User, player2: discord.User, size: int = 4, connect: int = 4):
+        self.config = get_cube_config(size, connect)
+        self.bitboards = [0, 0]  # [🔴, 🟡] それぞれの駒の位置（size³ ビット）
+        self.heights = [0] * self.config.columns  # 各列 (x + size*y) に積まれた駒の数
+        self.hash_keys = (0,) * 8  # 対称変換ごとのZobristハッシュ
         self.player1 = player1  # 🔴
         self.player2 = player2  # 🟡
         self.current_player = player1
@@ -71,38 +221,69 @@ class Connect4_3DGame:
         self.start_time = datetime.now()
         self.moves = []  # 手の履歴
 
+    @property
+    def size(self) -> int:
+        return self.config.size
+
+    def is_column_full(self, x: int, y: int) -> bool:
+        """列 (x, y) が満杯かどうか"""
+        return self.heights[x + self.size * y] == self.size
+
     def make_move(self, x: int, y: int) -> bool:
         """
         指定された位置(x, y)に駒を配置する
         戻り値: 配置成功したかどうか
         """
-        if not (0 <= x < 4 and 0 <= y < 4):
+        size = self.size
+        if not (0 <= x < size and 0 <= y < size) or self.is_column_full(x, y):
             return False
 
-        # 一番下の空きマスを探す
-        for z in range(3, -1, -1):
-            if self.board[z][y][x] == EMPTY:
-                self.board[z][y][x] = RED if self.current_player == self.player1 else YELLOW
-                self.moves.append((self.current_player.id, (x, y, z)))
-                return True
-        return False
-
-    def get_board_display(self) -> str:
-        """ゲームボードの文字列表現を返す（視認性向上版）"""
+        # 一番下の空きマスに置く
+        z = size - 1 - self.heights[x + size * y]
+        index = 0 if self.current_player == self.player1 else 1
+        cell = self.config.cell_index(x, y, z)
+        self.bitboards[index] |= 1 << cell
+        self.heights[x + size * y] += 1
+        self.hash_keys = tuple(map(xor, self.hash_keys, self.config.zobrist_symmetric[index][cell]))
+        self.moves.append((self.current_player.id, (x, y, z)))
+        return True
+
+    @property
+    def zobrist_hash(self) -> int:
+        """この盤面そのもののハッシュ"""
+        return self.hash_keys[0]
+
+    def canonical_hash(self) -> int:
+        """対称な盤面同士で一致する正規化ハッシュ"""
+        return min(self.hash_keys)
+
+    def get_cell(self, x: int, y: int, z: int) -> str:
+        """マス (x, y, z) の絵文字を返す"""
+        bit = 1 << self.config.cell_index(x, y, z)
+        if self.bitboards[0] & bit:
+            return RED
+        if self.bitboards[1] & bit:
+            return YELLOW
+        return EMPTY
+
+    def get_board_display(self, with_grid: bool = True) -> str:
+        """ゲームボードの文字列表現を返す（with_grid=False は画像表示用に手番と時間のみ）"""
         display = []
+        size = self.size
+        separator = "  " + "─" * (size * 3 + 3)
         
         # 各層の表示
-        for z in range(3, -1, -1):  # 上から下へ
+        for z in range(size - 1, -1, -1) if with_grid else ():  # 上から下へ
             display.append(f"\n📊 Layer {z+1}")
-            display.append("  " + " ".join(NUMBERS))  # x座標
-            display.append("  " + "─" * 15)  # 区切り線
+            display.append("  " + " ".join(NUMBERS[:size]))  # x座標
+            display.append(separator)  # 区切り線
             
-            for y in range(4):
+            for y in range(size):
                 row = [NUMBERS[y]]  # y座標
-                row.extend(self.board[z][y])
+                row.extend(self.get_cell(x, y, z) for x in range(size))
                 display.append("│ " + " ".join(row) + " │")
             
-            display.append("  " + "─" * 15)  # 区切り線
+            display.append(separator)  # 区切り線
         
         # 現在のプレイヤーの表示
         display.append(f"\n手番: {self.current_player.mention}")
@@ -117,10 +298,18 @@ class Connect4_3DGame:
             
         return "\n".join(display)
 
+    async def render_board(self) -> Tuple[str, List[discord.File]]:
+        """盤面メッセージの本文と添付画像を返す（Pillowがなければ絵文字の層表示のみ）"""
+        png = await render_connect4_3d_png(self)
+        if png is None:
+            return self.get_board_display(), []
+        return self.get_board_display(with_grid=False), [discord.File(io.BytesIO(png), filename="board.png")]
+
     def get_game_summary(self) -> str:
         """ゲームの要約を返す"""
         return (
             f"🎮 ゲーム結果\n"
+            f"盤面: {self.size}×{self.size}×{self.size}（{self.config.connect}目並べ）\n"
             f"赤 {RED}: {self.player1.mention}\n"
             f"黄 {YELLOW}: {self.player2.mention}\n"
             f"手数: {len(self.moves)}\n"
@@ -129,59 +318,22 @@ class Connect4_3DGame:
 
     def check_winner(self) -> Optional[discord.User]:
         """
-        勝者を判定する
-        戻り値: 勝者のUser、引き分けはNone
+        勝者を判定する（直前に置いた駒を通るラインマスクだけを調べる。4×4×4なら4〜7本）
+        戻り値: 勝者のUser、勝者がいなければNone（引き分けは is_full で判定）
         """
-        # 全方向のチェック
-        directions = [
-            # 水平方向
-            [(0,0,0), (0,0,1), (0,0,2), (0,0,3)],
-            [(0,1,0), (0,1,1), (0,1,2), (0,1,3)],
-            [(0,2,0), (0,2,1), (0,2,2), (0,2,3)],
-            [(0,3,0), (0,3,1), (0,3,2), (0,3,3)],
-            # 垂直方向
-            [(0,0,0), (1,0,0), (2,0,0), (3,0,0)],
-            [(0,1,0), (1,1,0), (2,1,0), (3,1,0)],
-            [(0,2,0), (1,2,0), (2,2,0), (3,2,0)],
-            [(0,3,0), (1,3,0), (2,3,0), (3,3,0)],
-            # 奥行き方向
-            [(0,0,0), (0,1,0), (0,2,0), (0,3,0)],
-            [(1,0,0), (1,1,0), (1,2,0), (1,3,0)],
-            [(2,0,0), (2,1,0), (2,2,0), (2,3,0)],
-            [(3,0,0), (3,1,0), (3,2,0), (3,3,0)],
-            # 斜め方向（平面）
-            [(0,0,0), (1,1,0), (2,2,0), (3,3,0)],
-            [(0,3,0), (1,2,0), (2,1,0), (3,0,0)],
-            # 斜め方向（立体）
-            [(0,0,0), (1,1,1), (2,2,2), (3,3,3)],
-            [(0,3,0), (1,2,1), (2,1,2), (3,0,3)],
-            [(3,0,0), (2,1,1), (1,2,2), (0,3,3)],
-            [(3,3,0), (2,2,1), (1,1,2), (0,0,3)]
-        ]
-
-        for direction in directions:
-            for x in range(4):
-                for y in range(4):
-                    for z in range(4):
-                        # 各方向について4つ分チェック
-                        pieces = []
-                        for dx, dy, dz in direction:
-                            nx, ny, nz = x + dx, y + dy, z + dz
-                            if 0 <= nx < 4 and 0 <= ny < 4 and 0 <= nz < 4:
-                                pieces.append(self.board[nz][ny][nx])
-                        
-                        if len(pieces) == 4:
-                            if all(p == RED for p in pieces):
-                                return self.player1
-                            elif all(p == YELLOW for p in pieces):
-                                return self.player2
-
-        # 引き分けチェック（全マスが埋まっている）
-        is_full = all(self.board[z][y][x] != EMPTY 
-                     for x in range(4) 
-                     for y in range(4) 
-                     for z in range(4))
-        return None if is_full else False
+        if not self.moves:
+            return None
+        player_id, (x, y, z) = self.moves[-1]
+        index = 0 if player_id == self.player1.id else 1
+        bitboard = self.bitboards[index]
+        for mask in self.config.cell_line_masks[self.config.cell_index(x, y, z)]:
+            if bitboard & mask == mask:
+                return self.player1 if index == 0 else self.player2
+        return None
+
+    def is_full(self) -> bool:
+        """全マスが埋まっているかどうか"""
+        return (self.bitboards[0] | self.bitboards[1]).bit_count() == self.config.cells
 
 class SurrenderButton(discord.ui.Button):
     def __init__(self):
@@ -199,23 +351,25 @@ class SurrenderButton(discord.ui.Button):
 
         # 投了したプレイヤーの敗北として処理
         winner = view.game.player2 if interaction.user == view.game.player1 else view.game.player1
-        await view.end_game(interaction, f"👋 {interaction.user.mention} が投了しました。{winner.mention} の勝利！")
+        await view.end_game(interaction, f"👋 {interaction.user.mention} が投了しました。{winner.mention} の勝利！", winner)
 
 class Connect4_3DView(discord.ui.View):
-    def __init__(self, game: Connect4_3DGame):
+    def __init__(self, game: Connect4_3DGame, cpu_strength: Optional[str] = None):
         super().__init__(timeout=180)  # 3分でタイムアウト
         self.game = game
         self.message = None
+        self.cpu_strength = cpu_strength  # CPU対戦時の強さ（player2がCPU）
+        self.cpu_thinking = False
         self.update_buttons()
         self.add_item(SurrenderButton())  # 投了ボタンを追加
 
-    async def end_game(self, interaction: discord.Interaction, result: str):
-        """ゲーム終了時の共通処理"""
+    async def end_game(self, interaction: Optional[discord.Interaction], result: str,
+                       winner: Optional[discord.User] = None):
+        """ゲーム終了時の共通処理（CPUの手で終わった場合は interaction が None）"""
         self.game.is_finished = True
         
         # 戦績の更新
-        if "勝利" in result:
-            winner = self.game.player1 if self.game.current_player == self.game.player2 else self.game.player2
+        if winner is not None:
             loser = self.game.player2 if winner == self.game.player1 else self.game.player1
             GameStats(winner.id).add_win()
             GameStats(loser.id).add_loss()
@@ -224,8 +378,9 @@ class Connect4_3DView(discord.ui.View):
             GameStats(self.game.player2.id).add_draw()
         
         # 最終盤面の表示
+        board, files = await self.game.render_board()
         final_display = (
-            f"{self.game.get_board_display()}\n"
+            f"{board}\n"
             f"{result}\n\n"
             f"{self.game.get_game_summary()}\n\n"
             f"🏆 {self.game.player1.mention} の戦績:\n"
@@ -236,30 +391,57 @@ class Connect4_3DView(discord.ui.View):
         
         # ボタンを無効化して表示を更新
         self.clear_items()
-        await interaction.response.edit_message(content=final_display, view=None)
+        if interaction is not None:
+            await interaction.response.edit_message(content=final_display, attachments=files, view=None)
+        else:
+            await self.message.edit(content=final_display, attachments=files, view=None)
         
         # プレイヤーの解放
-        channel_id = interaction.channel.id
+        channel_id = self.message.channel.id if interaction is None else interaction.channel.id
         player_ids = [self.game.player1.id, self.game.player2.id]
         await connect4_3d_bot.on_game_end(channel_id, player_ids)
 
     def update_buttons(self):
-        """ボタンの状態を更新"""
+        """ボタンの状態を更新（4×4×4は列ごとのボタン、それより大きい盤面はセレクトメニュー）"""
+        if self.game.config.columns > MAX_BUTTON_COLUMNS:
+            self.update_select()
+            return
+
         # x座標選択ボタン
-        for x in range(4):
-            for y in range(4):
+        for x in range(self.game.size):
+            for y in range(self.game.size):
                 # その列が満杯かどうかチェック
-                is_full = self.game.board[0][y][x] != EMPTY
+                is_full = self.game.is_column_full(x, y)
                 button = discord.ui.Button(
                     label=f"({x+1}, {y+1})",
                     style=discord.ButtonStyle.primary if not is_full else discord.ButtonStyle.secondary,
-                    disabled=is_full or self.game.is_finished,
+                    disabled=is_full or self.game.is_finished or self.cpu_thinking,
                     custom_id=f"pos_{x}_{y}",
                     row=y  # y座標ごとに行を分ける
                 )
                 button.callback = self.make_move
                 self.add_item(button)
 
+    def update_select(self):
+        """空いている列をセレクトメニューの選択肢にする（5×5×5でも25列で上限に収まる）"""
+        size = self.game.size
+        options = [
+            discord.SelectOption(label=f"({x+1}, {y+1})", value=f"{x}_{y}",
+                                 description=f"残り {size - self.game.heights[x + size * y]} 段")
+            for y in range(size)
+            for x in range(size)
+            if not self.game.is_column_full(x, y)
+        ][:MAX_SELECT_OPTIONS]
+        select = discord.ui.Select(
+            placeholder="駒を落とす位置 (x, y) を選択",
+            options=options or [discord.SelectOption(label="-", value="-")],
+            disabled=not options or self.game.is_finished or self.cpu_thinking,
+            custom_id="pos_select",
+            row=0
+        )
+        select.callback = self.make_move
+        self.add_item(select)
+
     async def make_move(self, interaction: discord.Interaction):
         """ボタンが押されたときの処理"""
         try:
@@ -269,43 +451,92 @@ class Connect4_3DView(discord.ui.View):
                 return
 
             # 座標の取得と手の実行
-            x, y = map(int, interaction.custom_id.split("_")[1:])
+            if interaction.custom_id == "pos_select":
+                x, y = map(int, interaction.data["values"][0].split("_"))
+            else:
+                x, y = map(int, interaction.custom_id.split("_")[1:])
             if not self.game.make_move(x, y):
                 await interaction.response.send_message(ERROR_MESSAGES["invalid_position"], ephemeral=True)
                 return
 
             # 勝敗チェック
-            winner = self.game.check_winner()
-            if winner is not None:
-                self.game.is_finished = True
-                if winner:
-                    result = f"🎉 {winner.mention} の勝利！"
-                else:
-                    result = "😅 引き分けです！"
-                await self.end_game(interaction, result)
-            else:
-                # プレイヤーの交代
-                self.game.current_player = self.game.player2 if self.game.current_player == self.game.player1 else self.game.player1
-                
-                # ビューの更新
-                self.clear_items()
-                self.update_buttons()
-                await interaction.response.edit_message(content=self.game.get_board_display(), view=self)
+            if await self.finish_if_over(interaction):
+                return
+
+            # プレイヤーの交代
+            self.game.current_player = self.game.player2 if self.game.current_player == self.game.player1 else self.game.player1
+            if self.cpu_strength:
+                self.cpu_thinking = True
+
+            # ビューの更新
+            self.refresh_items()
+            content, files = await self.game.render_board()
+            if self.cpu_thinking:
+                content += "\n🤖 CPUが考え中..."
+            await interaction.response.edit_message(content=content, attachments=files, view=self)
+
+            if self.cpu_thinking:
+                await self.play_cpu_turn()
 
         except Exception as e:
-            await interaction.response.send_message(
-                f"エラーが発生しました: {str(e)}\n"
-                "もう一度お試しください。",
-                ephemeral=True
-            )
+            error_msg = f"エラーが発生しました: {str(e)}\nもう一度お試しください。"
+            # CPUの手番中なら応答済みなので followup で送る
+            if not interaction.response.is_done():
+                await interaction.response.send_message(error_msg, ephemeral=True)
+            else:
+                await interaction.followup.send(error_msg, ephemeral=True)
             print(f"Error in make_move: {e}")  # エラーログ
 
+    def refresh_items(self):
+        """盤面に合わせてボタンを作り直す"""
+        self.clear_items()
+        self.update_buttons()
+        self.add_item(SurrenderButton())
+
+    async def finish_if_over(self, interaction: Optional[discord.Interaction]) -> bool:
+        """直前の手で勝敗が決まっていればゲームを終了する"""
+        winner = self.game.check_winner()
+        if winner is None and not self.game.is_full():
+            return False
+        self.game.is_finished = True
+        if winner:
+            result = f"🎉 {winner.mention} の勝利！"
+        else:
+            result = "😅 引き分けです！"
+        await self.end_game(interaction, result, winner)
+        return True
+
+    async def play_cpu_turn(self):
+        """CPUの手をプロセスプールで探索し、盤面に反映する"""
+        from connect4_3d_ai import request_move
+
+        player_index = 0 if self.game.current_player == self.game.player1 else 1
+        move = await request_move(self.game.bitboards, self.game.heights, player_index, self.cpu_strength)
+        self.cpu_thinking = False
+        if self.game.is_finished:
+            return  # 考えている間に投了・タイムアウトした
+
+        self.game.make_move(move["x"], move["y"])
+        if await self.finish_if_over(None):
+            return
+
+        self.game.current_player = self.game.player1 if player_index == 1 else self.game.player2
+        self.refresh_items()
+        board, files = await self.game.render_board()
+        await self.message.edit(
+            content=f"{board}\n🤖 CPU: ({move['x'] + 1}, {move['y'] + 1}) に置きました",
+            attachments=files,
+            view=self
+        )
+
     async def on_timeout(self):
         """タイムアウト時の処理"""
         if not self.game.is_finished and self.message:
             self.game.is_finished = True
+            board, files = await self.game.render_board()
             await self.message.edit(
-                content=f"{self.game.get_board_display()}\n⏰ タイムアウトしました。ゲームを終了します。",
+                content=f"{board}\n⏰ タイムアウトしました。ゲームを終了します。",
+                attachments=files,
                 view=None
             )
             # プレイヤーの解放
@@ -314,9 +545,10 @@ class Connect4_3DView(discord.ui.View):
             await connect4_3d_bot.on_game_end(channel_id, player_ids)
 
 class JoinButton(discord.ui.Button):
-    def __init__(self):
+    def __init__(self, size: str = "4x4x4"):
         super().__init__(label="参加する", style=discord.ButtonStyle.primary)
         self.players = []
+        self.size = size
 
     async def callback(self, interaction: discord.Interaction):
         try:
@@ -337,7 +569,7 @@ class JoinButton(discord.ui.Button):
 
             if len(self.players) == 2:
                 # ゲームの作成と開始
-                game = Connect4_3DGame(self.players[0], self.players[1])
+                game = Connect4_3DGame(self.players[0], self.players[1], *CUBE_PRESETS[self.size])
                 view = Connect4_3DView(game)
                 
                 # アクティブゲームに登録
@@ -351,10 +583,12 @@ class JoinButton(discord.ui.Button):
                     await self.view.message.delete()
                 
                 # ゲーム開始メッセージを送信
+                board, files = await game.render_board()
                 message = await interaction.channel.send(
-                    f"🎮 立体コネクトフォーを開始します！\n"
+                    f"🎮 立体コネクトフォー（{game.size}×{game.size}×{game.size} {game.config.connect}目）を開始します！\n"
                     f"{self.players[0].mention} ({RED}) vs {self.players[1].mention} ({YELLOW})\n\n"
-                    f"{game.get_board_display()}",
+                    f"{board}",
+                    files=files,
                     view=view
                 )
                 view.message = message
@@ -369,9 +603,9 @@ class JoinButton(discord.ui.Button):
             print(f"Error in JoinButton callback: {e}")
 
 class JoinView(discord.ui.View):
-    def __init__(self):
+    def __init__(self, size: str = "4x4x4"):
         super().__init__(timeout=180)  # 3分でタイムアウト
-        self.add_item(JoinButton())
+        self.add_item(JoinButton(size))
         self.message = None
 
     async def on_timeout(self):
@@ -382,9 +616,18 @@ def setup_connect4_3d(bot: commands.Bot):
     """立体コネクトフォーの機能をbotに設定する"""
     global connect4_3d_bot
     connect4_3d_bot = bot
+
+    # CPU対戦モジュールはこのモジュールの盤面定義を使うため、ここで読み込む
+    from connect4_3d_ai import AI_STRENGTHS
     
     @bot.tree.command(name="立体コネクトフォー", description="立体コネクトフォー（3D四目並べ）を開始します")
-    async def connect4_3d(interaction: discord.Interaction):
+    @app_commands.describe(size="盤面サイズ（一辺の長さ）と並べる数")
+    @app_commands.choices(size=[
+        app_commands.Choice(name="4×4×4 四目（標準）", value="4x4x4"),
+        app_commands.Choice(name="5×5×5 四目", value="5x5x5"),
+        app_commands.Choice(name="5×5×5 五目", value="5x5x5-5"),
+    ])
+    async def connect4_3d(interaction: discord.Interaction, size: str = "4x4x4"):
         """立体コネクトフォーを開始するコマンド"""
         try:
             # 既存のゲームチェック
@@ -393,9 +636,10 @@ def setup_connect4_3d(bot: commands.Bot):
                 return
 
             # 参加ビューの作成と送信
-            view = JoinView()
+            view = JoinView(size)
+            edge, connect = CUBE_PRESETS[size]
             await interaction.response.send_message(
-                "🎮 立体コネクトフォーの参加者を募集します！\n"
+                f"🎮 立体コネクトフォー（{edge}×{edge}×{edge} {connect}目）の参加者を募集します！\n"
                 "2人揃うと開始します。\n"
                 "制限時間: 3分",
                 view=view
@@ -410,6 +654,42 @@ def setup_connect4_3d(bot: commands.Bot):
             )
             print(f"Error in connect4_3d command: {e}")
 
+    @bot.tree.command(name="立体コネクトフォーCPU", description="CPUと立体コネクトフォーで対戦します")
+    @app_commands.describe(strength="CPUの強さ")
+    @app_commands.choices(strength=[
+        app_commands.Choice(name=settings["label"], value=key) for key, settings in AI_STRENGTHS.items()
+    ])
+    async def connect4_3d_cpu(interaction: discord.Interaction, strength: str = "normal"):
+        """CPU対戦を開始するコマンド"""
+        try:
+            # 既存のゲームチェック
+            if interaction.channel.id in active_games and active_games[interaction.channel.id]:
+                await interaction.response.send_message(ERROR_MESSAGES["game_in_progress"], ephemeral=True)
+                return
+
+            # ゲームの作成（CPUは後手 🟡）
+            game = Connect4_3DGame(interaction.user, bot.user)
+            view = Connect4_3DView(game, cpu_strength=strength)
+            active_games.setdefault(interaction.channel.id, set()).add(interaction.user.id)
+
+            board, files = await game.render_board()
+            await interaction.response.send_message(
+                f"🎮 立体コネクトフォー（CPU: {AI_STRENGTHS[strength]['label']}）を開始します！\n"
+                f"{interaction.user.mention} ({RED}) vs 🤖 CPU ({YELLOW})\n\n"
+                f"{board}",
+                files=files,
+                view=view
+            )
+            view.message = await interaction.original_response()
+
+        except Exception as e:
+            await interaction.response.send_message(
+                f"エラーが発生しました: {str(e)}\n"
+                "もう一度お試しください。",
+                ephemeral=True
+            )
+            print(f"Error in connect4_3d_cpu command: {e}")
+
     @bot.tree.command(name="立体コネクトフォー戦績", description="立体コネクトフォーの戦績を表示します")
     async def connect4_3d_stats(interaction: discord.Interaction, target: Optional[discord.User] = None):
         """戦績表示コマンド"""
@@ -429,4 +709,121 @@ def setup_connect4_3d(bot: commands.Bot):
             if not active_games[channel_id]:
                 del active_games[channel_id]
 
-    return bot 
\ No newline at end of file
+    return bot 
+
+
+# テスト
+def find_winner_brute_force(game: Connect4_3DGame) -> Optional[str]:
+    """描画用の絵文字を全始点×全方向で総当たりする（検証用）"""
+    size, connect = game.size, game.config.connect
+    board = [[[game.get_cell(x, y, z) for x in range(size)] for y in range(size)] for z in range(size)]
+    for x in range(size):
+        for y in range(size):
+            for z in range(size):
+                piece = board[z][y][x]
+                if piece == EMPTY:
+                    continue
+                for dx in (-1, 0, 1):
+                    for dy in (-1, 0, 1):
+                        for dz in (-1, 0, 1):
+                            if (dx, dy, dz) == (0, 0, 0):
+                                continue
+                            cells = [(x + dx * i, y + dy * i, z + dz * i) for i in range(connect)]
+                            if all(0 <= c < size for cell in cells for c in cell) and all(
+                                board[cz][cy][cx] == piece for cx, cy, cz in cells
+                            ):
+                                return piece
+    return None
+
+def _random_player_pair():
+    class _Player:
+        def __init__(self, uid: int):
+            self.id = uid
+            self.mention = f"<@{uid}>"
+    return _Player(1), _Player(2)
+
+def _open_columns(game: Connect4_3DGame) -> List[Tuple[int, int]]:
+    return [(x, y) for x in range(game.size) for y in range(game.size) if not game.is_column_full(x, y)]
+
+def test_line_index(games: int = 100):
+    # 1. ライン数とマスごとの所属数（標準盤）
+    assert len(WIN_LINES) == 76
+    assert len(set(WIN_LINES)) == 76
+    assert sorted({len(lines) for lines in CELL_LINES}) == [4, 7]
+    assert sum(len(lines) == 7 for lines in CELL_LINES) == 16
+
+    # 2. 各サイズのライン数が理論値と一致し、表が1度だけ生成されること
+    for size, connect in CUBE_PRESETS.values():
+        config = get_cube_config(size, connect)
+        assert config is get_cube_config(size, connect)
+        assert len(config.win_lines) == len(set(config.win_lines)) == count_win_lines(size, connect)
+        assert all(len(line) == connect for line in config.win_lines)
+        assert sum(map(len, config.cell_lines)) == connect * len(config.win_lines)
+    assert [count_win_lines(*preset) for preset in CUBE_PRESETS.values()] == [76, 302, 109]
+
+    # 3. ランダム対局で、毎手の判定が総当たりと一致すること
+    player1, player2 = _random_player_pair()
+    for size, connect in CUBE_PRESETS.values():
+        for _ in range(games):
+            game = Connect4_3DGame(player1, player2, size, connect)
+            while True:
+                game.make_move(*random.choice(_open_columns(game)))
+                winner = game.check_winner()
+                expected = find_winner_brute_force(game)
+                assert (winner is not None) == (expected is not None)
+                assert game.bitboards[0] & game.bitboards[1] == 0
+                assert game.is_full() == (len(game.moves) == game.config.cells)
+                if winner is not None or game.is_full():
+                    break
+                game.current_player = player2 if game.current_player == player1 else player1
+
+
+# ベンチマーク
+def benchmark_check_winner(moves: int = 5000) -> Dict[str, Dict[str, float]]:
+    """サイズごとの1手あたりの時間（マイクロ秒）: 総当たり判定 vs ビットボード判定、着手+判定"""
+    player1, player2 = _random_player_pair()
+    results = {}
+    for preset, (size, connect) in CUBE_PRESETS.items():
+        positions = []
+        while len(positions) < 100:
+            game = Connect4_3DGame(player1, player2, size, connect)
+            for _ in range(random.randint(1, game.config.cells * 5 // 8)):
+                game.make_move(*random.choice(_open_columns(game)))
+                if game.check_winner() is not None:
+                    break
+                game.current_player = player2 if game.current_player == player1 else player1
+            positions.append(game)
+
+        start = time.perf_counter()
+        for i in range(moves):
+            find_winner_brute_force(positions[i % 100])
+        brute_force = (time.perf_counter() - start) / moves * 1e6
+
+        start = time.perf_counter()
+        for i in range(moves):
+            positions[i % 100].check_winner()
+        bitboard = (time.perf_counter() - start) / moves * 1e6
+
+        # 1局を最後まで打って、着手と勝敗判定を合わせた1手の時間
+        played = 0
+        start = time.perf_counter()
+        while played < moves:
+            game = Connect4_3DGame(player1, player2, size, connect)
+            columns = [(x, y) for x in range(size) for y in range(size)]
+            random.shuffle(columns)
+            while not game.is_finished:
+                x, y = next((x, y) for x, y in columns if not game.is_column_full(x, y))
+                columns.append(columns.pop(0))
+                game.make_move(x, y)
+                played += 1
+                if game.check_winner() is not None or game.is_full():
+                    break
+        per_move = (time.perf_counter() - start) / played * 1e6
+
+        results[preset] = {
+            "lines": len(game.config.win_lines),
+            "brute_force_us": brute_force,
+            "bitboard_us": bitboard,
+            "move_us": per_move,
+        }
+    return results
@@ -0,0 +1,397 @@
+# connect4_3d_ai.py
+# 立体コネクトフォーのCPU対戦相手（αβ探索 + 76ラインの脅威評価）
+
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from operator import xor
+
+from connect4_3d import (
+    CELL_LINES, CELL_LINE_MASKS, INVERSE_SYMMETRY, LINE_MASKS, SYMMETRY_COLUMNS, ZOBRIST_SYMMETRIC,
+    cell_index, compute_hash_keys,
+)
+
+# 強さごとの探索設定（最大深さ・1手あたりの持ち時間・評価値に加える揺らぎ）
+AI_STRENGTHS = {
+    "easy": {"label": "弱い", "depth": 1, "time_limit": 0.3, "noise": 60},
+    "normal": {"label": "普通", "depth": 4, "time_limit": 1.0, "noise": 0},
+    "hard": {"label": "強い", "depth": 64, "time_limit": 3.0, "noise": 0},
+}
+
+WIN_SCORE = 1_000_000
+# ライン上の自分の駒数ごとの評価（相手の駒が混ざったラインは0）
+LINE_WEIGHTS = (0, 1, 8, 64, 0)
+PLAYABLE_THREAT_BONUS = 256  # 次の一手で完成するリーチ
+
+# 列 (x + 4y) の高さ h に置いたときのマス番号
+COLUMN_CELLS = [[cell_index(col % 4, col // 4, 3 - h) for h in range(4)] for col in range(16)]
+# 各マスの列番号と、そのマスに駒が置ける高さ
+CELL_COLUMN = [cell % 16 for cell in range(64)]
+CELL_HEIGHT = [3 - cell // 16 for cell in range(64)]
+# 通るライン数の多い列（角と中央の4本）から調べる
+COLUMN_ORDER = sorted(range(16), key=lambda col: -len(CELL_LINES[COLUMN_CELLS[col][0]]))
+
+# 置換表の評価値の種類
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+MATE_THRESHOLD = WIN_SCORE - 64  # これ以上の評価値は「○手で勝ち」を表す
+
+class TranspositionTable:
+    """
+    固定サイズの置換表（正規化ハッシュの下位ビットで索引）
+    置換方針: 同じ局面・前回以前の探索の残り・より深い探索結果 のいずれかなら上書きする
+    """
+
+    def __init__(self, size_bits: int = 18):
+        size = 1 << size_bits
+        self.mask = size - 1
+        self.keys = [0] * size
+        self.depths = [-1] * size
+        self.values = [0] * size
+        self.flags = [EXACT] * size
+        self.moves = [-1] * size  # 正規化した盤面での最善の列
+        self.ages = [0] * size
+        self.age = 0
+
+    def new_search(self):
+        """探索ごとに世代を進め、古い結果を優先的に置き換えられるようにする"""
+        self.age = (self.age + 1) & 0xFF
+
+    def probe(self, key: int) -> Optional[Tuple[int, int, int, int]]:
+        index = key & self.mask
+        if self.keys[index] != key:
+            return None
+        return self.depths[index], self.values[index], self.flags[index], self.moves[index]
+
+    def store(self, key: int, depth: int, value: int, flag: int, move: int):
+        index = key & self.mask
+        if self.keys[index] == key or self.ages[index] != self.age or depth >= self.depths[index]:
+            self.keys[index] = key
+            self.depths[index] = depth
+            self.values[index] = value
+            self.flags[index] = flag
+            self.moves[index] = move
+            self.ages[index] = self.age
+
+# 解析とCPU対戦で共有する置換表（プロセスプールの各ワーカーに1つずつ）
+# 評価にノイズを入れる強さ（easy）の値は他の探索に混ぜないよう、この表を使わない
+SHARED_TABLE = TranspositionTable()
+
+class _SearchTimeout(Exception):
+    """持ち時間切れで探索を打ち切る"""
+    pass
+
+class AlphaBetaSearch:
+    """手番側から見た negamax 形式のαβ探索"""
+
+    def __init__(self, time_limit: float, noise: int = 0,
+                 table: Optional[TranspositionTable] = None, use_symmetry: bool = True):
+        self.deadline = time.perf_counter() + time_limit
+        self.noise = noise
+        self.table = table
+        self.use_symmetry = use_symmetry
+        self.nodes = 0
+
+    def evaluate(self, me: int, opp: int, heights: List[int]) -> int:
+        """76本のラインについて、相手の駒を含まないラインの駒数で評価する"""
+        score = 0
+        for mask in LINE_MASKS:
+            mine = me & mask
+            theirs = opp & mask
+            if mine and theirs:
+                continue
+            if mine:
+                count = mine.bit_count()
+                score += LINE_WEIGHTS[count]
+                if count == 3 and self._is_playable(mask & ~mine, heights):
+                    score += PLAYABLE_THREAT_BONUS
+            elif theirs:
+                count = theirs.bit_count()
+                score -= LINE_WEIGHTS[count]
+                if count == 3 and self._is_playable(mask & ~theirs, heights):
+                    score -= PLAYABLE_THREAT_BONUS
+        if self.noise:
+            score += random.randint(-self.noise, self.noise)
+        return score
+
+    @staticmethod
+    def _is_playable(bit: int, heights: List[int]) -> bool:
+        cell = bit.bit_length() - 1
+        return heights[CELL_COLUMN[cell]] == CELL_HEIGHT[cell]
+
+    @staticmethod
+    def is_winning_cell(bitboard: int, cell: int) -> bool:
+        for mask in CELL_LINE_MASKS[cell]:
+            if bitboard & mask == mask:
+                return True
+        return False
+
+    def ordered_moves(self, me: int, opp: int, heights: List[int], first: int = -1) -> List[int]:
+        """勝ち手 → 相手の勝ちを防ぐ手 → 置換表の最善手 → ライン数の多い列 の順に並べる"""
+        wins, blocks, others = [], [], []
+        for col in COLUMN_ORDER:
+            height = heights[col]
+            if height == 4:
+                continue
+            cell = COLUMN_CELLS[col][height]
+            bit = 1 << cell
+            if self.is_winning_cell(me | bit, cell):
+                wins.append(col)
+            elif self.is_winning_cell(opp | bit, cell):
+                blocks.append(col)
+            elif col == first:
+                others.insert(0, col)
+            else:
+                others.append(col)
+        return wins + blocks + others
+
+    def _table_key(self, keys: Tuple[int, ...]) -> Tuple[int, int]:
+        """(置換表のキー, そのキーを与える対称変換) を返す"""
+        if not self.use_symmetry:
+            return keys[0], 0
+        key = min(keys)
+        return key, keys.index(key)
+
+    def negamax(self, me: int, opp: int, heights: List[int], depth: int,
+                alpha: int, beta: int, ply: int, keys: Tuple[int, ...], color: int) -> int:
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and time.perf_counter() > self.deadline:
+            raise _SearchTimeout()
+
+        table_move = -1
+        if self.table is not None and depth > 0:
+            key, symmetry = self._table_key(keys)
+            entry = self.table.probe(key)
+            if entry is not None:
+                entry_depth, value, flag, move = entry
+                if move >= 0:
+                    table_move = SYMMETRY_COLUMNS[INVERSE_SYMMETRY[symmetry]][move]
+                if entry_depth >= depth:
+                    # 勝ち負けの手数はこの局面からの距離で保存している
+                    if value > MATE_THRESHOLD:
+                        value -= ply
+                    elif value < -MATE_THRESHOLD:
+                        value += ply
+                    if flag == EXACT:
+                        return value
+                    if flag == LOWER_BOUND and value > alpha:
+                        alpha = value
+                    elif flag == UPPER_BOUND and value < beta:
+                        beta = value
+                    if alpha >= beta:
+                        return value
+
+        moves = self.ordered_moves(me, opp, heights, table_move)
+        if not moves:
+            return 0  # 引き分け
+        if depth == 0:
+            return self.evaluate(me, opp, heights)
+
+        alpha_original = alpha
+        best = -WIN_SCORE
+        best_move = moves[0]
+        for col in moves:
+            cell = COLUMN_CELLS[col][heights[col]]
+            placed = me | (1 << cell)
+            if self.is_winning_cell(placed, cell):
+                best, best_move = WIN_SCORE - ply, col
+                break
+            heights[col] += 1
+            child_keys = tuple(map(xor, keys, ZOBRIST_SYMMETRIC[color][cell]))
+            score = -self.negamax(opp, placed, heights, depth - 1, -beta, -alpha, ply + 1,
+                                  child_keys, 1 - color)
+            heights[col] -= 1
+            if score > best:
+                best, best_move = score, col
+            if best > alpha:
+                alpha = best
+            if alpha >= beta:
+                break
+
+        if self.table is not None:
+            if best <= alpha_original:
+                flag = UPPER_BOUND
+            elif best >= beta:
+                flag = LOWER_BOUND
+            else:
+                flag = EXACT
+            stored = best + ply if best > MATE_THRESHOLD else best - ply if best < -MATE_THRESHOLD else best
+            self.table.store(key, depth, stored, flag, SYMMETRY_COLUMNS[symmetry][best_move])
+        return best
+
+    def search_root(self, me: int, opp: int, heights: List[int], depth: int,
+                    keys: Tuple[int, ...], color: int, moves: List[int],
+                    exact: bool = False) -> Dict[int, int]:
+        """
+        ルートの各手を深さ depth で評価し、{列: 評価値} を返す
+        exact=False では最善手以外の評価値は上限値になる（枝刈りのため）
+        """
+        scores = {}
+        alpha = -WIN_SCORE - 1
+        for col in moves:
+            cell = COLUMN_CELLS[col][heights[col]]
+            placed = me | (1 << cell)
+            if self.is_winning_cell(placed, cell):
+                scores[col] = WIN_SCORE
+                break
+            heights[col] += 1
+            try:
+                child_keys = tuple(map(xor, keys, ZOBRIST_SYMMETRIC[color][cell]))
+                beta = WIN_SCORE + 1 if exact else -alpha
+                score = -self.negamax(opp, placed, heights, depth - 1, -WIN_SCORE - 1, beta, 1,
+                                      child_keys, 1 - color)
+            finally:
+                heights[col] -= 1
+            scores[col] = score
+            if score > alpha:
+                alpha = score
+        return scores
+
+    def search(self, me: int, opp: int, heights: List[int], max_depth: int,
+               color: int = 0) -> Tuple[int, int, int]:
+        """反復深化で探索し、(最善の列, 評価値, 完了した深さ) を返す"""
+        if self.table is not None:
+            self.table.new_search()
+        bitboards = (me, opp) if color == 0 else (opp, me)
+        keys = compute_hash_keys(bitboards)
+        moves = self.ordered_moves(me, opp, heights)
+        best_move, best_score, completed = moves[0], 0, 0
+        for depth in range(1, max_depth + 1):
+            try:
+                scores = self.search_root(me, opp, heights, depth, keys, color, moves)
+            except _SearchTimeout:
+                break
+            depth_best = max(scores, key=scores.get)
+            best_move, best_score, completed = depth_best, scores[depth_best], depth
+            # 前回の最善手から調べると枝刈りが効きやすい
+            moves.remove(depth_best)
+            moves.insert(0, depth_best)
+            if abs(best_score) >= MATE_THRESHOLD:
+                break  # 勝ち（負け）が読み切れた
+        return best_move, best_score, completed
+
+def choose_move(bitboards: Tuple[int, int], heights: Tuple[int, ...], player_index: int,
+                strength: str = "normal") -> Dict[str, float]:
+    """
+    プロセスプール上で実行される探索の入口
+    戻り値: {"x", "y", "score", "depth", "nodes", "seconds"}
+    """
+    settings = AI_STRENGTHS[strength]
+    me, opp = bitboards[player_index], bitboards[1 - player_index]
+    table = None if settings["noise"] else SHARED_TABLE
+    search = AlphaBetaSearch(settings["time_limit"], settings["noise"], table)
+    started = time.perf_counter()
+    column, score, depth = search.search(me, opp, list(heights), settings["depth"], player_index)
+    return {
+        "x": column % 4,
+        "y": column // 4,
+        "score": score,
+        "depth": depth,
+        "nodes": search.nodes,
+        "seconds": time.perf_counter() - started,
+    }
+
+def analyze_position(bitboards: Tuple[int, int], heights: Tuple[int, ...], player_index: int,
+                     depth: int = 4, time_limit: float = 2.0) -> Dict[Tuple[int, int], int]:
+    """
+    局面解析: 置ける全ての列を深さ depth で評価する（CPU対戦と置換表を共有）
+    戻り値: {(x, y): 手番側から見た評価値}
+    """
+    me, opp = bitboards[player_index], bitboards[1 - player_index]
+    search = AlphaBetaSearch(time_limit, table=SHARED_TABLE)
+    SHARED_TABLE.new_search()
+    work_heights = list(heights)
+    moves = search.ordered_moves(me, opp, work_heights)
+    try:
+        scores = search.search_root(me, opp, work_heights, depth, compute_hash_keys(tuple(bitboards)),
+                                    player_index, moves, exact=True)
+    except _SearchTimeout:
+        return {}
+    return {(col % 4, col // 4): score for col, score in scores.items()}
+
+# プロセスプール（複数のCPU対戦が同時に進んでもイベントループを止めない）
+_executor: Optional[ProcessPoolExecutor] = None
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) - 1))
+    return _executor
+
+async def request_move(bitboards: Tuple[int, int], heights: Tuple[int, ...], player_index: int,
+                       strength: str = "normal") -> Dict[str, float]:
+    """CPUの手をプロセスプールで計算する"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), choose_move, tuple(bitboards), tuple(heights), player_index, strength
+    )
+
+# ベンチマーク: ランダムプレイヤーとの対戦
+def _random_move(heights: List[int]) -> int:
+    return random.choice([col for col in range(16) if heights[col] < 4])
+
+def benchmark_vs_random(strength: str = "normal", games: int = 20) -> Dict[str, float]:
+    """CPUとランダムプレイヤーを先後交互に対戦させ、勝率と探索速度を返す"""
+    wins = draws = 0
+    total_nodes = 0
+    total_seconds = 0.0
+    for game_no in range(games):
+        bitboards = [0, 0]
+        heights = [0] * 16
+        ai_index = game_no % 2
+        turn = 0
+        winner = None
+        for _ in range(64):
+            if turn == ai_index:
+                result = choose_move(tuple(bitboards), tuple(heights), turn, strength)
+                total_nodes += result["nodes"]
+                total_seconds += result["seconds"]
+                col = int(result["x"] + 4 * result["y"])
+            else:
+                col = _random_move(heights)
+            cell = COLUMN_CELLS[col][heights[col]]
+            heights[col] += 1
+            bitboards[turn] |= 1 << cell
+            if AlphaBetaSearch.is_winning_cell(bitboards[turn], cell):
+                winner = turn
+                break
+            turn = 1 - turn
+        if winner == ai_index:
+            wins += 1
+        elif winner is None:
+            draws += 1
+    return {
+        "win_rate": wins / games,
+        "draw_rate": draws / games,
+        "nodes_per_second": total_nodes / max(total_seconds, 1e-9),
+    }
+
+def benchmark_transposition(depth: int = 5, positions: int = 6) -> Dict[str, int]:
+    """固定深さ探索のノード数を 置換表なし / 置換表のみ / 置換表+対称性 で比較する"""
+    rng = random.Random(7)
+    samples = [((0, 0), [0] * 16, 0)]  # 初期局面を含める
+    while len(samples) < positions:
+        bitboards, heights, turn = [0, 0], [0] * 16, 0
+        for _ in range(rng.randint(2, 8)):
+            col = rng.choice([c for c in range(16) if heights[c] < 4])
+            bitboards[turn] |= 1 << COLUMN_CELLS[col][heights[col]]
+            heights[col] += 1
+            turn = 1 - turn
+        samples.append((tuple(bitboards), heights, turn))
+
+    results = {}
+    for name, table, use_symmetry in (
+        ("no_table", None, False),
+        ("table", TranspositionTable(), False),
+        ("table_symmetry", TranspositionTable(), True),
+    ):
+        nodes = 0
+        for bitboards, heights, turn in samples:
+            search = AlphaBetaSearch(3600, table=table, use_symmetry=use_symmetry)
+            search.search(bitboards[turn], bitboards[1 - turn], list(heights), depth, turn)
+            nodes += search.nodes
+        results[name] = nodes
+    return results
@@ -2,8 +2,14 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import asyncio
-from typing import List, Optional, Dict, Set
+import io
+import random
+import time
+from typing import List, Optional, Dict, Set, Tuple
 from datetime import datetime
+from functools import lru_cache
+
+from board_renderer import render_connectfour_png
 
 # グローバル変数の定義
 connectfour_bot = None
@@ -12,7 +18,20 @@ connectfour_bot = None
 EMPTY = "⚪"  # 空きマス
 RED = "🔴"    # プレイヤー1
 YELLOW = "🟡" # プレイヤー2
-NUMBERS = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣"]  # 列番号
+NUMBERS = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]  # 列番号
+
+# Discordのコンポーネント上限（1行5個 × 5行 = 25個）
+MAX_BUTTONS_PER_ROW = 5
+MAX_BUTTON_ROWS = 5
+
+# 選択可能な盤面サイズ {名前: (行数, 列数, 並べる数)}
+BOARD_PRESETS = {
+    "6x7": (6, 7, 4),    # 標準
+    "7x8": (7, 8, 4),
+    "9x7": (9, 7, 4),
+    "7x9": (7, 9, 5),    # 五目
+    "9x10": (9, 10, 5),  # 五目（大盤）
+}
 
 # エラーメッセージの定数
 ERROR_MESSAGES = {
@@ -60,9 +79,59 @@ class GameStats:
             f"📊 勝率: {self.stats['wins'] / max(1, self.stats['total_games']):.1%}"
         )
 
+# =============================
+# 盤面サイズ可変のビットボードエンジン
+# =============================
+# ビット配置: 列ごとに (行数 + 1) ビットを使い、最上位の1ビットは番兵として空けておく。
+# 列 c の下から r 行目は bit (c * (rows + 1) + r)。番兵があるので列をまたぐ誤判定が起きない。
+class BoardConfig:
+    """盤面サイズごとのマスクと勝利判定用シフト表（サイズごとに1度だけ生成）"""
+
+    def __init__(self, rows: int, cols: int, connect: int):
+        self.rows = rows
+        self.cols = cols
+        self.connect = connect
+        self.height = rows + 1  # 番兵ビットを含む1列の高さ
+        column = (1 << rows) - 1
+        self.bottom_mask = sum(1 << (c * self.height) for c in range(cols))
+        self.board_mask = self.bottom_mask * column
+        self.column_masks = [column << (c * self.height) for c in range(cols)]
+        self.top_masks = [1 << (c * self.height + rows - 1) for c in range(cols)]
+        # 縦・横・右上がり・右下がりの4方向について、connect-1 個分のシフト量
+        self.win_shifts = tuple(
+            tuple(step * i for i in range(1, connect))
+            for step in (1, self.height, self.height + 1, self.height - 1)
+        )
+        # ボタンは1行5個まで。投了ボタン用に1行残す
+        self.button_rows = (cols + MAX_BUTTONS_PER_ROW - 1) // MAX_BUTTONS_PER_ROW
+
+    def has_won(self, bitboard: int) -> bool:
+        """bitboard に connect 個以上の並びがあるか（盤面サイズに依存しない定数回の演算）"""
+        for shifts in self.win_shifts:
+            line = bitboard
+            for shift in shifts:
+                line &= bitboard >> shift
+            if line:
+                return True
+        return False
+
+@lru_cache(maxsize=None)
+def get_board_config(rows: int, cols: int, connect: int) -> BoardConfig:
+    """盤面設定を生成してキャッシュする"""
+    if not 1 <= cols <= len(NUMBERS):
+        raise ValueError(f"列数は1〜{len(NUMBERS)}で指定してください")
+    if cols > MAX_BUTTONS_PER_ROW * (MAX_BUTTON_ROWS - 1):
+        raise ValueError("列ボタンがDiscordのコンポーネント上限を超えます")
+    if not 2 <= connect <= max(rows, cols):
+        raise ValueError("並べる数が盤面サイズに対して不正です")
+    return BoardConfig(rows, cols, connect)
+
 class ConnectFourGame:
-    def __init__(self, player1: discord.User, player2: discord.User):
-        self.board = [[EMPTY for _ in range(7)] for _ in range(6)]
+    def __init__(self, player1: discord.User, player2: discord.User,
+                 rows: int = 6, cols: int = 7, connect: int = 4):
+        self.config = get_board_config(rows, cols, connect)
+        self.bitboards = [0, 0]  # [🔴, 🟡] それぞれの駒の位置
+        self.heights = [c * self.config.height for c in range(cols)]  # 各列の次に置くビット位置
         self.player1 = player1  # 🔴
         self.player2 = player2  # 🟡
         self.current_player = player1
@@ -71,79 +140,66 @@ class ConnectFourGame:
         self.start_time = datetime.now()
         self.moves = []  # 手の履歴
 
+    def is_column_full(self, column: int) -> bool:
+        """列が満杯かどうか"""
+        return bool((self.bitboards[0] | self.bitboards[1]) & self.config.top_masks[column])
+
+    def is_full(self) -> bool:
+        """盤面が全て埋まっているかどうか"""
+        return (self.bitboards[0] | self.bitboards[1]) == self.config.board_mask
+
     def make_move(self, column: int) -> bool:
         """
         指定された列に駒を配置する
         戻り値: 配置成功したかどうか
         """
-        if not 0 <= column < 7:
+        if not 0 <= column < self.config.cols or self.is_column_full(column):
             return False
 
-        # 一番下の空きマスを探す
-        for row in range(5, -1, -1):
-            if self.board[row][column] == EMPTY:
-                self.board[row][column] = RED if self.current_player == self.player1 else YELLOW
-                self.moves.append((self.current_player.id, column))
-                return True
-        return False
+        index = 0 if self.current_player == self.player1 else 1
+        self.bitboards[index] |= 1 << self.heights[column]
+        self.heights[column] += 1
+        self.moves.append((self.current_player.id, column))
+        return True
 
     def check_winner(self) -> Optional[discord.User]:
         """
         勝者をチェックする
-        戻り値: 勝者のUser、引き分けはNone
+        戻り値: 勝者のUser、勝者がいなければNone（引き分けは is_full で判定）
         """
-        # 横方向のチェック
-        for row in range(6):
-            for col in range(4):
-                if (self.board[row][col] != EMPTY and
-                    self.board[row][col] == self.board[row][col+1] == 
-                    self.board[row][col+2] == self.board[row][col+3]):
-                    return self.player1 if self.board[row][col] == RED else self.player2
-
-        # 縦方向のチェック
-        for row in range(3):
-            for col in range(7):
-                if (self.board[row][col] != EMPTY and
-                    self.board[row][col] == self.board[row+1][col] == 
-                    self.board[row+2][col] == self.board[row+3][col]):
-                    return self.player1 if self.board[row][col] == RED else self.player2
-
-        # 斜め方向（右上がり）のチェック
-        for row in range(3, 6):
-            for col in range(4):
-                if (self.board[row][col] != EMPTY and
-                    self.board[row][col] == self.board[row-1][col+1] == 
-                    self.board[row-2][col+2] == self.board[row-3][col+3]):
-                    return self.player1 if self.board[row][col] == RED else self.player2
-
-        # 斜め方向（右下がり）のチェック
-        for row in range(3):
-            for col in range(4):
-                if (self.board[row][col] != EMPTY and
-                    self.board[row][col] == self.board[row+1][col+1] == 
-                    self.board[row+2][col+2] == self.board[row+3][col+3]):
-                    return self.player1 if self.board[row][col] == RED else self.player2
-
-        # 引き分けチェック
-        if all(self.board[0][col] != EMPTY for col in range(7)):
-            return None
-
+        if self.config.has_won(self.bitboards[0]):
+            return self.player1
+        if self.config.has_won(self.bitboards[1]):
+            return self.player2
         return None
 
-    def get_board_display(self) -> str:
-        """ゲームボードの文字列表現を返す（視認性向上版）"""
+    def get_cell(self, row: int, column: int) -> str:
+        """上から row 行目・column 列目のマスの絵文字を返す"""
+        bit = 1 << (column * self.config.height + self.config.rows - 1 - row)
+        if self.bitboards[0] & bit:
+            return RED
+        if self.bitboards[1] & bit:
+            return YELLOW
+        return EMPTY
+
+    def get_board_display(self, with_grid: bool = True) -> str:
+        """ゲームボードの文字列表現を返す（with_grid=False は画像表示用に手番と時間のみ）"""
         display = []
+        cols = self.config.cols
+        separator = "  " + "─" * (cols * 2 + 1)
         
-        # 列番号の表示
-        display.append("  " + " ".join(NUMBERS))
-        display.append("  " + "─" * 15)  # 区切り線
-        
-        # ボードの表示
-        for row in self.board:
-            display.append("│ " + " ".join(row) + " │")
-        
-        # 下部の区切り線
-        display.append("  " + "─" * 15)
+        if with_grid:
+            # 列番号の表示
+            display.append("  " + " ".join(NUMBERS[:cols]))
+            display.append(separator)  # 区切り線
+            
+            # ボードの表示
+            for row in range(self.config.rows):
+                cells = (self.get_cell(row, col) for col in range(cols))
+                display.append("│ " + " ".join(cells) + " │")
+            
+            # 下部の区切り線
+            display.append(separator)
         
         # 現在のプレイヤーの表示
         display.append(f"\n手番: {self.current_player.mention}")
@@ -158,10 +214,19 @@ class ConnectFourGame:
             
         return "\n".join(display)
 
+    async def render_board(self) -> Tuple[str, List[discord.File]]:
+        """盤面メッセージの本文と添付画像を返す（Pillowがなければ絵文字の盤面のみ）"""
+        png = await render_connectfour_png(self)
+        if png is None:
+            return self.get_board_display(), []
+        return self.get_board_display(with_grid=False), [discord.File(io.BytesIO(png), filename="board.png")]
+
     def get_game_summary(self) -> str:
         """ゲームの要約を返す"""
+        config = self.config
         return (
             f"🎮 ゲーム結果\n"
+            f"盤面: {config.rows}×{config.cols}（{config.connect}目並べ）\n"
             f"赤 {RED}: {self.player1.mention}\n"
             f"黄 {YELLOW}: {self.player2.mention}\n"
             f"手数: {len(self.moves)}\n"
@@ -169,11 +234,11 @@ class ConnectFourGame:
         )
 
 class SurrenderButton(discord.ui.Button):
-    def __init__(self):
+    def __init__(self, row: int = 4):
         super().__init__(
             label="投了",
             style=discord.ButtonStyle.danger,
-            row=4  # ボードの下に配置
+            row=row  # ボードの下に配置
         )
 
     async def callback(self, interaction: discord.Interaction):
@@ -192,7 +257,7 @@ class ConnectFourView(discord.ui.View):
         self.game = game
         self.message = None
         self.update_buttons()
-        self.add_item(SurrenderButton())  # 投了ボタンを追加
+        self.add_item(SurrenderButton(row=game.config.button_rows))  # 投了ボタンを列ボタンの下に追加
 
     async def end_game(self, interaction: discord.Interaction, result: str):
         """ゲーム終了時の共通処理"""
@@ -209,8 +274,9 @@ class ConnectFourView(discord.ui.View):
             GameStats(self.game.player2.id).add_draw()
         
         # 最終盤面の表示
+        board, files = await self.game.render_board()
         final_display = (
-            f"{self.game.get_board_display()}\n"
+            f"{board}\n"
             f"{result}\n\n"
             f"{self.game.get_game_summary()}\n\n"
             f"🏆 {self.game.player1.mention} の戦績:\n"
@@ -221,7 +287,7 @@ class ConnectFourView(discord.ui.View):
         
         # ボタンを無効化して表示を更新
         self.clear_items()
-        await interaction.response.edit_message(content=final_display, view=None)
+        await interaction.response.edit_message(content=final_display, attachments=files, view=None)
         
         # プレイヤーの解放
         channel_id = interaction.channel.id
@@ -230,15 +296,15 @@ class ConnectFourView(discord.ui.View):
 
     def update_buttons(self):
         """ボタンの状態を更新"""
-        for i in range(7):
+        for i in range(self.game.config.cols):
             # 列が満杯かどうかチェック
-            is_full = self.game.board[0][i] != EMPTY
+            is_full = self.game.is_column_full(i)
             button = discord.ui.Button(
                 label=str(i + 1),
                 style=discord.ButtonStyle.primary if not is_full else discord.ButtonStyle.secondary,
                 disabled=is_full or self.game.is_finished,
                 custom_id=f"column_{i}",
-                row=3  # ボードの下に数字ボタンを配置
+                row=i // MAX_BUTTONS_PER_ROW  # 1行5個ずつ数字ボタンを配置
             )
             button.callback = self.make_move
             self.add_item(button)
@@ -259,7 +325,7 @@ class ConnectFourView(discord.ui.View):
 
             # 勝敗チェック
             winner = self.game.check_winner()
-            if winner is not None:
+            if winner is not None or self.game.is_full():
                 self.game.is_finished = True
                 if winner:
                     result = f"🎉 {winner.mention} の勝利！"
@@ -273,7 +339,9 @@ class ConnectFourView(discord.ui.View):
                 # ビューの更新
                 self.clear_items()
                 self.update_buttons()
-                await interaction.response.edit_message(content=self.game.get_board_display(), view=self)
+                self.add_item(SurrenderButton(row=self.game.config.button_rows))
+                board, files = await self.game.render_board()
+                await interaction.response.edit_message(content=board, attachments=files, view=self)
 
         except Exception as e:
             await interaction.response.send_message(
@@ -287,8 +355,10 @@ class ConnectFourView(discord.ui.View):
         """タイムアウト時の処理"""
         if not self.game.is_finished and self.message:
             self.game.is_finished = True
+            board, files = await self.game.render_board()
             await self.message.edit(
-                content=f"{self.game.get_board_display()}\n⏰ タイムアウトしました。ゲームを終了します。",
+                content=f"{board}\n⏰ タイムアウトしました。ゲームを終了します。",
+                attachments=files,
                 view=None
             )
             # プレイヤーの解放
@@ -297,9 +367,10 @@ class ConnectFourView(discord.ui.View):
             await connectfour_bot.on_game_end(channel_id, player_ids)
 
 class JoinButton(discord.ui.Button):
-    def __init__(self):
+    def __init__(self, size: str = "6x7"):
         super().__init__(label="参加する", style=discord.ButtonStyle.primary)
         self.players = []
+        self.size = size
 
     async def callback(self, interaction: discord.Interaction):
         try:
@@ -320,7 +391,7 @@ class JoinButton(discord.ui.Button):
 
             if len(self.players) == 2:
                 # ゲームの作成と開始
-                game = ConnectFourGame(self.players[0], self.players[1])
+                game = ConnectFourGame(self.players[0], self.players[1], *BOARD_PRESETS[self.size])
                 view = ConnectFourView(game)
                 
                 # アクティブゲームに登録
@@ -334,10 +405,12 @@ class JoinButton(discord.ui.Button):
                     await self.view.message.delete()
                 
                 # ゲーム開始メッセージを送信
+                board, files = await game.render_board()
                 message = await interaction.channel.send(
                     f"🎮 コネクトフォーを開始します！\n"
                     f"{self.players[0].mention} ({RED}) vs {self.players[1].mention} ({YELLOW})\n\n"
-                    f"{game.get_board_display()}",
+                    f"{board}",
+                    files=files,
                     view=view
                 )
                 view.message = message
@@ -352,9 +425,9 @@ class JoinButton(discord.ui.Button):
             print(f"Error in JoinButton callback: {e}")
 
 class JoinView(discord.ui.View):
-    def __init__(self):
+    def __init__(self, size: str = "6x7"):
         super().__init__(timeout=180)  # 3分でタイムアウト
-        self.add_item(JoinButton())
+        self.add_item(JoinButton(size))
         self.message = None
 
     async def on_timeout(self):
@@ -367,7 +440,15 @@ def setup_connectfour(bot: commands.Bot):
     connectfour_bot = bot
     
     @bot.tree.command(name="コネクトフォー", description="コネクトフォー（四目並べ）を開始します")
-    async def connectfour(interaction: discord.Interaction):
+    @app_commands.describe(size="盤面サイズ（行×列）と並べる数")
+    @app_commands.choices(size=[
+        app_commands.Choice(name="6×7 四目（標準）", value="6x7"),
+        app_commands.Choice(name="7×8 四目", value="7x8"),
+        app_commands.Choice(name="9×7 四目", value="9x7"),
+        app_commands.Choice(name="7×9 五目", value="7x9"),
+        app_commands.Choice(name="9×10 五目", value="9x10"),
+    ])
+    async def connectfour(interaction: discord.Interaction, size: str = "6x7"):
         """コネクトフォーを開始するコマンド"""
         try:
             # 既存のゲームチェック
@@ -376,9 +457,11 @@ def setup_connectfour(bot: commands.Bot):
                 return
 
             # 参加ビューの作成と送信
-            view = JoinView()
+            view = JoinView(size)
+            rows, cols, connect = BOARD_PRESETS[size]
             await interaction.response.send_message(
                 "🎮 コネクトフォーの参加者を募集します！\n"
+                f"盤面: {rows}×{cols}（{connect}目並べ）\n"
                 "2人揃うと開始します。\n"
                 "制限時間: 3分",
                 view=view
@@ -412,4 +495,26 @@ def setup_connectfour(bot: commands.Bot):
             if not active_games[channel_id]:
                 del active_games[channel_id]
 
-    return bot 
\ No newline at end of file
+    return bot 
+
+
+# ベンチマーク
+def benchmark_win_detection(iterations: int = 20000) -> Dict[str, float]:
+    """各プリセットで勝利判定1回あたりの平均時間（マイクロ秒）を返す"""
+    results = {}
+    for name, (rows, cols, connect) in BOARD_PRESETS.items():
+        config = get_board_config(rows, cols, connect)
+        # 盤面の半分程度をランダムに埋めた局面を用意
+        boards = []
+        for _ in range(100):
+            bitboard = 0
+            for col in range(cols):
+                for row in range(random.randint(0, rows)):
+                    if random.random() < 0.5:
+                        bitboard |= 1 << (col * config.height + row)
+            boards.append(bitboard)
+        start = time.perf_counter()
+        for i in range(iterations):
+            config.has_won(boards[i % 100])
+        results[name] = (time.perf_counter() - start) / iterations * 1e6
+    return results
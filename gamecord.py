@@ -83,7 +83,10 @@ async def rule(interaction: discord.Interaction, game: str):
             "  ・バリア（全攻撃を無効、連続不可）\n"
             "  ・チャージ（攻撃のためのエネルギーを蓄積）\n"
             "  ・1～3チャージ発射（チャージ量に応じた攻撃）\n"
-            "- HPが0になったら敗北！DMで選択、非公開バトル！"
+            "- HPが0になったら敗北！DMで選択、非公開バトル！\n"
+            "- `/ミニ戦車バトルCPU` で読み合い最強のCPUと対戦\n"
+            "- `/戦車トーナメント` で最大64人のトーナメント（シングル / ダブルイリミネーション）\n"
+            "- `/戦車観戦` でチャンネル内の対戦をリアルタイム観戦"
         )
     elif game == "werewolf":
         text = (
@@ -98,7 +101,8 @@ async def rule(interaction: discord.Interaction, game: str):
             "- 2人で交互に駒を落としていくボードゲーム\n"
             "- 縦・横・斜めのいずれかで4つ並べると勝利\n"
             "- 全てのマスが埋まると引き分け\n"
-            "- 数字ボタンを押して駒を配置！"
+            "- 数字ボタンを押して駒を配置！\n"
+            "- 開始時に盤面サイズ（6×7〜9×10）と五目ルールも選べます"
         )
     elif game == "connect4_3d":
         text = (
@@ -107,7 +111,9 @@ async def rule(interaction: discord.Interaction, game: str):
             "- 座標を選ぶと、その位置に駒が落ちていく\n"
             "- 縦・横・斜め、どの方向でも4つ並べば勝利\n"
             "- 立体的な並びも有効（空間的な想像力が必要！）\n"
-            "- 各層ごとの状態が表示されます"
+            "- 各層ごとの状態が表示されます\n"
+            "- `/立体コネクトフォーCPU` でCPUと対戦（強さは3段階）\n"
+            "- `size` で 5x5x5 の四目・五目も選べます（座標はセレクトメニューで選択）"
         )
     else:
         text = "❌ 不明なゲーム名です。"
@@ -116,6 +122,8 @@ async def rule(interaction: discord.Interaction, game: str):
 
 
 # === Bot起動イベント ===
+# @bot.event の on_ready は1つしか持てず、ここで setup_* の中の定義を上書きする
+# 各ゲームの起動時の処理は bot.add_listener(..., "on_ready") で登録すること
 @bot.event
 async def on_ready():
     await bot.tree.sync()
@@ -3,12 +3,17 @@ import discord
 from discord.ext import commands
 import asyncio
 import random
+import sqlite3
 import string
+import time
+from collections import OrderedDict
 from datetime import datetime
 from discord.ext import tasks
 from discord import app_commands
 from typing import Optional
 
+from tankbattle_engine import ACTION_INDEX, BARRIER, INITIAL_HP, MAX_CHARGE, TankState, step
+
 # グローバル変数の定義
 tank_bot = None
 
@@ -16,29 +21,38 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-# ルーム情報格納 {room_id: {"channel": TextChannel, "players": [Player,...], "started": bool}}
-rooms: dict[str, dict] = {}
-
 # === アクション名の定義 ===
 ACTION_NAMES = {
     "barrier": "🛡️ バリア",
     "charge": "⚡ チャージ",
-    "attack1": "💥 1チャージ攻撃",
-    "attack2": "💥💥 2チャージ攻撃",
-    "attack3": "💥💥💥 3チャージ攻撃"
+    "shoot1": "💥 1チャージ攻撃",
+    "shoot2": "💥💥 2チャージ攻撃",
+    "shoot3": "💥💥💥 3チャージ攻撃"
 }
 
 # 1. 定数の整理
 GAME_SETTINGS = {
-    "INITIAL_HP": 10,
-    "MAX_CHARGE": 3,
+    "INITIAL_HP": INITIAL_HP,
+    "MAX_CHARGE": MAX_CHARGE,
     "COMMAND_TIMEOUT": 30,
-    "JOIN_TIMEOUT": 180
+    "JOIN_TIMEOUT": 180,
+    "DM_CONCURRENCY": 4,  # 同時に送るDMの上限
+    "SPECTATOR_INTERVAL": 1.0  # 観戦ボードを編集する最短間隔（秒）
+}
+
+# 戦績の保存設定
+STATS_FILE = "tank_stats.db"
+STATS_SETTINGS = {
+    "FLUSH_INTERVAL": 30,   # 未保存の戦績をまとめて書き込む間隔（秒）
+    "FLUSH_BATCH": 50,      # これだけ溜まったら間隔を待たずに書き込む
+    "CACHE_SIZE": 1000,     # メモリに置く最大人数（起動時は最近遊んだ順に読み込む）
+    "IDLE_SECONDS": 3600,   # これだけ参照されなかった人はメモリから外す
 }
 
 class Player:
-    def __init__(self, user: discord.User):
+    def __init__(self, user: discord.User, is_cpu: bool = False):
         self.user = user
+        self.is_cpu = is_cpu  # CPUは均衡戦略の表からコマンドを選ぶ（DMは送らない）
         self.hp: int = GAME_SETTINGS["INITIAL_HP"]
         self.charge: int = 0
         self.choice: str | None = None
@@ -57,10 +71,97 @@ class Player:
     def add_charge(self):
         self.charge = min(self.charge + 1, GAME_SETTINGS["MAX_CHARGE"])
 
+# 3. ゲーム状態管理の改善
+class TankBattleGame:
+    def __init__(self, channel: discord.TextChannel, room_id: str):
+        self.room_id = room_id
+        self.channel = channel
+        self.players: list[Player] = []
+        self.started: bool = False
+        self.created_at = datetime.now()
+        self.turn_count: int = 0
+        self.spectator: Optional["SpectatorBoard"] = None  # /戦車観戦 で作られる観戦ボード
+
+    def add_player(self, user: discord.User, is_cpu: bool = False) -> Optional[Player]:
+        if len(self.players) >= 2 or self.is_player(user.id):
+            return None
+        player = Player(user, is_cpu)
+        self.players.append(player)
+        return player
+
+    def is_player(self, user_id: int) -> bool:
+        return any(p.user.id == user_id for p in self.players)
+
+class RoomRegistry:
+    """
+    ルームの登録簿（ルームID・チャンネルID・プレイヤーIDの索引で O(1) に引く）
+    1人のプレイヤーが同時に参加できるのは1ルームまで（CPUは索引に載せない）
+    """
+
+    def __init__(self):
+        self.by_id: dict[str, TankBattleGame] = {}
+        self.by_channel: dict[int, dict[str, TankBattleGame]] = {}
+        self.by_player: dict[int, TankBattleGame] = {}
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def __contains__(self, room_id: str) -> bool:
+        return room_id in self.by_id
+
+    def create(self, channel: discord.TextChannel) -> TankBattleGame:
+        room_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=5))
+        while room_id in self.by_id:
+            room_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=5))
+        game = TankBattleGame(channel, room_id)
+        self.by_id[room_id] = game
+        self.by_channel.setdefault(channel.id, {})[room_id] = game
+        return game
+
+    def get(self, room_id: str) -> Optional[TankBattleGame]:
+        return self.by_id.get(room_id)
+
+    def in_channel(self, channel_id: int) -> list[TankBattleGame]:
+        return list(self.by_channel.get(channel_id, {}).values())
+
+    def player_room(self, user_id: int) -> Optional[TankBattleGame]:
+        return self.by_player.get(user_id)
+
+    def join(self, game: TankBattleGame, user: discord.User, is_cpu: bool = False) -> Optional[Player]:
+        """参加させる（満員・他のルームに参加中なら None）"""
+        if not is_cpu and user.id in self.by_player:
+            return None
+        player = game.add_player(user, is_cpu)
+        if player is not None and not is_cpu:
+            self.by_player[user.id] = game
+        return player
+
+    def remove(self, room_id: str):
+        game = self.by_id.pop(room_id, None)
+        if game is None:
+            return
+        channel_rooms = self.by_channel.get(game.channel.id, {})
+        channel_rooms.pop(room_id, None)
+        if not channel_rooms:
+            self.by_channel.pop(game.channel.id, None)
+        for p in game.players:
+            if self.by_player.get(p.user.id) is game:
+                del self.by_player[p.user.id]
+
+    def stale_rooms(self, now: datetime, max_age: float) -> list[TankBattleGame]:
+        """開始前のまま max_age 秒を過ぎたルーム"""
+        return [game for game in self.by_id.values()
+                if not game.started and (now - game.created_at).total_seconds() > max_age]
+
+# ルーム情報格納
+rooms = RoomRegistry()
+
 class CommandSelectionView(discord.ui.View):
     def __init__(self, player: Player):
-        super().__init__(timeout=GAME_SETTINGS["COMMAND_TIMEOUT"])
+        # 30秒の制限時間はターンごとに wait_for_choices が1つのタイマーで管理する
+        super().__init__(timeout=None)
         self.player = player
+        self.chosen: asyncio.Future = asyncio.get_running_loop().create_future()  # クリックで選択コマンドが入る
         self.update_buttons()
 
     def update_buttons(self):
@@ -83,7 +184,11 @@ class CommandSelectionView(discord.ui.View):
         return interaction.user.id == self.player.user.id
 
     async def process(self, interaction: discord.Interaction, cmd: str):
+        if self.chosen.done():
+            await interaction.response.send_message("⏰ 時間切れのため『チャージ』が選択されました", ephemeral=True)
+            return
         self.player.choice = cmd
+        self.chosen.set_result(cmd)  # 待っているターンをすぐに起こす
         await interaction.response.send_message(f"✅ 選択: **{cmd}**", ephemeral=True)
         self.stop()
 
@@ -111,6 +216,10 @@ def setup_tankbattle(bot: commands.Bot):
     global tank_bot
     tank_bot = bot
 
+    # CPU対戦モジュールはこのモジュールのルール定義を使うため、ここで読み込む
+    from tankbattle_ai import choose_action, prepare_strategy_table
+    from tankbattle_tournament import FORMATS, TOURNAMENT_SETTINGS, Bracket, TournamentRunner
+
     # エラーハンドラーをsetup_tankbattle関数の中に移動
     @bot.tree.error
     async def on_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
@@ -122,16 +231,27 @@ def setup_tankbattle(bot: commands.Bot):
         message = error_messages.get(type(error), str(error))
         await interaction.response.send_message(message, ephemeral=True)
 
-    @bot.event
-    async def on_ready():
-        cleanup_inactive_rooms.start()
-        print("Tank battle cleanup task started")
+    async def start_cleanup():
+        """放置されたルームの片付けを始める"""
+        if not cleanup_inactive_rooms.is_running():
+            cleanup_inactive_rooms.start()
+            print("Tank battle cleanup task started")
+
+    bot.add_listener(start_cleanup, "on_ready")
+
+    async def start_stats_store():
+        """戦績を読み込み、書き出しループを始める"""
+        await get_stats_store().warm()
+        if not flush_tank_stats.is_running():
+            flush_tank_stats.start()
+
+    bot.add_listener(start_stats_store, "on_ready")
 
     # 戦績表示コマンドもsetup_tankbattle関数の中に移動
     @bot.tree.command(name='戦車戦績', description='ミニ戦車バトルの戦績を表示')
     async def show_stats(interaction: discord.Interaction, target: Optional[discord.User] = None):
         user = target or interaction.user
-        stats = GameStats(user.id).stats
+        stats = (await get_stats_store().get(user.id)).stats
         
         if stats["total_games"] == 0:
             await interaction.response.send_message(
@@ -164,6 +284,7 @@ def setup_tankbattle(bot: commands.Bot):
             value=(
                 f"最大ダメージ: {stats['max_damage_dealt']}\n"
                 f"平均ダメージ: {avg_damage:.1f}\n"
+                f"平均ターン数: {stats['total_turns'] / stats['total_games']:.1f}\n"
                 f"完全勝利: {stats['perfect_wins']}"
             ),
             inline=False
@@ -171,33 +292,43 @@ def setup_tankbattle(bot: commands.Bot):
         
         await interaction.response.send_message(embed=embed)
 
-    async def start_game(room: dict):
+    async def start_game(game: TankBattleGame) -> Optional[discord.User]:
+        """対戦を最後まで進めて勝者を返す（中断・エラー時は None）"""
+        channel = game.channel
+        players = game.players
+        result_text = "🛑 対戦は終了しました（中断）"
         try:
-            room_id = next(k for k,v in rooms.items() if v is room)
-            channel = room['channel']
-            players = room['players']
-            room['started'] = True
+            game.started = True
 
-            # ゲーム開始DM
+            # ゲーム開始DM（全員に同時に送る）
+            humans = [p for p in players if not p.is_cpu]
             for p in players:
-                try:
-                    await p.user.send(f"🔥 ゲーム開始！HP={p.hp} / Charge={p.charge}\n" +
-                                    "(※30秒以内に未選択時は自動で『チャージ』が選択されます)")
-                    p.last_choice = None
-                except discord.Forbidden:
-                    await channel.send(f"⚠️ {p.user.mention} へのDMが送れません。DMを有効にしてください。")
-                    return
+                p.last_choice = None
+            errors = await fan_out_dms([
+                (p.user, {"content": f"🔥 ゲーム開始！HP={p.hp} / Charge={p.charge}\n" +
+                                     "(※30秒以内に未選択時は自動で『チャージ』が選択されます)"})
+                for p in humans
+            ])
+            failed = [p for p, error in zip(humans, errors) if error is not None]
+            if failed:
+                await channel.send(" ".join(f"⚠️ {p.user.mention} へのDMが送れません。DMを有効にしてください。" for p in failed))
+                return None
 
             # ターンループ
             while all(p.hp > 0 for p in players):
                 # 中断確認
-                if not room.get('started', False):
+                if not game.started:
                     await channel.send("🛑 ゲームが中断されました。")
-                    return
+                    return None
 
-                # 各プレイヤーへ結果と選択DM
+                # 各プレイヤーへ結果と選択DM（両者に同時に届くよう並行して送る）
+                views = []
+                deliveries = []
                 for p in players:
                     opponent = players[1] if p is players[0] else players[0]
+                    if p.is_cpu:
+                        p.choice = choose_action(p, opponent)
+                        continue
                     embed = discord.Embed(title='💥 ターン結果', color=discord.Color.blue())
                     embed.add_field(name='あなた', value=f"HP: {p.hp}\nCharge: {p.charge}", inline=True)
                     embed.add_field(name='相手', value=f"HP: {opponent.hp}\nCharge: {opponent.charge}", inline=True)
@@ -210,65 +341,107 @@ def setup_tankbattle(bot: commands.Bot):
 
                     embed.set_footer(text='コマンドを選択 (30秒以内; 未選択時はチャージ)')
                     view = CommandSelectionView(p)
-                    try:
-                        await p.user.send(embed=embed, view=view)
-                    except discord.Forbidden:
-                        await channel.send(f"⚠️ {p.user.mention} へのDMが送れません。")
-                        return
-
-                # 選択待機
-                await asyncio.gather(*[wait_for_choice(p) for p in players])
+                    views.append(view)
+                    deliveries.append((p.user, {"embed": embed, "view": view}))
+
+                errors = await fan_out_dms(deliveries)
+                failed = [view.player for view, error in zip(views, errors) if error is not None]
+                if failed:
+                    await channel.send(" ".join(f"⚠️ {p.user.mention} へのDMが送れません。" for p in failed))
+                    return None
+
+                # 選択待機（両者が選んだ瞬間に解決）
+                await wait_for_choices(views)
+                game.turn_count += 1
                 
-                # 解決
+                # 解決（与ダメージ・被ダメージを記録する）
+                hp_before = [p.hp for p in players]
                 turn_result = resolve_turn(players[0], players[1])
+                for i, p in enumerate(players):
+                    taken = hp_before[i] - p.hp
+                    p.total_damage_taken += taken
+                    players[1 - i].total_damage_dealt += taken
                 
                 # choiceとlast_choice更新
                 for p in players:
                     p.last_choice = p.choice
                     p.choice = None
 
+                # 観戦ボード（編集はまとめて行う）
+                if game.spectator is not None:
+                    game.spectator.update(show_status(game))
+
             # 勝敗
             winner, loser = (players[0], players[1]) if players[0].hp > 0 else (players[1], players[0])
             await channel.send(f"🏆 {winner.user.mention} の勝利！{loser.user.mention} を撃破！")
+            result_text = f"🏆 {winner.user.display_name} の勝利！"
+
+            # 戦績の記録（CPUは記録しない）
+            store = get_stats_store()
+            for p in players:
+                if not p.is_cpu:
+                    await store.record(p.user.id, p is winner, p.total_damage_dealt, p.total_damage_taken,
+                                       game.turn_count)
             
-            # DM勝敗通知
+            # DM勝敗通知（届かなかった人がいても他の人には送る）
+            deliveries = []
             for p in players:
-                try:
-                    result = '勝利' if p is winner else '敗北'
-                    opp = loser if p is winner else winner
-                    await p.user.send(
-                        f"🏁 ゲーム終了 — {result}\n"
-                        f"あなた: HP={p.hp} / Charge={p.charge}\n"
-                        f"相手: HP={opp.hp} / Charge={opp.charge}"
-                    )
-                except discord.Forbidden:
-                    pass
+                if p.is_cpu:
+                    continue
+                result = '勝利' if p is winner else '敗北'
+                opp = loser if p is winner else winner
+                deliveries.append((p.user, {"content": (
+                    f"🏁 ゲーム終了 — {result}\n"
+                    f"あなた: HP={p.hp} / Charge={p.charge}\n"
+                    f"相手: HP={opp.hp} / Charge={opp.charge}"
+                )}))
+            await fan_out_dms(deliveries)
+            return winner.user
 
         except Exception as e:
             print(f"Error in tank battle: {e}")
             await channel.send("⚠️ ゲームでエラーが発生しました。")
+            return None
         finally:
-            if room_id in rooms:
-                del rooms[room_id]
+            if game.spectator is not None:
+                await game.spectator.close(show_status(game, result_text))
+            rooms.remove(game.room_id)
 
     @bot.tree.command(name='戦車中断', description='進行中の戦車バトルを中断します')
     async def cancel_game(interaction: discord.Interaction):
         # 進行中のゲームを探す
-        channel_rooms = [room for room in rooms.values() if room['channel'].id == interaction.channel.id]
-        if not channel_rooms:
+        if not rooms.in_channel(interaction.channel.id):
             await interaction.response.send_message("⚠️ このチャンネルで進行中のゲームはありません。", ephemeral=True)
             return
 
-        room = channel_rooms[0]
         # 参加者かどうかチェック
-        if not any(p.user.id == interaction.user.id for p in room['players']):
+        game = rooms.player_room(interaction.user.id)
+        if game is None or game.channel.id != interaction.channel.id:
             await interaction.response.send_message("⚠️ このゲームの参加者ではありません。", ephemeral=True)
             return
 
         # ゲームを中断
-        room['started'] = False
+        game.started = False
         await interaction.response.send_message("🛑 ゲームを中断しました。")
 
+    @bot.tree.command(name='戦車観戦', description='このチャンネルで進行中の戦車バトルを観戦します')
+    async def spectate(interaction: discord.Interaction):
+        games = [game for game in rooms.in_channel(interaction.channel.id)
+                 if game.started and len(game.players) == 2]
+        if not games:
+            await interaction.response.send_message("⚠️ このチャンネルで進行中のゲームはありません。", ephemeral=True)
+            return
+        new_games = [game for game in games if game.spectator is None]
+        if not new_games:
+            await interaction.response.send_message("👀 既に観戦ボードが表示されています。", ephemeral=True)
+            return
+
+        await interaction.response.send_message(f"👀 {len(new_games)}試合の観戦ボードを表示します。", ephemeral=True)
+        for game in new_games:
+            message = await interaction.channel.send(show_status(game))
+            if game.room_id in rooms:  # 送信中に終わった試合には付けない
+                game.spectator = SpectatorBoard(message)
+
     class JoinView(discord.ui.View):
         def __init__(self, room_id: str):
             super().__init__(timeout=None)
@@ -276,92 +449,156 @@ def setup_tankbattle(bot: commands.Bot):
 
         @discord.ui.button(label="参加する", style=discord.ButtonStyle.primary)
         async def join(self, interaction: discord.Interaction, button: discord.ui.Button):
-            room = rooms.get(self.room_id)
-            if not room:
+            game = rooms.get(self.room_id)
+            if not game:
                 return await interaction.response.send_message("⚠️ このルームは存在しません。", ephemeral=True)
-            if any(p.user.id == interaction.user.id for p in room['players']):
+            if game.is_player(interaction.user.id):
                 return await interaction.response.send_message("⚠️ 既に参加済みです。", ephemeral=True)
-            if len(room['players']) >= 2:
+            if len(game.players) >= 2:
                 return await interaction.response.send_message("⚠️ 満員です。", ephemeral=True)
+            if rooms.join(game, interaction.user) is None:
+                return await interaction.response.send_message("⚠️ 他のルームに参加中です。", ephemeral=True)
 
-            player = Player(interaction.user)
-            room['players'].append(player)
             await interaction.response.send_message(f"✅ 参加登録完了！", ephemeral=True)
             await interaction.channel.send(f"✅ {interaction.user.mention} が参加しました！")
 
-            if len(room['players']) == 2 and not room['started']:
-                room['started'] = True
+            if len(game.players) == 2 and not game.started:
+                game.started = True
                 await interaction.channel.send("🎮 参加者が揃いました！ゲームを開始します...")
                 await asyncio.sleep(1)
-                await start_game(room)
+                await start_game(game)
+
+    @bot.tree.command(name='ミニ戦車バトルCPU', description='CPUとミニ戦車バトルで対戦')
+    async def make_cpu_room(interaction: discord.Interaction):
+        if any(game.started for game in rooms.in_channel(interaction.channel.id)):
+            return await interaction.response.send_message("⚠️ このチャンネルでは既にゲームが進行中です。", ephemeral=True)
+        if rooms.player_room(interaction.user.id) is not None:
+            return await interaction.response.send_message("⚠️ 他のルームに参加中です。", ephemeral=True)
+
+        game = rooms.create(interaction.channel)
+        rooms.join(game, interaction.user)
+        rooms.join(game, bot.user, is_cpu=True)
+        game.started = True
+
+        await interaction.response.send_message("🤖 CPUが作戦を準備しています...")
+        await prepare_strategy_table()  # 初回のみ均衡戦略を計算する
+        await interaction.channel.send(f"🎮 {interaction.user.mention} vs 🤖 CPU — ゲームを開始します！DMを確認してください。")
+        await start_game(game)
+
+    async def play_tournament_match(channel: discord.TextChannel, user_a: discord.User, user_b: discord.User):
+        """トーナメントの1試合（他のルームで対戦中の人は不戦敗）"""
+        game = rooms.create(channel)
+        joined = [rooms.join(game, user) is not None for user in (user_a, user_b)]
+        if not all(joined):
+            rooms.remove(game.room_id)
+            if any(joined):
+                present = user_a if joined[0] else user_b
+                await channel.send(f"⚠️ 相手が他のルームで対戦中のため、{present.mention} の不戦勝です。")
+                return present
+            return None
+        await channel.send(f"⚔️ トーナメント: {user_a.mention} vs {user_b.mention} 開始！DMを確認してください。")
+        return await start_game(game)
+
+    class TournamentJoinView(discord.ui.View):
+        def __init__(self, host: discord.User, fmt: str):
+            super().__init__(timeout=TOURNAMENT_SETTINGS["JOIN_TIMEOUT"])
+            self.host = host
+            self.fmt = fmt
+            self.entrants: list[discord.User] = []
+            self.message = None
+
+        def recruit_text(self) -> str:
+            names = ", ".join(user.display_name for user in self.entrants) or "（まだいません）"
+            return (
+                f"🏆 戦車トーナメント（{FORMATS[self.fmt]}）の参加者を募集します！\n"
+                f"{self.host.mention} が「締め切って開始」を押すと始まります（最大{TOURNAMENT_SETTINGS['MAX_ENTRANTS']}人）\n"
+                f"参加者 {len(self.entrants)}人: {names}"
+            )
+
+        @discord.ui.button(label="参加する", style=discord.ButtonStyle.primary)
+        async def join(self, interaction: discord.Interaction, button: discord.ui.Button):
+            if any(user.id == interaction.user.id for user in self.entrants):
+                return await interaction.response.send_message("⚠️ 既に参加済みです。", ephemeral=True)
+            if rooms.player_room(interaction.user.id) is not None:
+                return await interaction.response.send_message("⚠️ 他のルームに参加中です。", ephemeral=True)
+            if len(self.entrants) >= TOURNAMENT_SETTINGS["MAX_ENTRANTS"]:
+                return await interaction.response.send_message("⚠️ 満員です。", ephemeral=True)
+            self.entrants.append(interaction.user)
+            await interaction.response.edit_message(content=self.recruit_text(), view=self)
+
+        @discord.ui.button(label="締め切って開始", style=discord.ButtonStyle.success)
+        async def start(self, interaction: discord.Interaction, button: discord.ui.Button):
+            if interaction.user.id != self.host.id:
+                return await interaction.response.send_message("⚠️ 主催者だけが開始できます。", ephemeral=True)
+            if len(self.entrants) < TOURNAMENT_SETTINGS["MIN_ENTRANTS"]:
+                return await interaction.response.send_message("⚠️ 参加者が足りません。", ephemeral=True)
+            self.stop()
+
+            entrants = list(self.entrants)
+            random.shuffle(entrants)  # シードは抽選
+            bracket = Bracket(entrants, self.fmt)
+            channel = interaction.channel
+            # 結果ボードは募集メッセージを編集して使い回す
+            await interaction.response.edit_message(content=bracket.render(), view=None)
+
+            async def update_board():
+                await self.message.edit(content=bracket.render())
+
+            async def play(user_a, user_b):
+                return await play_tournament_match(channel, user_a, user_b)
+
+            champion = await TournamentRunner(bracket, play, update_board).run()
+            await channel.send(f"🎉 トーナメント優勝: {champion.mention}！おめでとうございます！")
+
+        async def on_timeout(self):
+            if self.message:
+                await self.message.edit(content="⏰ 募集時間が終了しました。", view=None)
+
+    @bot.tree.command(name='戦車トーナメント', description='ミニ戦車バトルのトーナメント（最大64人）')
+    @app_commands.describe(format="トーナメントの形式")
+    @app_commands.choices(format=[
+        app_commands.Choice(name=label, value=key) for key, label in FORMATS.items()
+    ])
+    async def make_tournament(interaction: discord.Interaction, format: str = "single"):
+        view = TournamentJoinView(interaction.user, format)
+        await interaction.response.send_message(view.recruit_text(), view=view)
+        view.message = await interaction.original_response()
 
     @bot.tree.command(name='ミニ戦車バトル', description='2人同時ターン制ミニ戦車バトル')
     async def make_room(interaction: discord.Interaction):
-        room_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=5))
-        rooms[room_id] = {
-            'channel': interaction.channel,
-            'players': [],
-            'started': False
-        }
-        view = JoinView(room_id)
+        game = rooms.create(interaction.channel)
+        view = JoinView(game.room_id)
         await interaction.response.send_message(
-            f"🎮 ルーム `{room_id}` を作成しました！参加者2名で開始します。",
+            f"🎮 ルーム `{game.room_id}` を作成しました！参加者2名で開始します。",
             view=view
         )
 
-    async def wait_for_choice(player: Player):
-        for _ in range(60):
-            if player.choice is not None:
-                return
-            await asyncio.sleep(0.5)
-        player.choice = 'charge'
+async def wait_for_choices(views: list[CommandSelectionView], timeout: float = GAME_SETTINGS["COMMAND_TIMEOUT"]):
+    """全員のコマンド選択を待つ（揃った瞬間に戻る。タイマーはターンに1つで、未選択者は自動でチャージ）"""
+    await asyncio.wait([view.chosen for view in views], timeout=timeout)
+    for view in views:
+        if not view.chosen.done():
+            view.player.choice = 'charge'
+            view.chosen.set_result('charge')
+        view.stop()
 
 # 同時解決ロジック
 def resolve_turn(p1: Player, p2: Player):
-    def get_attack_power(p: Player) -> int:
-        # 発射系コマンドの場合、チャージ数を返す
-        if p.choice and p.choice.startswith('shoot'):
-            return int(p.choice[-1])
-        return 0
-
-    # ダメージ算出
-    p1_attack = get_attack_power(p1)
-    p2_attack = get_attack_power(p2)
-
-    # バリア判定
-    p1_blocked = p1.choice == 'barrier'
-    p2_blocked = p2.choice == 'barrier'
-
-    # ダメージ計算（バリアと相殺を考慮）
-    if not p1_blocked and not p2_blocked and p1_attack > 0 and p2_attack > 0:
-        # 両者が攻撃の場合、チャージの差分がダメージになる
-        if p1_attack > p2_attack:
-            p2.hp -= (p1_attack - p2_attack)
-        elif p2_attack > p1_attack:
-            p1.hp -= (p2_attack - p1_attack)
-        # チャージが同じ場合は相殺
-    else:
-        # 通常のダメージ処理
-        if not p2_blocked and p1_attack > 0:
-            p2.hp -= p1_attack
-        if not p1_blocked and p2_attack > 0:
-            p1.hp -= p2_attack
-
-    # チャージ処理
-    for p in [p1, p2]:
-        if p.choice == 'charge':
-            p.charge = min(p.charge + 1, 3)  # 最大3チャージまで
-        elif p.choice and p.choice.startswith('shoot'):
-            p.charge -= int(p.choice[-1])
+    """tankbattle_engine.step で1ターンを解決し、結果を Player に書き戻す（未選択はチャージ扱い）"""
+    action1 = ACTION_INDEX[p1.choice or 'charge']
+    action2 = ACTION_INDEX[p2.choice or 'charge']
+    state = step(TankState(p1.hp, p1.charge, p1.last_choice == 'barrier',
+                           p2.hp, p2.charge, p2.last_choice == 'barrier'), action1, action2)
+    p1.hp, p1.charge, p2.hp, p2.charge = state.hp1, state.charge1, state.hp2, state.charge2
 
     # アクション結果を返す
     return {
         'p1_action': p1.choice,
         'p2_action': p2.choice,
-        'p1_blocked': p1_blocked,
-        'p2_blocked': p2_blocked,
-        'p1_attack': p1_attack,
-        'p2_attack': p2_attack
+        'p1_blocked': action1 == BARRIER,
+        'p2_blocked': action2 == BARRIER,
+        'p1_attack': max(action1 - 1, 0),
+        'p2_attack': max(action2 - 1, 0)
     }
 
 async def process_turn(p1_action, p2_action, battle_data):
@@ -377,75 +614,100 @@ async def process_turn(p1_action, p2_action, battle_data):
 
     # ... (既存の処理ロジック) ...
 
-async def show_status(channel, battle_data):
-    """バトル状況を表示"""
-    p1_id = battle_data["player1"]
-    p2_id = battle_data["player2"]
-    p1_hp = battle_data["hp"][p1_id]
-    p2_hp = battle_data["hp"][p2_id]
-    p1_charge = battle_data["charge"][p1_id]
-    p2_charge = battle_data["charge"][p2_id]
-    p1_barrier = battle_data["barrier"][p1_id]
-    p2_barrier = battle_data["barrier"][p2_id]
-
-    # 前のターンのアクションを取得
-    last_actions = battle_data.get("last_actions", {})
-    p1_last_action = last_actions.get(p1_id)
-    p2_last_action = last_actions.get(p2_id)
-
+def show_status(game: TankBattleGame, footer: str = "") -> str:
+    """観戦用のバトル状況テキスト"""
     # ステータス表示用の絵文字
     hp_emoji = "❤️"
     charge_emoji = "⚡"
-    barrier_emoji = "🛡️"
 
-    # プレイヤー1のステータス行
-    p1_status = [
-        f"<@{p1_id}>",
-        f"{hp_emoji} {p1_hp}",
-        f"{charge_emoji} {p1_charge}",
-    ]
-    if p1_barrier:
-        p1_status.append(f"{barrier_emoji}")
-    if p1_last_action:
-        p1_status.append(f"➡️ {ACTION_NAMES.get(p1_last_action, '不明')}")
-
-    # プレイヤー2のステータス行
-    p2_status = [
-        f"<@{p2_id}>",
-        f"{hp_emoji} {p2_hp}",
-        f"{charge_emoji} {p2_charge}",
-    ]
-    if p2_barrier:
-        p2_status.append(f"{barrier_emoji}")
-    if p2_last_action:
-        p2_status.append(f"➡️ {ACTION_NAMES.get(p2_last_action, '不明')}")
+    lines = []
+    for i, p in enumerate(game.players, 1):
+        status = [
+            p.user.display_name,
+            f"{hp_emoji} {max(p.hp, 0)}",
+            f"{charge_emoji} {p.charge}",
+        ]
+        if p.last_choice:
+            status.append(f"➡️ {ACTION_NAMES.get(p.last_choice, '不明')}")
+        lines.append(f"プレイヤー{i}: {' '.join(status)}")
 
     status_message = [
-        "🎮 **バトル状況**",
+        f"🎮 **バトル状況** — ターン {game.turn_count}",
         "```",
-        f"プレイヤー1: {' '.join(p1_status)}",
-        f"プレイヤー2: {' '.join(p2_status)}",
+        *lines,
         "```",
-        "",
-        "**コマンド説明**",
-        "・`バリア`：全ての攻撃を防ぐ（連続使用不可）",
-        "・`チャージ`：攻撃のためのエネルギーを貯める",
-        "・`1〜3チャージ攻撃`：チャージを消費して攻撃"
     ]
-
-    await channel.send("\n".join(status_message))
+    if footer:
+        status_message.append(footer)
+    return "\n".join(status_message)
+
+class SpectatorBoard:
+    """
+    観戦用の盤面メッセージ（1つのメッセージを編集して更新する）
+    編集は min_interval 秒に1回まで。間に来た更新は飛ばして最新の内容だけを反映する
+    """
+
+    def __init__(self, message: discord.Message, min_interval: float = GAME_SETTINGS["SPECTATOR_INTERVAL"]):
+        self.message = message
+        self.min_interval = min_interval
+        self.pending: Optional[str] = None  # まだ反映していない最新の内容
+        self.edits = 0
+        self._last_edit = float("-inf")
+        self._task: Optional[asyncio.Task] = None
+
+    def update(self, content: str):
+        self.pending = content
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        loop = asyncio.get_running_loop()
+        while self.pending is not None:
+            delay = self._last_edit + self.min_interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            content, self.pending = self.pending, None
+            try:
+                await self.message.edit(content=content)
+            except discord.HTTPException as e:
+                print(f"Failed to update spectator board: {e}")
+            self._last_edit = loop.time()
+            self.edits += 1
+
+    async def close(self, content: str):
+        """最終結果を反映して終わる"""
+        self.update(content)
+        await self._task
+
+@tasks.loop(seconds=STATS_SETTINGS["FLUSH_INTERVAL"])
+async def flush_tank_stats():
+    store = get_stats_store()
+    await store.flush()
+    store.evict()
 
 @tasks.loop(minutes=5)
 async def cleanup_inactive_rooms():
-    current_time = datetime.now()
-    inactive_rooms = []
-    for room_id, room in rooms.items():
-        if not room['started']:
-            created_at = room.get('created_at', current_time)
-            if (current_time - created_at).total_seconds() > 180:  # 3分
-                inactive_rooms.append(room_id)
-    for room_id in inactive_rooms:
-        del rooms[room_id]
+    # 参加者が揃わないまま JOIN_TIMEOUT（3分）を過ぎたルームを片付ける
+    for game in rooms.stale_rooms(datetime.now(), GAME_SETTINGS["JOIN_TIMEOUT"]):
+        rooms.remove(game.room_id)
+
+async def fan_out_dms(deliveries: list[tuple[discord.User, dict]],
+                      limit: int = GAME_SETTINGS["DM_CONCURRENCY"]) -> list[Optional[Exception]]:
+    """
+    複数人へのDMを並行して送る（同時送信数は limit まで）
+    1人への送信失敗は他の人に影響せず、宛先ごとの例外（成功なら None）を同じ順で返す
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def deliver(user: discord.User, kwargs: dict) -> Optional[Exception]:
+        async with semaphore:
+            try:
+                await user.send(**kwargs)
+                return None
+            except discord.HTTPException as e:
+                return e
+
+    return await asyncio.gather(*(deliver(user, kwargs) for user, kwargs in deliveries))
 
 async def send_dm_or_channel(user: discord.User, channel: discord.TextChannel, content: str, **kwargs):
     try:
@@ -456,40 +718,27 @@ async def send_dm_or_channel(user: discord.User, channel: discord.TextChannel, c
         await channel.send(f"{user.mention} {content}", **kwargs)
         return False
 
-# 3. ゲーム状態管理の改善
-class TankBattleGame:
-    def __init__(self, channel: discord.TextChannel):
-        self.channel = channel
-        self.players: list[Player] = []
-        self.started: bool = False
-        self.created_at = datetime.now()
-        self.turn_count: int = 0
-
-    async def add_player(self, user: discord.User) -> bool:
-        if len(self.players) >= 2:
-            return False
-        player = Player(user)
-        self.players.append(player)
-        return True
-
-    def is_player(self, user_id: int) -> bool:
-        return any(p.user.id == user_id for p in self.players)
-
 # 1. 戦績管理クラス
 class GameStats:
-    def __init__(self, user_id: int):
-        self.stats = player_stats.setdefault(user_id, {
+    FIELDS = ("wins", "losses", "total_games", "max_damage_dealt", "perfect_wins",
+              "total_damage_dealt", "total_damage_taken", "total_turns")
+
+    def __init__(self, user_id: int, stats: Optional[dict] = None):
+        self.user_id = user_id
+        self.stats = stats or {
             "wins": 0,
             "losses": 0,
             "total_games": 0,
             "max_damage_dealt": 0,
             "perfect_wins": 0,  # ノーダメージ勝利
             "total_damage_dealt": 0,
-            "total_damage_taken": 0
-        })
+            "total_damage_taken": 0,
+            "total_turns": 0
+        }
 
-    def add_result(self, won: bool, damage_dealt: int, damage_taken: int):
+    def add_result(self, won: bool, damage_dealt: int, damage_taken: int, turns: int = 0):
         self.stats["total_games"] += 1
+        self.stats["total_turns"] += turns
         if won:
             self.stats["wins"] += 1
             if damage_taken == 0:
@@ -504,6 +753,122 @@ class GameStats:
         self.stats["total_damage_dealt"] += damage_dealt
         self.stats["total_damage_taken"] += damage_taken
 
+class StatsStore:
+    """
+    戦績の保存先（SQLite）とメモリ上のキャッシュ
+    試合結果はキャッシュに反映して未保存として溜め、まとめて1回のトランザクションで書き込む
+    """
+
+    def __init__(self, path: str = STATS_FILE):
+        self.path = path
+        self.cache: "OrderedDict[int, GameStats]" = OrderedDict()  # 参照が古い順
+        self.last_access: dict[int, float] = {}
+        self.dirty: set[int] = set()
+        self.flushing: set[int] = set()  # 書き込み中の人（成功するまで追い出さない）
+        self.writes = 0  # 書き込みトランザクションの回数
+        self._flush_lock = asyncio.Lock()
+        with self._connect() as db:
+            columns = ", ".join(f"{field} INTEGER NOT NULL DEFAULT 0" for field in GameStats.FIELDS)
+            db.execute(f"CREATE TABLE IF NOT EXISTS tank_stats (user_id INTEGER PRIMARY KEY, {columns}, "
+                       "updated_at REAL NOT NULL DEFAULT 0)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path)
+
+    def _remember(self, stats: GameStats) -> GameStats:
+        self.cache[stats.user_id] = stats
+        self.cache.move_to_end(stats.user_id)
+        self.last_access[stats.user_id] = time.monotonic()
+        if len(self.cache) > STATS_SETTINGS["CACHE_SIZE"]:
+            self.evict(force=len(self.cache) - STATS_SETTINGS["CACHE_SIZE"])
+        return stats
+
+    def _read(self, user_ids: Optional[list[int]] = None, limit: Optional[int] = None) -> list[GameStats]:
+        query = f"SELECT user_id, {', '.join(GameStats.FIELDS)} FROM tank_stats"
+        params: tuple = ()
+        if user_ids is not None:
+            query += f" WHERE user_id IN ({', '.join('?' * len(user_ids))})"
+            params = tuple(user_ids)
+        query += " ORDER BY updated_at DESC"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        with self._connect() as db:
+            rows = db.execute(query, params).fetchall()
+        return [GameStats(row[0], dict(zip(GameStats.FIELDS, row[1:]))) for row in rows]
+
+    def _write(self, rows: list[tuple]):
+        columns = ", ".join(GameStats.FIELDS)
+        placeholders = ", ".join("?" * (len(GameStats.FIELDS) + 2))
+        updates = ", ".join(f"{field} = excluded.{field}" for field in GameStats.FIELDS)
+        with self._connect() as db:
+            db.executemany(
+                f"INSERT INTO tank_stats (user_id, {columns}, updated_at) VALUES ({placeholders}) "
+                f"ON CONFLICT(user_id) DO UPDATE SET {updates}, updated_at = excluded.updated_at",
+                rows
+            )
+        self.writes += 1
+
+    async def warm(self, limit: int = STATS_SETTINGS["CACHE_SIZE"]):
+        """起動時に最近遊んだ人から読み込んでおく"""
+        for stats in reversed(await asyncio.to_thread(self._read, None, limit)):
+            if stats.user_id not in self.cache:
+                self._remember(stats)
+
+    async def get(self, user_id: int) -> GameStats:
+        stats = self.cache.get(user_id)
+        if stats is None:
+            found = await asyncio.to_thread(self._read, [user_id])
+            stats = self.cache.get(user_id) or (found[0] if found else GameStats(user_id))
+        return self._remember(stats)
+
+    async def record(self, user_id: int, won: bool, damage_dealt: int, damage_taken: int, turns: int):
+        """試合結果を反映する（保存はまとめて行う）"""
+        stats = await self.get(user_id)
+        stats.add_result(won, damage_dealt, damage_taken, turns)
+        self.dirty.add(user_id)
+        if len(self.dirty) >= STATS_SETTINGS["FLUSH_BATCH"]:
+            await self.flush()
+
+    async def flush(self):
+        """未保存の戦績を1回のトランザクションで書き込む"""
+        async with self._flush_lock:
+            if not self.dirty:
+                return
+            user_ids, self.dirty = self.dirty, set()
+            self.flushing = user_ids
+            now = time.time()
+            rows = [(user_id, *(self.cache[user_id].stats[field] for field in GameStats.FIELDS), now)
+                    for user_id in user_ids]
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except sqlite3.Error as e:
+                self.dirty |= user_ids  # 次の機会に書き直す（キャッシュに残してあるので読み直せる）
+                print(f"Failed to save tank stats: {e}")
+            finally:
+                self.flushing = set()
+
+    def evict(self, now: Optional[float] = None, force: int = 0):
+        """
+        しばらく参照されていない人をキャッシュから外す（未保存・書き込み中の人は残す）
+        force > 0 なら、古い順にその人数までは期限前でも外す
+        """
+        now = time.monotonic() if now is None else now
+        for user_id in list(self.cache):
+            idle = now - self.last_access.get(user_id, 0) > STATS_SETTINGS["IDLE_SECONDS"]
+            if user_id in self.dirty or user_id in self.flushing or not (idle or force > 0):
+                continue
+            del self.cache[user_id]
+            self.last_access.pop(user_id, None)
+            force -= 1
+
+stats_store: Optional[StatsStore] = None
+
+def get_stats_store() -> StatsStore:
+    global stats_store
+    if stats_store is None:
+        stats_store = StatsStore()
+    return stats_store
+
 # 1. ダメージ計算の改善
 def calculate_damage(attacker: Player, defender: Player) -> int:
     """より戦略的なダメージ計算"""
@@ -557,3 +922,301 @@ def test_game_mechanics():
     assert p2.hp == 10  # ダメージなし
     assert p1.charge == 0  # チャージ消費
     assert p2.charge == 0  # チャージ消費
+
+def test_choice_latency(room_count: int = 500) -> dict:
+    """同時に room_count 部屋がコマンド選択を待つときの、クリックから解決までの遅延とタイマー登録数"""
+    import time
+
+    class _CountingLoop(asyncio.SelectorEventLoop):
+        """call_later / call_at で登録されたタイマーを数える"""
+        timers = 0
+
+        def call_at(self, when, callback, *args, context=None):
+            self.timers += 1
+            return super().call_at(when, callback, *args, context=context)
+
+    class _Response:
+        async def send_message(self, *args, **kwargs):
+            pass
+
+    class _Interaction:
+        response = _Response()
+
+    class _User:
+        def __init__(self, uid: int):
+            self.id = uid
+
+    async def poll_for_choice(player: Player):
+        # 旧実装: 0.5秒ごとに choice を確認する
+        for _ in range(60):
+            if player.choice is not None:
+                return
+            await asyncio.sleep(0.5)
+        player.choice = 'charge'
+
+    async def run(loop: _CountingLoop, polling: bool) -> dict:
+        rooms_views = [[CommandSelectionView(Player(_User(i * 2 + j))) for j in range(2)] for i in range(room_count)]
+        resolved_at = [0.0] * room_count
+
+        async def room(i: int):
+            views = rooms_views[i]
+            if polling:
+                await asyncio.gather(*[poll_for_choice(view.player) for view in views])
+            else:
+                await wait_for_choices(views)
+            resolved_at[i] = time.perf_counter()
+
+        timers_before = loop.timers
+        tasks_ = [asyncio.create_task(room(i)) for i in range(room_count)]
+        await asyncio.sleep(0)
+
+        # 最初の1人はすぐ、2人目はポーリング周期からずれた0.75秒後にクリックする（最後の部屋は時間切れで自動チャージ）
+        for views in rooms_views[:-1]:
+            await views[0].process(_Interaction(), 'charge')
+        await asyncio.sleep(0.75)
+        clicked_at = [0.0] * room_count
+        for i, views in enumerate(rooms_views[:-1]):
+            clicked_at[i] = time.perf_counter()
+            await views[1].process(_Interaction(), 'barrier')
+        await asyncio.wait(tasks_[:-1])
+        latencies = sorted(resolved_at[i] - clicked_at[i] for i in range(room_count - 1))
+        timers = loop.timers - timers_before - 1  # 2人目のクリック前の sleep を除く
+        tasks_[-1].cancel()
+        await asyncio.gather(tasks_[-1], return_exceptions=True)
+
+        assert all(views[0].player.choice == 'charge' and views[1].player.choice == 'barrier'
+                   for views in rooms_views[:-1])
+        return {
+            "p50_ms": latencies[len(latencies) // 2] * 1000,
+            "max_ms": latencies[-1] * 1000,
+            "timers": timers,
+        }
+
+    async def timeout_case():
+        # 未選択のプレイヤーは制限時間で自動チャージになる
+        views = [CommandSelectionView(Player(_User(j))) for j in range(2)]
+        await views[0].process(_Interaction(), 'barrier')
+        await wait_for_choices(views, timeout=0.01)
+        assert [view.player.choice for view in views] == ['barrier', 'charge']
+        await views[1].process(_Interaction(), 'shoot1')  # 時間切れ後のクリックは無視
+        assert views[1].player.choice == 'charge'
+
+    results = {}
+    for name, polling in (("event", False), ("polling", True)):
+        loop = _CountingLoop()
+        try:
+            results[name] = loop.run_until_complete(run(loop, polling))
+            if not polling:
+                loop.run_until_complete(timeout_case())
+        finally:
+            loop.close()
+
+    # イベント駆動はターンごとにタイマー1つ、クリックから解決までほぼ即時
+    assert results["event"]["timers"] == room_count
+    assert results["event"]["max_ms"] < results["polling"]["p50_ms"]
+    assert results["polling"]["timers"] > results["event"]["timers"] * 2
+    return results
+
+def test_room_registry():
+    class _Channel:
+        def __init__(self, cid: int):
+            self.id = cid
+
+    class _User:
+        def __init__(self, uid: int):
+            self.id = uid
+
+    registry = RoomRegistry()
+    channel_a, channel_b = _Channel(1), _Channel(2)
+    alice, bob, carol, cpu = _User(10), _User(11), _User(12), _User(99)
+
+    # 1. 作成と索引
+    game1 = registry.create(channel_a)
+    game2 = registry.create(channel_a)
+    game3 = registry.create(channel_b)
+    assert len(registry) == 3 and game1.room_id != game2.room_id
+    assert registry.get(game1.room_id) is game1
+    assert {g.room_id for g in registry.in_channel(1)} == {game1.room_id, game2.room_id}
+
+    # 2. 参加（満員・同時参加の禁止、CPUは何ルームでも可）
+    assert registry.join(game1, alice) is not None
+    assert registry.join(game1, alice) is None           # 同じルームに二重参加
+    assert registry.join(game2, alice) is None           # 他のルームに参加中
+    assert registry.join(game1, bob) is not None
+    assert registry.join(game1, carol) is None           # 満員
+    assert registry.player_room(carol.id) is None
+    assert registry.join(game2, cpu, is_cpu=True) is not None
+    assert registry.join(game3, cpu, is_cpu=True) is not None
+    assert registry.player_room(alice.id) is game1 and registry.player_room(cpu.id) is None
+
+    # 3. 削除で全索引から消える
+    registry.remove(game1.room_id)
+    assert game1.room_id not in registry
+    assert registry.player_room(alice.id) is None and registry.player_room(bob.id) is None
+    assert registry.join(game2, alice) is not None       # 解放後は別ルームに参加できる
+
+    # 4. 開始前に放置されたルームだけが期限切れになる
+    game3.started = True
+    game2.created_at = game3.created_at = datetime(2000, 1, 1)
+    stale = registry.stale_rooms(datetime.now(), GAME_SETTINGS["JOIN_TIMEOUT"])
+    assert stale == [game2]
+    registry.remove(game2.room_id)
+    registry.remove(game3.room_id)
+    assert len(registry) == 0 and not registry.by_channel and not registry.by_player
+
+def test_dm_fanout_skew(rooms_count: int = 50, latency: float = 0.05) -> dict:
+    """
+    DMの到着時刻の差（1ルーム内の2人）を、1人ずつ送る旧方式と fan_out_dms で比べる
+    Discord API の代わりに latency 秒かかる偽のDMを使う
+    """
+    import time
+
+    class _Response:
+        status = 403
+        reason = "Forbidden"
+
+    class _FakeUser:
+        def __init__(self, uid: int, blocked: bool = False):
+            self.id = uid
+            self.blocked = blocked
+            self.delivered_at: Optional[float] = None
+
+        async def send(self, content=None, **kwargs):
+            await asyncio.sleep(latency * random.uniform(0.8, 1.2))
+            if self.blocked:
+                raise discord.Forbidden(_Response(), "Cannot send messages to this user")
+            self.delivered_at = time.perf_counter()
+
+    async def sequential(users):
+        for user in users:
+            await user.send(content="turn")
+
+    async def concurrent(users):
+        return await fan_out_dms([(user, {"content": "turn"}) for user in users])
+
+    async def measure(send) -> float:
+        pairs = [[_FakeUser(i * 2), _FakeUser(i * 2 + 1)] for i in range(rooms_count)]
+        await asyncio.gather(*(send(users) for users in pairs))
+        skews = sorted(abs(a.delivered_at - b.delivered_at) for a, b in pairs)
+        return skews[len(skews) // 2] * 1000
+
+    async def isolation():
+        # 1人がDMを拒否していても、もう1人には届き、例外は宛先ごとに返る
+        blocked, ok = _FakeUser(1, blocked=True), _FakeUser(2)
+        errors = await concurrent([blocked, ok])
+        assert isinstance(errors[0], discord.Forbidden) and errors[1] is None
+        assert ok.delivered_at is not None
+
+    async def bounded():
+        # 同時送信数が上限を超えない
+        in_flight = peak = 0
+
+        class _CountingUser(_FakeUser):
+            async def send(self, content=None, **kwargs):
+                nonlocal in_flight, peak
+                in_flight += 1
+                peak = max(peak, in_flight)
+                await asyncio.sleep(0.001)
+                in_flight -= 1
+
+        await fan_out_dms([(_CountingUser(i), {"content": "x"}) for i in range(20)], limit=3)
+        assert peak == 3
+
+    async def run():
+        await isolation()
+        await bounded()
+        return {"sequential_skew_ms": await measure(sequential), "concurrent_skew_ms": await measure(concurrent)}
+
+    results = asyncio.run(run())
+    assert results["concurrent_skew_ms"] < results["sequential_skew_ms"] / 2
+    return results
+
+def test_stats_store(games: int = 120) -> dict:
+    """戦績がまとめて保存され、読み直し・キャッシュ追い出し後も同じ値になることを確認"""
+    import tempfile
+
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "stats.db")
+            store = StatsStore(path)
+            rng = random.Random(0)
+            for _ in range(games):
+                a, b = rng.sample(range(1, 21), 2)
+                dealt = rng.randint(1, 10)
+                await store.record(a, True, 10, dealt, 5)
+                await store.record(b, False, dealt, 10, 5)
+            await store.flush()
+            writes = store.writes
+            # 1試合ごとに書くと games * 2 回になる
+            assert writes <= (games * 2) // STATS_SETTINGS["FLUSH_BATCH"] + 1, writes
+
+            expected = {user_id: dict(s.stats) for user_id, s in store.cache.items()}
+            assert sum(s["wins"] for s in expected.values()) == games
+            assert sum(s["total_games"] for s in expected.values()) == games * 2
+
+            # 別インスタンス（再起動相当）で読み直す
+            reloaded = StatsStore(path)
+            await reloaded.warm()
+            assert {user_id: s.stats for user_id, s in reloaded.cache.items()} == expected
+
+            # 参照されていない人は外れ、未保存の人は残る
+            await reloaded.record(1, True, 3, 0, 4)
+            reloaded.evict(now=time.monotonic() + STATS_SETTINGS["IDLE_SECONDS"] + 1)
+            assert list(reloaded.cache) == [1]
+            assert (await reloaded.get(2)).stats == expected[2]  # 外れた人はDBから読み直す
+            await reloaded.flush()
+            assert (await StatsStore(path).get(1)).stats["perfect_wins"] == expected[1]["perfect_wins"] + 1
+
+            # 書き込み中に追い出しが走って書き込みが失敗しても、次の flush で書き直せる
+            failing = StatsStore(path)
+            await failing.record(3, True, 1, 0, 1)
+            original_write = failing._write
+
+            def broken_write(rows):
+                failing.evict(force=len(failing.cache))
+                raise sqlite3.OperationalError("database is locked")
+
+            failing._write = broken_write
+            await failing.flush()
+            assert failing.dirty == {3} and 3 in failing.cache
+            failing._write = original_write
+            await failing.flush()
+            assert not failing.dirty and (await StatsStore(path).get(3)).stats == failing.cache[3].stats
+            return {"games": games, "writes": writes}
+
+    result = asyncio.run(run())
+    print(f"✅ 戦績の保存テスト完了: {result}")
+    return result
+
+def test_spectator_board(boards: int = 50, updates: int = 40, interval: float = 0.05) -> dict:
+    """連続した更新が min_interval ごとの編集にまとめられ、最後の内容が必ず反映されることを確認"""
+    class _FakeMessage:
+        def __init__(self):
+            self.content = None
+            self.edited_at = []
+
+        async def edit(self, content=None, **kwargs):
+            self.edited_at.append(asyncio.get_running_loop().time())
+            await asyncio.sleep(0.001)
+            self.content = content
+
+    async def run():
+        messages = [_FakeMessage() for _ in range(boards)]
+        spectators = [SpectatorBoard(message, min_interval=interval) for message in messages]
+        for i in range(updates):
+            for board in spectators:
+                board.update(f"turn {i}")
+            await asyncio.sleep(interval / 5)  # 1回の最短間隔に5ターン分の更新が来る
+        await asyncio.gather(*(board.close("final") for board in spectators))
+
+        edits = [len(message.edited_at) for message in messages]
+        for message in messages:
+            assert message.content == "final"
+            gaps = [b - a for a, b in zip(message.edited_at, message.edited_at[1:])]
+            assert all(gap >= interval * 0.95 for gap in gaps), gaps
+        return {"updates": boards * (updates + 1), "edits": sum(edits)}
+
+    result = asyncio.run(run())
+    assert result["edits"] < result["updates"] / 3
+    print(f"✅ 観戦ボードのテスト完了: {result}")
+    return result
@@ -0,0 +1,384 @@
+# tankbattle_ai.py
+# ミニ戦車バトルのCPU対戦相手（同時手番ゲームの均衡戦略を事前計算した表から抽選する）
+
+import asyncio
+import hashlib
+import os
+import random
+import time
+from array import array
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from tankbattle import GAME_SETTINGS, Player
+from tankbattle_engine import ACTIONS, TankState, legal_actions, step
+
+MAX_HP = GAME_SETTINGS["INITIAL_HP"]
+MAX_CHARGE = GAME_SETTINGS["MAX_CHARGE"]
+# 片方のプレイヤーの状態 (HP 1〜MAX_HP, チャージ 0〜MAX_CHARGE, 直前にバリアを使ったか)
+SIDE_STATES = MAX_HP * (MAX_CHARGE + 1) * 2
+STATE_COUNT = SIDE_STATES * SIDE_STATES
+
+PROBABILITY_SCALE = 0xFFFF  # 混合戦略は累積確率を16ビット整数で持つ
+DISCOUNT = 0.99             # 1ターン先の値の割引（早く勝つ手を選ばせ、千日手で勝ちを逃さないため）
+TOLERANCE = 1e-7            # 価値反復の収束判定
+PIVOT_EPSILON = 1e-9        # 単体法で0とみなす大きさ
+MAX_ITERATIONS = 10_000
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tank_strategy.bin")
+TABLE_VERSION = 2  # 保存形式を変えたら上げる（ルールの変更はヘッダーの rules_fingerprint() で検出する）
+
+def side_index(hp: int, charge: int, barrier: bool) -> int:
+    return ((hp - 1) * (MAX_CHARGE + 1) + charge) * 2 + int(barrier)
+
+def side_state(index: int) -> Tuple[int, int, bool]:
+    rest, barrier = divmod(index, 2)
+    hp, charge = divmod(rest, MAX_CHARGE + 1)
+    return hp + 1, charge, bool(barrier)
+
+def state_index(me: Player, opponent: Player) -> int:
+    """対戦中の Player から表の添字を求める（me から見た局面）"""
+    return (
+        side_index(min(max(me.hp, 1), MAX_HP), min(me.charge, MAX_CHARGE), me.last_choice == "barrier") * SIDE_STATES
+        + side_index(min(max(opponent.hp, 1), MAX_HP), min(opponent.charge, MAX_CHARGE),
+                     opponent.last_choice == "barrier")
+    )
+
+# =============================
+# 行列ゲーム
+# =============================
+def solve_matrix_game(matrix: List[List[float]]) -> Tuple[float, List[float], List[float]]:
+    """
+    ゼロ和行列ゲームを解く（行プレイヤーが最大化）
+    戻り値: (ゲームの値, 行プレイヤーの混合戦略, 列プレイヤーの混合戦略)
+    """
+    m, n = len(matrix), len(matrix[0])
+
+    # 鞍点があれば純粋戦略で決まる（大半の局面はここで終わる）
+    row_min = [min(row) for row in matrix]
+    col_max = [max(matrix[i][j] for i in range(m)) for j in range(n)]
+    lower, upper = max(row_min), min(col_max)
+    if upper - lower <= 1e-12:
+        i, j = row_min.index(lower), col_max.index(upper)
+        return lower, [float(k == i) for k in range(m)], [float(k == j) for k in range(n)]
+
+    # 要素を 1〜2 に正規化して max Σy  s.t. B y <= 1, y >= 0 を単体法で解く（Blandの規則）
+    # 値の差がごく小さい局面でも桁落ちしないよう、最小値を引いて幅で割る
+    low = min(row_min)
+    scale = max(max(row) for row in matrix) - low
+    tableau = [
+        [(matrix[i][j] - low) / scale + 1.0 for j in range(n)] + [float(k == i) for k in range(m)] + [1.0]
+        for i in range(m)
+    ]
+    objective = [-1.0] * n + [0.0] * (m + 1)
+    basis = [n + i for i in range(m)]
+    while True:
+        entering = next((j for j in range(n + m) if objective[j] < -PIVOT_EPSILON), None)
+        if entering is None:
+            break
+        leaving, best = None, float("inf")
+        for i in range(m):
+            if tableau[i][entering] > PIVOT_EPSILON:
+                ratio = tableau[i][-1] / tableau[i][entering]
+                if ratio < best or (ratio == best and basis[i] < basis[leaving]):
+                    leaving, best = i, ratio
+        if leaving is None:
+            break  # 丸め誤差で残った負の被約費用（これ以上は改善しない）
+        pivot_row = tableau[leaving]
+        pivot = pivot_row[entering]
+        for k in range(n + m + 1):
+            pivot_row[k] /= pivot
+        for row in tableau + [objective]:
+            if row is not pivot_row and row[entering]:
+                factor = row[entering]
+                for k in range(n + m + 1):
+                    row[k] -= factor * pivot_row[k]
+        basis[leaving] = entering
+
+    total = objective[-1]
+    column = [0.0] * n
+    for i, var in enumerate(basis):
+        if var < n:
+            column[var] = tableau[i][-1] / total
+    row = [objective[n + i] / total for i in range(m)]  # 双対変数
+    return (1.0 / total - 1.0) * scale + low, row, column
+
+# =============================
+# 状態遷移（tankbattle_engine.step をそのまま使って作る）
+# =============================
+@lru_cache(maxsize=None)
+def build_transitions() -> List[Optional[Tuple[List[int], List[int], List[List[int]]]]]:
+    """
+    各局面の (自分の手, 相手の手, 遷移先) を作る
+    遷移先は局面番号、自分の勝ちは -1、相手の勝ちは -2
+    """
+    transitions = []
+    for state in range(STATE_COUNT):
+        my_side, opponent_side = divmod(state, SIDE_STATES)
+        my_hp, my_charge, my_barrier = side_state(my_side)
+        opponent_hp, opponent_charge, opponent_barrier = side_state(opponent_side)
+        my_actions = list(legal_actions(my_charge, my_barrier))
+        opponent_actions = list(legal_actions(opponent_charge, opponent_barrier))
+        outcomes = []
+        for a in my_actions:
+            row = []
+            for b in opponent_actions:
+                after = step(TankState(my_hp, my_charge, my_barrier, opponent_hp, opponent_charge, opponent_barrier), a, b)
+                if after.winner == 1:
+                    row.append(-1)
+                elif after.winner == 2:
+                    row.append(-2)
+                else:
+                    row.append(
+                        side_index(after.hp1, after.charge1, after.barrier1) * SIDE_STATES
+                        + side_index(after.hp2, after.charge2, after.barrier2)
+                    )
+            outcomes.append(row)
+        transitions.append((my_actions, opponent_actions, outcomes))
+    return transitions
+
+@lru_cache(maxsize=None)
+def rules_fingerprint() -> Tuple[int, ...]:
+    """全局面×全合法手の組の step() の結果から作る指紋（16ビット×4。ルールが変わると変わる）"""
+    digest = hashlib.blake2b(repr(build_transitions()).encode(), digest_size=8).digest()
+    return tuple(array("H", digest))
+
+def table_header() -> List[int]:
+    return [TABLE_VERSION, MAX_HP, MAX_CHARGE, *rules_fingerprint()]
+
+def _payoff(values: List[float], target: int) -> float:
+    if target == -1:
+        return 1.0
+    if target == -2:
+        return -1.0
+    return DISCOUNT * values[target]
+
+def _hp_layers() -> List[List[int]]:
+    """HPの組ごとの局面（HPは減る一方なので、合計HPの小さい組から順に解けば済む）"""
+    layers: Dict[Tuple[int, int], List[int]] = {}
+    for state in range(STATE_COUNT):
+        my_side, opponent_side = divmod(state, SIDE_STATES)
+        key = (side_state(my_side)[0], side_state(opponent_side)[0])
+        layers.setdefault(key, []).append(state)
+    return [layers[key] for key in sorted(layers, key=lambda key: (key[0] + key[1], key))]
+
+def _layered_value_iteration(stage) -> Tuple[List[float], int]:
+    """
+    HPの組ごとに価値反復する（同じHPの中ではチャージとバリアだけが変わるので循環しうる）
+    stage(state, matrix) はその局面の値を返す
+    """
+    transitions = build_transitions()
+    values = [0.0] * STATE_COUNT
+    iterations = 0
+    for layer in _hp_layers():
+        for _ in range(MAX_ITERATIONS):
+            iterations += 1
+            delta = 0.0
+            for state in layer:
+                _, _, outcomes = transitions[state]
+                matrix = [[_payoff(values, target) for target in row] for row in outcomes]
+                value = stage(state, matrix)
+                delta = max(delta, abs(value - values[state]))
+                values[state] = value
+            if delta < TOLERANCE:
+                break
+    return values, iterations
+
+# =============================
+# 均衡戦略の表
+# =============================
+class StrategyTable:
+    """
+    全局面の均衡戦略（自分のコマンドの累積確率を16ビットで保持）と局面の値
+    cumulative[state * 5 + a] が ACTIONS[a] までの累積確率 × PROBABILITY_SCALE
+    """
+
+    def __init__(self, cumulative: array, values: array):
+        self.cumulative = cumulative
+        self.values = values
+
+    @classmethod
+    def solve(cls) -> "StrategyTable":
+        strategies: List[List[float]] = [[] for _ in range(STATE_COUNT)]
+        transitions = build_transitions()
+
+        def stage(state, matrix):
+            value, row, _ = solve_matrix_game(matrix)
+            strategies[state] = row
+            return value
+
+        values, _ = _layered_value_iteration(stage)
+        cumulative = array("H", [0] * (STATE_COUNT * len(ACTIONS)))
+        for state, row in enumerate(strategies):
+            my_actions = transitions[state][0]
+            total = 0.0
+            probabilities = dict(zip(my_actions, row))
+            for a in range(len(ACTIONS)):
+                total += probabilities.get(a, 0.0)
+                cumulative[state * len(ACTIONS) + a] = min(PROBABILITY_SCALE, round(total * PROBABILITY_SCALE))
+            # 丸め誤差で最後の合法手が1にならないことがないようにする
+            for a in range(my_actions[-1], len(ACTIONS)):
+                cumulative[state * len(ACTIONS) + a] = PROBABILITY_SCALE
+        return cls(cumulative, array("f", values))
+
+    def strategy(self, state: int) -> List[float]:
+        """局面の混合戦略（ACTIONS 順の確率）"""
+        base = state * len(ACTIONS)
+        previous = 0
+        probabilities = []
+        for a in range(len(ACTIONS)):
+            probabilities.append((self.cumulative[base + a] - previous) / PROBABILITY_SCALE)
+            previous = self.cumulative[base + a]
+        return probabilities
+
+    def sample(self, state: int, rng: random.Random = random) -> str:
+        """表から1手を抽選する（O(1): 高々5要素の累積確率を見るだけ）"""
+        base = state * len(ACTIONS)
+        threshold = rng.randrange(PROBABILITY_SCALE)
+        for a in range(len(ACTIONS)):
+            if threshold < self.cumulative[base + a]:
+                return ACTIONS[a]
+        return "charge"
+
+    @property
+    def nbytes(self) -> int:
+        return self.cumulative.itemsize * len(self.cumulative) + self.values.itemsize * len(self.values)
+
+    def save(self, path: str = TABLE_PATH):
+        with open(path, "wb") as f:
+            array("H", table_header()).tofile(f)
+            self.cumulative.tofile(f)
+            self.values.tofile(f)
+
+    @classmethod
+    def load(cls, path: str = TABLE_PATH) -> Optional["StrategyTable"]:
+        """保存済みの表（保存形式・ルール設定・step() の結果のどれかが変わっていたら None）"""
+        expected = table_header()
+        try:
+            with open(path, "rb") as f:
+                header = array("H")
+                header.fromfile(f, len(expected))
+                if list(header) != expected:
+                    return None
+                cumulative = array("H")
+                cumulative.fromfile(f, STATE_COUNT * len(ACTIONS))
+                values = array("f")
+                values.fromfile(f, STATE_COUNT)
+        except (OSError, EOFError):
+            return None
+        return cls(cumulative, values)
+
+    def exploitability(self) -> Dict[str, float]:
+        """
+        表の戦略に最善応答する相手が、均衡の値よりどれだけ得をするか（-1〜1 の勝敗期待値の差）
+        """
+        transitions = build_transitions()
+        strategies = [self.strategy(state) for state in range(STATE_COUNT)]
+
+        def stage(state, matrix):
+            my_actions = transitions[state][0]
+            row = [strategies[state][a] for a in my_actions]
+            return min(sum(p * matrix[i][j] for i, p in enumerate(row)) for j in range(len(matrix[0])))
+
+        best_response, _ = _layered_value_iteration(stage)
+        gaps = [self.values[state] - best_response[state] for state in range(STATE_COUNT)]
+        start = state_index(Player(None), Player(None))
+        return {"start": gaps[start], "max": max(gaps)}
+
+_strategy_table: Optional[StrategyTable] = None
+
+def get_strategy_table() -> StrategyTable:
+    """均衡戦略の表（保存済みなら読み込み、なければ解いて保存する）"""
+    global _strategy_table
+    if _strategy_table is None:
+        table = StrategyTable.load()
+        if table is None:
+            table = StrategyTable.solve()
+            try:
+                table.save()
+            except OSError as e:
+                print(f"Failed to save tank strategy table: {e}")
+        _strategy_table = table
+    return _strategy_table
+
+async def prepare_strategy_table() -> StrategyTable:
+    """初回の計算でイベントループを止めないよう、スレッドで表を用意する"""
+    if _strategy_table is not None:
+        return _strategy_table
+    return await asyncio.get_running_loop().run_in_executor(None, get_strategy_table)
+
+def choose_action(me: Player, opponent: Player) -> str:
+    """CPUのコマンドを表から抽選する"""
+    return get_strategy_table().sample(state_index(me, opponent))
+
+# ベンチマーク
+def benchmark_solver() -> Dict[str, float]:
+    """求解時間・表のサイズ・搾取可能性・抽選時間"""
+    start = time.perf_counter()
+    build_transitions()
+    transitions_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    table = StrategyTable.solve()
+    solve_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    exploitability = table.exploitability()
+    exploitability_seconds = time.perf_counter() - start
+
+    rng = random.Random(1)
+    samples = 100_000
+    start = time.perf_counter()
+    for i in range(samples):
+        table.sample(i % STATE_COUNT, rng)
+    sample_us = (time.perf_counter() - start) / samples * 1e6
+
+    return {
+        "states": STATE_COUNT,
+        "transitions_seconds": transitions_seconds,
+        "solve_seconds": solve_seconds,
+        "table_bytes": table.nbytes,
+        "start_value": table.values[state_index(Player(None), Player(None))],
+        "exploitability_start": exploitability["start"],
+        "exploitability_max": exploitability["max"],
+        "exploitability_seconds": exploitability_seconds,
+        "sample_us": sample_us,
+    }
+
+# テスト
+def test_strategy_table():
+    # 1. 既知の行列ゲーム
+    value, row, column = solve_matrix_game([[0, -1, 1], [1, 0, -1], [-1, 1, 0]])  # じゃんけん
+    assert abs(value) < 1e-9 and all(abs(p - 1 / 3) < 1e-9 for p in row + column)
+    value, row, column = solve_matrix_game([[3, 1], [0, 2]])
+    assert abs(value - 1.5) < 1e-9 and abs(row[0] - 0.5) < 1e-9 and abs(column[0] - 0.25) < 1e-9
+
+    # 2. 対称なゲームなので、立場を入れ替えた局面の値は符号が逆になる
+    table = get_strategy_table()
+    for state in range(STATE_COUNT):
+        my_side, opponent_side = divmod(state, SIDE_STATES)
+        assert abs(table.values[state] + table.values[opponent_side * SIDE_STATES + my_side]) < 1e-4
+
+    # 3. 合法手以外には確率を置かない
+    for state in range(STATE_COUNT):
+        my_side = state // SIDE_STATES
+        _, charge, barrier = side_state(my_side)
+        legal = set(legal_actions(charge, barrier))
+        assert all(p == 0 for a, p in enumerate(table.strategy(state)) if a not in legal)
+
+    # 4. 最善応答しても均衡の値からほとんど得をしない
+    assert table.exploitability()["max"] < 1e-3
+
+    # 5. 保存した表は読み戻せ、ルールの指紋が違うファイルは使わない
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "strategy.bin")
+        table.save(path)
+        loaded = StrategyTable.load(path)
+        assert loaded is not None and loaded.cumulative == table.cumulative
+        with open(path, "r+b") as f:
+            f.seek(2 * 3)  # 指紋の先頭の16ビット
+            word = f.read(2)
+            f.seek(2 * 3)
+            f.write(bytes(b ^ 0xFF for b in word))
+        assert StrategyTable.load(path) is None
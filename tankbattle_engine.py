@@ -0,0 +1,218 @@
+# tankbattle_engine.py
+# ミニ戦車バトルのターン解決エンジン（discordに依存しない純粋関数。局面は不変のタプルで、step は新しい局面を返す）
+#
+# 例:
+#   state = step(INITIAL_STATE, CHARGE, BARRIER)
+#   record = play(random_policy, random_policy, seed=1)   # 対局をコマンド列として記録
+#   replay(record.moves) == record.final                  # 記録から同じ局面を再現できる
+
+import os
+import random
+import time
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+INITIAL_HP = 10
+MAX_CHARGE = 3
+MAX_TURNS = 200  # これを超えたら引き分け（記録用の上限）
+
+# コマンド番号: 0 = バリア, 1 = チャージ, 1 + k = kチャージ発射（名前は CommandSelectionView と同じ）
+ACTIONS = ("barrier", "charge", "shoot1", "shoot2", "shoot3")
+ACTION_INDEX = {name: a for a, name in enumerate(ACTIONS)}
+BARRIER, CHARGE = 0, 1
+
+# 1ターン分の (自分の手, 相手の手) を1文字で表す（5 × 5 = 25 通り）
+MOVE_CODES = "ABCDEFGHIJKLMNOPQRSTUVWXY"
+MOVE_INDEX = {code: divmod(i, len(ACTIONS)) for i, code in enumerate(MOVE_CODES)}
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tank_replays.txt")
+CORPUS_VERSION = 1
+
+class TankState(NamedTuple):
+    """対戦の局面（barrier は直前のターンにバリアを使ったか）"""
+    hp1: int = INITIAL_HP
+    charge1: int = 0
+    barrier1: bool = False
+    hp2: int = INITIAL_HP
+    charge2: int = 0
+    barrier2: bool = False
+    turn: int = 0
+
+    @property
+    def winner(self) -> int:
+        """0 = 続行中, 1 / 2 = そのプレイヤーの勝ち（同時にHPが0になることはない）"""
+        if self.hp2 <= 0:
+            return 1
+        if self.hp1 <= 0:
+            return 2
+        return 0
+
+    def side(self, player: int) -> Tuple[int, int, bool]:
+        """player (1 / 2) の (HP, チャージ, 直前にバリア)"""
+        return (self.hp1, self.charge1, self.barrier1) if player == 1 else (self.hp2, self.charge2, self.barrier2)
+
+INITIAL_STATE = TankState()
+
+@lru_cache(maxsize=None)
+def legal_actions(charge: int, barrier: bool) -> Tuple[int, ...]:
+    """選べるコマンド（バリアの連続使用不可・チャージ不足の発射不可）"""
+    return tuple(
+        a for a in range(len(ACTIONS))
+        if not (a == BARRIER and barrier) and not (a > CHARGE and a - 1 > charge)
+    )
+
+def step(state: TankState, action1: int, action2: int) -> TankState:
+    """1ターンを同時に解決した次の局面（合法手であることは呼び出し側で保証する）"""
+    power1 = action1 - 1 if action1 > CHARGE else 0
+    power2 = action2 - 1 if action2 > CHARGE else 0
+    hp1, hp2 = state.hp1, state.hp2
+
+    if action1 != BARRIER and action2 != BARRIER and power1 and power2:
+        # 両者が攻撃の場合、チャージの差分がダメージになる（同じなら相殺）
+        if power1 > power2:
+            hp2 -= power1 - power2
+        elif power2 > power1:
+            hp1 -= power2 - power1
+    else:
+        if action2 != BARRIER:
+            hp2 -= power1
+        if action1 != BARRIER:
+            hp1 -= power2
+
+    charge1 = min(state.charge1 + 1, MAX_CHARGE) if action1 == CHARGE else state.charge1 - power1
+    charge2 = min(state.charge2 + 1, MAX_CHARGE) if action2 == CHARGE else state.charge2 - power2
+    return TankState(hp1, charge1, action1 == BARRIER, hp2, charge2, action2 == BARRIER, state.turn + 1)
+
+# =============================
+# 対局の記録と再生
+# =============================
+Policy = Callable[[TankState, int, random.Random], int]  # (局面, 自分の番号 1 / 2, 乱数) -> コマンド番号
+
+def random_policy(state: TankState, player: int, rng: random.Random) -> int:
+    """合法手から一様に選ぶ"""
+    _, charge, barrier = state.side(player)
+    return rng.choice(legal_actions(charge, barrier))
+
+def aggressive_policy(state: TankState, player: int, rng: random.Random) -> int:
+    """溜まったら最大で撃ち、撃たれそうならときどきバリアを張る"""
+    _, charge, barrier = state.side(player)
+    _, opponent_charge, _ = state.side(3 - player)
+    if opponent_charge >= 2 and not barrier and rng.random() < 0.5:
+        return BARRIER
+    if charge >= 2 and rng.random() < 0.8:
+        return 1 + charge
+    return CHARGE
+
+POLICIES: Dict[str, Policy] = {"random": random_policy, "aggressive": aggressive_policy}
+
+class GameRecord(NamedTuple):
+    moves: str         # 1ターン1文字のコマンド列（MOVE_CODES）
+    final: TankState   # 再生後に一致すべき最終局面
+
+def encode_move(action1: int, action2: int) -> str:
+    return MOVE_CODES[action1 * len(ACTIONS) + action2]
+
+def replay(moves: str, state: TankState = INITIAL_STATE) -> TankState:
+    """コマンド列を再生した最終局面（不正なコマンドや決着後の手があれば ValueError）"""
+    for code in moves:
+        if state.winner:
+            raise ValueError(f"ターン{state.turn + 1}: 決着後のコマンドです")
+        try:
+            action1, action2 = MOVE_INDEX[code]
+        except KeyError:
+            raise ValueError(f"ターン{state.turn + 1}: 不明なコード {code!r}") from None
+        if action1 not in legal_actions(state.charge1, state.barrier1) \
+                or action2 not in legal_actions(state.charge2, state.barrier2):
+            raise ValueError(f"ターン{state.turn + 1}: 選べないコマンド {ACTIONS[action1]} / {ACTIONS[action2]}")
+        state = step(state, action1, action2)
+    return state
+
+def play(policy1: Policy, policy2: Policy, seed: int, max_turns: int = MAX_TURNS) -> GameRecord:
+    """seed から決まる1局を最後まで進めて記録する"""
+    rng = random.Random(seed)
+    state = INITIAL_STATE
+    moves = []
+    while not state.winner and state.turn < max_turns:
+        action1, action2 = policy1(state, 1, rng), policy2(state, 2, rng)
+        moves.append(encode_move(action1, action2))
+        state = step(state, action1, action2)
+    return GameRecord("".join(moves), state)
+
+# =============================
+# 回帰用の対局集（ルールを変えたら verify_corpus が食い違いを報告する）
+# =============================
+def build_corpus(games: int = 3000, seed: int = 0) -> List[GameRecord]:
+    """方針の組み合わせを順番に回して games 局を記録する"""
+    pairs = [(a, b) for a in POLICIES for b in POLICIES]
+    return [
+        play(POLICIES[pairs[g % len(pairs)][0]], POLICIES[pairs[g % len(pairs)][1]], seed * 1_000_003 + g)
+        for g in range(games)
+    ]
+
+def write_corpus(records: List[GameRecord], path: str = CORPUS_PATH):
+    """1行1局: コマンド列と最終局面（HP1 チャージ1 HP2 チャージ2 ターン数）"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"# tank-replays v{CORPUS_VERSION} hp={INITIAL_HP} charge={MAX_CHARGE}\n")
+        for record in records:
+            final = record.final
+            f.write(f"{record.moves} {final.hp1} {final.charge1} {final.hp2} {final.charge2} {final.turn}\n")
+
+def load_corpus(path: str = CORPUS_PATH) -> List[GameRecord]:
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            moves, hp1, charge1, hp2, charge2, turn = line.split()
+            last1, last2 = MOVE_INDEX[moves[-1]] if moves else (CHARGE, CHARGE)
+            records.append(GameRecord(moves, TankState(
+                int(hp1), int(charge1), last1 == BARRIER, int(hp2), int(charge2), last2 == BARRIER, int(turn)
+            )))
+    return records
+
+def verify_corpus(path: str = CORPUS_PATH) -> Dict[str, object]:
+    """全局を再生して記録と食い違った局を返す"""
+    records = load_corpus(path)
+    start = time.perf_counter()
+    mismatches = []
+    for i, record in enumerate(records):
+        try:
+            final = replay(record.moves)
+        except ValueError as e:
+            mismatches.append((i, str(e)))
+            continue
+        if final != record.final:
+            mismatches.append((i, f"期待 {tuple(record.final)} / 実際 {tuple(final)}"))
+    return {
+        "games": len(records),
+        "turns": sum(len(record.moves) for record in records),
+        "mismatches": mismatches,
+        "seconds": time.perf_counter() - start,
+    }
+
+# テスト
+def test_replay_corpus(path: str = CORPUS_PATH):
+    """記録した全局が1秒以内に再生でき、最終局面がすべて一致すること"""
+    result = verify_corpus(path)
+    assert result["games"] >= 1000, result["games"]
+    assert not result["mismatches"], result["mismatches"][:5]
+    assert result["seconds"] < 1.0, result["seconds"]
+
+    # 同じ seed からは同じ記録ができる
+    assert play(random_policy, aggressive_policy, seed=42) == play(random_policy, aggressive_policy, seed=42)
+    # ルールを1つ変えると食い違いが見つかる（回帰検出の確認）
+    broken = [record._replace(final=record.final._replace(hp1=record.final.hp1 + 1)) for record in load_corpus(path)[:10]]
+    assert all(replay(record.moves) != record.final for record in broken)
+    print(f"✅ 対局記録の再生テスト完了: {result['games']}局 / {result['turns']}ターン / {result['seconds'] * 1000:.0f}ms")
+
+def benchmark_engine(turns: int = 1_000_000) -> Dict[str, float]:
+    """step の1秒あたりのターン数（ランダム対局を進め続ける）"""
+    rng = random.Random(0)
+    state = INITIAL_STATE
+    start = time.perf_counter()
+    for _ in range(turns):
+        if state.winner:
+            state = INITIAL_STATE
+        state = step(state, random_policy(state, 1, rng), random_policy(state, 2, rng))
+    seconds = time.perf_counter() - start
+    return {"turns": turns, "seconds": seconds, "turns_per_second": turns / seconds}
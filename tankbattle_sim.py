@@ -0,0 +1,280 @@
+# tankbattle_sim.py
+# ミニ戦車バトルのバランス検証用シミュレーター（NumPyで大量の対局を配列としてまとめて進める）
+#
+# 例:
+#   from tankbattle_sim import SimSettings, simulate, random_policy, greedy_policy
+#   simulate(random_policy, greedy_policy, SimSettings(initial_hp=8), games=1_000_000)
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from tankbattle import GAME_SETTINGS, Player, resolve_turn
+
+# コマンド番号: 0 = バリア, 1 = チャージ, 1 + k = kチャージ発射
+BARRIER, CHARGE = 0, 1
+DRAW = 0  # winner 配列の値（1 / 2 はそのプレイヤーの勝ち）
+
+@dataclass(frozen=True)
+class SimSettings:
+    """シミュレーションするルール（既定値は GAME_SETTINGS と resolve_turn のまま）"""
+    initial_hp: int = GAME_SETTINGS["INITIAL_HP"]
+    max_charge: int = GAME_SETTINGS["MAX_CHARGE"]
+    bonus_damage: bool = False  # True なら calculate_damage の「チャージ量×20%」ボーナスを使う
+    max_turns: int = 200        # これを超えたら引き分け
+
+    @property
+    def action_count(self) -> int:
+        return 2 + self.max_charge
+
+    def damage_table(self) -> np.ndarray:
+        """kチャージ発射のダメージ（添字 k、0 は攻撃なし）"""
+        powers = np.arange(self.max_charge + 1)
+        if self.bonus_damage:
+            return np.array([k + round(k * 0.2) if k else 0 for k in powers], dtype=np.int16)
+        return powers.astype(np.int16)
+
+class Side:
+    """片方のプレイヤーの状態（続いている対局分の配列）"""
+
+    def __init__(self, games: int, settings: SimSettings):
+        self.hp = np.full(games, settings.initial_hp, dtype=np.int16)
+        self.charge = np.zeros(games, dtype=np.int16)
+        self.barrier = np.zeros(games, dtype=bool)  # 直前のターンにバリアを使ったか
+
+    def take(self, index: np.ndarray) -> "Side":
+        side = Side.__new__(Side)
+        side.hp, side.charge, side.barrier = self.hp[index], self.charge[index], self.barrier[index]
+        return side
+
+def legal_mask(side: Side, settings: SimSettings) -> np.ndarray:
+    """(対局数, コマンド数) の合法手マスク（バリアの連続使用不可・チャージ不足の発射不可）"""
+    mask = np.ones((len(side.hp), settings.action_count), dtype=bool)
+    mask[:, BARRIER] = ~side.barrier
+    for k in range(1, settings.max_charge + 1):
+        mask[:, 1 + k] = side.charge >= k
+    return mask
+
+def step(first: Side, second: Side, first_actions: np.ndarray, second_actions: np.ndarray,
+         settings: SimSettings, damage: Optional[np.ndarray] = None):
+    """1ターン分を resolve_turn と同じ規則で同時に解決する（配列をその場で更新）"""
+    if damage is None:
+        damage = settings.damage_table()
+    first_power = np.where(first_actions > CHARGE, first_actions - 1, 0)
+    second_power = np.where(second_actions > CHARGE, second_actions - 1, 0)
+    first_damage, second_damage = damage[first_power], damage[second_power]
+    first_blocked = first_actions == BARRIER
+    second_blocked = second_actions == BARRIER
+
+    # 両者が発射したら差分だけが通る。それ以外はバリアで防がれない発射がそのまま通る
+    clash = ~first_blocked & ~second_blocked & (first_power > 0) & (second_power > 0)
+    to_second = np.where(clash, np.maximum(first_damage - second_damage, 0),
+                         np.where(~second_blocked, first_damage, 0))
+    to_first = np.where(clash, np.maximum(second_damage - first_damage, 0),
+                        np.where(~first_blocked, second_damage, 0))
+    first.hp -= to_first
+    second.hp -= to_second
+
+    for side, actions, power in ((first, first_actions, first_power), (second, second_actions, second_power)):
+        side.charge = np.where(actions == CHARGE, np.minimum(side.charge + 1, settings.max_charge),
+                               side.charge - power).astype(np.int16)
+        side.barrier = actions == BARRIER
+
+# =============================
+# プレイヤーの方針（policy(me, opponent, settings, rng) -> コマンド番号の配列）
+# =============================
+Policy = Callable[[Side, Side, SimSettings, np.random.Generator], np.ndarray]
+
+def random_policy(me: Side, opponent: Side, settings: SimSettings, rng: np.random.Generator) -> np.ndarray:
+    """合法手から一様に選ぶ"""
+    mask = legal_mask(me, settings)
+    scores = rng.random(mask.shape, dtype=np.float32) * mask
+    return scores.argmax(axis=1).astype(np.int8)
+
+def greedy_policy(me: Side, opponent: Side, settings: SimSettings, rng: np.random.Generator) -> np.ndarray:
+    """満タンまでチャージして最大火力で撃つ。相手が満タンならバリアで受ける"""
+    full = me.charge >= settings.max_charge
+    actions = np.where(full, 1 + settings.max_charge, CHARGE)
+    defend = (opponent.charge >= settings.max_charge) & ~me.barrier & ~full
+    return np.where(defend, BARRIER, actions).astype(np.int8)
+
+def strategy_table_policy() -> Policy:
+    """tankbattle_ai の均衡戦略（既定ルールのときだけ使える）"""
+    from tankbattle_ai import ACTIONS, MAX_CHARGE, MAX_HP, PROBABILITY_SCALE, SIDE_STATES, get_strategy_table
+
+    cumulative = np.frombuffer(get_strategy_table().cumulative, dtype=np.uint16).reshape(-1, len(ACTIONS))
+
+    def side_index(side: Side) -> np.ndarray:
+        return ((np.clip(side.hp, 1, MAX_HP) - 1) * (MAX_CHARGE + 1) + side.charge) * 2 + side.barrier
+
+    def policy(me: Side, opponent: Side, settings: SimSettings, rng: np.random.Generator) -> np.ndarray:
+        if (settings.initial_hp, settings.max_charge, settings.bonus_damage) != (MAX_HP, MAX_CHARGE, False):
+            raise ValueError("均衡戦略の表は既定ルール専用です")
+        rows = cumulative[side_index(me) * SIDE_STATES + side_index(opponent)]
+        threshold = rng.integers(0, PROBABILITY_SCALE, size=len(me.hp))
+        return (threshold[:, None] >= rows).sum(axis=1).astype(np.int8)
+
+    return policy
+
+# =============================
+# シミュレーション
+# =============================
+def run_games(first_policy: Policy, second_policy: Policy, settings: SimSettings = SimSettings(),
+              games: int = 100_000, seed: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    games 局を並列に最後まで進める
+    戻り値: winner（0=引き分け, 1, 2）と turns（決着までのターン数）の配列
+    """
+    rng = np.random.default_rng(seed)
+    damage = settings.damage_table()
+    first, second = Side(games, settings), Side(games, settings)
+    winner = np.zeros(games, dtype=np.int8)
+    turns = np.full(games, settings.max_turns, dtype=np.int16)
+    active = np.arange(games)  # first / second の各行が何局目か（決着した対局は詰めて取り除く）
+
+    for turn in range(1, settings.max_turns + 1):
+        if not len(active):
+            break
+        first_actions = first_policy(first, second, settings, rng)
+        second_actions = second_policy(second, first, settings, rng)
+        step(first, second, first_actions, second_actions, settings, damage)
+
+        first_dead, second_dead = first.hp <= 0, second.hp <= 0
+        finished = first_dead | second_dead
+        if finished.any():
+            winner[active[second_dead & ~first_dead]] = 1
+            winner[active[first_dead & ~second_dead]] = 2
+            turns[active[finished]] = turn
+            running = ~finished
+            first, second, active = first.take(running), second.take(running), active[running]
+
+    return {"winner": winner, "turns": turns}
+
+def simulate(first_policy: Policy, second_policy: Policy, settings: SimSettings = SimSettings(),
+             games: int = 1_000_000, seed: Optional[int] = None) -> Dict[str, object]:
+    """
+    勝率・ターン数の分布・席の有利不利をまとめる
+    同時手番なので「先手」は席（player1）を指し、first_advantage は player1 と player2 の勝率差
+    """
+    start = time.perf_counter()
+    result = run_games(first_policy, second_policy, settings, games, seed)
+    seconds = time.perf_counter() - start
+    winner, turns = result["winner"], result["turns"]
+    decided = turns[winner != DRAW]
+    first_win = float(np.mean(winner == 1))
+    second_win = float(np.mean(winner == 2))
+    return {
+        "games": games,
+        "first_win": first_win,
+        "second_win": second_win,
+        "draw": float(np.mean(winner == DRAW)),
+        "first_advantage": first_win - second_win,
+        "turns_mean": float(decided.mean()) if len(decided) else 0.0,
+        "turns_percentiles": {p: int(np.percentile(decided, p)) for p in (10, 50, 90, 99)} if len(decided) else {},
+        "turns_histogram": np.bincount(turns, minlength=settings.max_turns + 1)[1:].tolist(),
+        "seconds": seconds,
+        "games_per_second": games / seconds,
+    }
+
+def compare_settings(candidates: List[SimSettings], policy: Policy = random_policy,
+                     games: int = 1_000_000, seed: int = 0) -> List[Dict[str, object]]:
+    """ルール案ごとに同じ方針同士で対戦させて並べる"""
+    rows = []
+    for settings in candidates:
+        report = simulate(policy, policy, settings, games, seed)
+        report.pop("turns_histogram")
+        rows.append({"settings": settings, **report})
+    return rows
+
+# テスト
+def test_parity_with_resolve_turn(games: int = 2000, seed: int = 1):
+    """全局面×全合法手の組、およびランダム対局の全ターンで resolve_turn と一致すること"""
+    settings = SimSettings()
+    names = ["barrier", "charge"] + [f"shoot{k}" for k in range(1, settings.max_charge + 1)]
+
+    # 1. 1ターンの結果を全状態・全コマンドの組で比較する
+    cases = []
+    for hp1 in range(1, settings.initial_hp + 1):
+        for hp2 in range(1, settings.initial_hp + 1):
+            for c1 in range(settings.max_charge + 1):
+                for c2 in range(settings.max_charge + 1):
+                    for a1 in range(settings.action_count):
+                        for a2 in range(settings.action_count):
+                            if max(a1 - 1, 0) <= c1 and max(a2 - 1, 0) <= c2:
+                                cases.append((hp1, c1, a1, hp2, c2, a2))
+    cases = np.array(cases, dtype=np.int16)
+    first, second = Side(len(cases), settings), Side(len(cases), settings)
+    first.hp[:], first.charge[:] = cases[:, 0], cases[:, 1]
+    second.hp[:], second.charge[:] = cases[:, 3], cases[:, 4]
+    step(first, second, cases[:, 2], cases[:, 5], settings)
+    p1, p2 = Player(None), Player(None)
+    for i, (hp1, c1, a1, hp2, c2, a2) in enumerate(cases.tolist()):
+        p1.hp, p1.charge, p1.choice = hp1, c1, names[a1]
+        p2.hp, p2.charge, p2.choice = hp2, c2, names[a2]
+        resolve_turn(p1, p2)
+        assert (first.hp[i], first.charge[i], second.hp[i], second.charge[i]) == (p1.hp, p1.charge, p2.hp, p2.charge), \
+            (hp1, c1, names[a1], hp2, c2, names[a2])
+
+    # 2. ランダム対局をコマンド列ごと記録し、resolve_turn で再生して勝者とターン数を比べる
+    rng = np.random.default_rng(seed)
+    history = []
+
+    def recording(policy):
+        def wrapped(me, opponent, settings_, rng_):
+            actions = policy(me, opponent, settings_, rng_)
+            history.append(actions)
+            return actions
+        return wrapped
+
+    first_policy = recording(random_policy)
+    second_policy = recording(random_policy)
+    first, second = Side(games, settings), Side(games, settings)
+    winner = np.zeros(games, dtype=np.int8)
+    turns = np.zeros(games, dtype=np.int16)
+    for turn in range(1, settings.max_turns + 1):
+        running = winner == DRAW
+        if not running.any():
+            break
+        first_actions = first_policy(first, second, settings, rng)
+        second_actions = second_policy(second, first, settings, rng)
+        # 決着済みの対局は状態を凍結する
+        hp = (first.hp.copy(), second.hp.copy())
+        step(first, second, first_actions, second_actions, settings)
+        first.hp[~running], second.hp[~running] = hp[0][~running], hp[1][~running]
+        winner[running & (second.hp <= 0)] = 1
+        winner[running & (first.hp <= 0)] = 2
+        turns[running & (winner != DRAW)] = turn
+
+    for g in range(min(games, 500)):
+        p1, p2 = Player(None), Player(None)
+        expected_winner, expected_turns = DRAW, 0
+        for turn in range(len(history) // 2):
+            p1.choice, p2.choice = names[history[2 * turn][g]], names[history[2 * turn + 1][g]]
+            resolve_turn(p1, p2)
+            if p1.hp <= 0 or p2.hp <= 0:
+                expected_winner, expected_turns = (1 if p2.hp <= 0 else 2), turn + 1
+                break
+        assert (winner[g], turns[g]) == (expected_winner, expected_turns), g
+
+    # 3. run_games も同じ結果の分布になる（同じ方針同士なら席の差はほぼない）
+    report = simulate(random_policy, random_policy, settings, games=200_000, seed=seed)
+    assert abs(report["first_advantage"]) < 0.01
+
+def benchmark_simulator(games: int = 1_000_000) -> Dict[str, Dict[str, float]]:
+    """方針の組み合わせごとの処理速度と結果（百万局単位）"""
+    policies = {"random": random_policy, "greedy": greedy_policy, "table": strategy_table_policy()}
+    results = {}
+    for first_name, second_name in (("random", "random"), ("greedy", "random"), ("table", "greedy"),
+                                    ("table", "table")):
+        report = simulate(policies[first_name], policies[second_name], games=games, seed=0)
+        results[f"{first_name}_vs_{second_name}"] = {
+            key: report[key] for key in ("first_win", "second_win", "draw", "turns_mean", "seconds", "games_per_second")
+        }
+    for bonus in (False, True):
+        report = simulate(random_policy, random_policy, SimSettings(bonus_damage=bonus), games=games, seed=0)
+        results[f"random_bonus_{bonus}"] = {
+            key: report[key] for key in ("first_win", "second_win", "draw", "turns_mean", "seconds")
+        }
+    return results
@@ -0,0 +1,388 @@
+# tankbattle_tournament.py
+# ミニ戦車バトルのトーナメント（シングル / ダブルイリミネーション）
+# 試合は依存関係のグラフとして持ち、両方の勝ち上がり元が決まった試合からすぐに始める
+
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+TOURNAMENT_SETTINGS = {
+    "MAX_ENTRANTS": 64,
+    "MIN_ENTRANTS": 2,
+    "JOIN_TIMEOUT": 180,
+    "MATCH_TIMEOUT": 900,  # 1試合の上限（超えたら抽選で決着）
+    "BOARD_RECENT": 8,     # 結果ボードに載せる直近の試合数
+}
+
+FORMATS = {
+    "single": "シングルイリミネーション",
+    "double": "ダブルイリミネーション",
+}
+
+# 枠の状態
+PENDING = object()  # まだ勝ち上がり元の試合が終わっていない
+BYE = object()      # 不戦（相手なし）
+
+# 試合の状態
+WAITING, PLAYING, DONE = "waiting", "playing", "done"
+
+def display_name(entrant) -> str:
+    if entrant is BYE:
+        return "BYE"
+    if entrant is PENDING:
+        return "?"
+    return getattr(entrant, "display_name", str(entrant))
+
+def seed_order(size: int) -> List[int]:
+    """size 人（2の累乗）の組み合わせ順（1位と2位が決勝まで当たらない標準の並び）"""
+    order = [1]
+    while len(order) < size:
+        n = len(order) * 2
+        order = [seed for s in order for seed in (s, n + 1 - s)]
+    return order
+
+class Match:
+    def __init__(self, match_id: int, stage: str, round_no: int, label: str):
+        self.match_id = match_id
+        self.stage = stage          # "W"（勝者側）/ "L"（敗者側）/ "GF"（グランドファイナル）
+        self.round_no = round_no
+        self.label = label
+        self.slots = [PENDING, PENDING]
+        self.dependents: List[Tuple["Match", int, str]] = []  # (送り先の試合, 枠, "winner" / "loser")
+        self.state = WAITING
+        self.winner = PENDING
+        self.loser = PENDING
+        self.note = ""              # 不戦勝・抽選などの注記
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def feed(self, target: "Match", slot: int, kind: str = "winner"):
+        self.dependents.append((target, slot, kind))
+
+    @property
+    def ready(self) -> bool:
+        return self.state == WAITING and all(slot is not PENDING for slot in self.slots)
+
+    @property
+    def needs_play(self) -> bool:
+        return all(slot is not BYE for slot in self.slots)
+
+    def describe(self) -> str:
+        a, b = (display_name(slot) for slot in self.slots)
+        if self.state == DONE:
+            result = f"{a} vs {b} → 🏆 {display_name(self.winner)}"
+            return f"{result}（{self.note}）" if self.note else result
+        if self.state == PLAYING:
+            return f"{a} vs {b} ⚔️ 対戦中"
+        return f"{a} vs {b}"
+
+class Bracket:
+    """トーナメント表（試合の依存グラフ）"""
+
+    def __init__(self, entrants: list, fmt: str = "single"):
+        if fmt not in FORMATS:
+            raise ValueError(f"不明な形式です: {fmt}")
+        if not TOURNAMENT_SETTINGS["MIN_ENTRANTS"] <= len(entrants) <= TOURNAMENT_SETTINGS["MAX_ENTRANTS"]:
+            raise ValueError(
+                f"参加者は{TOURNAMENT_SETTINGS['MIN_ENTRANTS']}〜{TOURNAMENT_SETTINGS['MAX_ENTRANTS']}人です"
+            )
+        self.fmt = fmt
+        self.entrants = list(entrants)
+        self.matches: List[Match] = []
+        self.final: Optional[Match] = None
+        self.champion = PENDING
+        self.size = 1 << (len(entrants) - 1).bit_length()
+
+        winners_rounds = self._build_winners_bracket()
+        if fmt == "double":
+            self._build_losers_bracket(winners_rounds)
+        else:
+            self.final = winners_rounds[-1][0]
+
+    def _new_match(self, stage: str, round_no: int, label: str) -> Match:
+        match = Match(len(self.matches), stage, round_no, label)
+        self.matches.append(match)
+        return match
+
+    def _build_winners_bracket(self) -> List[List[Match]]:
+        seeds = [self.entrants[seed - 1] if seed <= len(self.entrants) else BYE for seed in seed_order(self.size)]
+        rounds = []
+        previous = None
+        round_no = 1
+        while previous is None or len(previous) > 1:
+            count = self.size // (2 ** round_no)
+            label = "決勝" if count == 1 and self.fmt == "single" else f"{'勝者側' if self.fmt == 'double' else ''}{round_no}回戦"
+            current = [self._new_match("W", round_no, label) for _ in range(count)]
+            for i, match in enumerate(current):
+                if previous is None:
+                    match.slots = [seeds[2 * i], seeds[2 * i + 1]]
+                else:
+                    previous[2 * i].feed(match, 0)
+                    previous[2 * i + 1].feed(match, 1)
+            rounds.append(current)
+            previous = current
+            round_no += 1
+        return rounds
+
+    def _build_losers_bracket(self, winners_rounds: List[List[Match]]):
+        """
+        敗者側: 1回戦は勝者側1回戦の敗者同士、偶数回戦は敗者側の勝者と勝者側の次の回の敗者、
+        奇数回戦は敗者側の勝者同士。最後に勝者側の優勝者とグランドファイナル
+        """
+        k = len(winners_rounds)
+        losers_champion_source: Tuple[Match, str]
+        if k == 1:
+            losers_champion_source = (winners_rounds[0][0], "loser")
+        else:
+            current = []
+            first = winners_rounds[0]
+            for i in range(len(first) // 2):
+                match = self._new_match("L", 1, "敗者側1回戦")
+                first[2 * i].feed(match, 0, "loser")
+                first[2 * i + 1].feed(match, 1, "loser")
+                current.append(match)
+            round_no = 1
+            for j in range(1, k):
+                # 勝者側 j+1 回戦の敗者が合流（再戦を避けるため回ごとに逆順にする）
+                dropping = winners_rounds[j] if j % 2 else list(reversed(winners_rounds[j]))
+                round_no += 1
+                merged = []
+                for i, (survivor, dropped) in enumerate(zip(current, dropping)):
+                    match = self._new_match("L", round_no, f"敗者側{round_no}回戦")
+                    survivor.feed(match, 0)
+                    dropped.feed(match, 1, "loser")
+                    merged.append(match)
+                current = merged
+                if len(current) > 1:
+                    round_no += 1
+                    paired = []
+                    for i in range(len(current) // 2):
+                        match = self._new_match("L", round_no, f"敗者側{round_no}回戦")
+                        current[2 * i].feed(match, 0)
+                        current[2 * i + 1].feed(match, 1)
+                        paired.append(match)
+                    current = paired
+            losers_champion_source = (current[0], "winner")
+
+        grand_final = self._new_match("GF", 1, "グランドファイナル")
+        winners_rounds[-1][0].feed(grand_final, 0)
+        source, kind = losers_champion_source
+        source.feed(grand_final, 1, kind)
+        self.final = grand_final
+
+    # =============================
+    # 進行
+    # =============================
+    def _resolve(self, match: Match, winner, note: str = ""):
+        match.state = DONE
+        match.finished_at = time.perf_counter()
+        match.winner = winner
+        match.loser = match.slots[1] if winner is match.slots[0] else match.slots[0]
+        match.note = note
+        for target, slot, kind in match.dependents:
+            target.slots[slot] = match.winner if kind == "winner" else match.loser
+
+        if match is self.final:
+            if match.stage == "GF" and match.round_no == 1 and winner is match.slots[1] and winner is not BYE \
+                    and match.slots[0] is not BYE:
+                # 敗者側から来た方が勝ったら、両者1敗同士でもう1試合（リセット）
+                reset = self._new_match("GF", 2, "グランドファイナル（リセット）")
+                reset.slots = list(match.slots)
+                self.final = reset
+            else:
+                self.champion = winner
+
+    def take_ready(self) -> List[Match]:
+        """
+        対戦できる試合を取り出して PLAYING にする
+        BYE を含む試合はその場で決着させ、連鎖して決まる試合も含めて調べる
+        """
+        playable = []
+        progressed = True
+        while progressed:
+            progressed = False
+            for match in self.matches:
+                if not match.ready:
+                    continue
+                progressed = True
+                if match.needs_play:
+                    match.state = PLAYING
+                    match.started_at = time.perf_counter()
+                    playable.append(match)
+                else:
+                    a, b = match.slots
+                    self._resolve(match, b if a is BYE else a, "不戦勝" if (a is BYE) != (b is BYE) else "")
+        return playable
+
+    def complete(self, match: Match, winner, note: str = "") -> List[Match]:
+        """試合結果を反映し、新しく対戦できるようになった試合を返す"""
+        if match.state != PLAYING or winner not in match.slots:
+            raise ValueError("この試合の結果ではありません")
+        self._resolve(match, winner, note)
+        return self.take_ready()
+
+    @property
+    def finished(self) -> bool:
+        return self.champion is not PENDING
+
+    def losses(self) -> Dict[int, int]:
+        """参加者（リスト上の位置）ごとの敗戦数"""
+        counts = {i: 0 for i in range(len(self.entrants))}
+        index = {id(entrant): i for i, entrant in enumerate(self.entrants)}
+        for match in self.matches:
+            if match.state == DONE and match.needs_play:
+                counts[index[id(match.loser)]] += 1
+        return counts
+
+    def render(self, title: str = "🏆 戦車トーナメント") -> str:
+        """結果ボード（Discordの2000文字に収まるよう、対戦中と直近の結果だけを載せる）"""
+        lines = [f"{title}（{FORMATS[self.fmt]} / {len(self.entrants)}人）"]
+        rounds: Dict[str, List[Match]] = {}
+        for match in self.matches:
+            rounds.setdefault(match.label, []).append(match)
+        progress = []
+        for label, matches in rounds.items():
+            done = sum(match.state == DONE for match in matches)
+            mark = "✅" if done == len(matches) else ("⚔️" if any(m.state == PLAYING for m in matches) else "⏳")
+            progress.append(f"{mark} {label} {done}/{len(matches)}")
+        lines.append(" / ".join(progress))
+
+        playing = [match for match in self.matches if match.state == PLAYING]
+        if playing:
+            lines.append("\n**対戦中**")
+            lines.extend(f"・{match.label}: {match.describe()}" for match in playing)
+        recent = sorted((m for m in self.matches if m.state == DONE and m.needs_play),
+                        key=lambda m: m.finished_at, reverse=True)[:TOURNAMENT_SETTINGS["BOARD_RECENT"]]
+        if recent:
+            lines.append("\n**直近の結果**")
+            lines.extend(f"・{match.label}: {match.describe()}" for match in recent)
+        if self.finished:
+            lines.append(f"\n🎉 優勝: **{display_name(self.champion)}**")
+
+        text = "\n".join(lines)
+        return text if len(text) <= 2000 else text[:1990] + "\n…"
+
+# =============================
+# 実行
+# =============================
+PlayMatch = Callable[[object, object], Awaitable[Optional[object]]]
+MatchErrorHandler = Callable[["Match", Exception], None]
+
+def print_match_error(match: "Match", error: Exception):
+    print(f"Error in tournament match {match.match_id}: {error}")
+
+class TournamentRunner:
+    """
+    ラウンドの区切りを待たず、対戦できるようになった試合から並行して進める
+    1試合がエラー・中断・時間切れになっても、抽選で決着させて全体は止めない
+    """
+
+    def __init__(self, bracket: Bracket, play_match: PlayMatch,
+                 on_update: Optional[Callable[[], Awaitable[None]]] = None,
+                 match_timeout: float = TOURNAMENT_SETTINGS["MATCH_TIMEOUT"],
+                 on_error: MatchErrorHandler = print_match_error):
+        self.bracket = bracket
+        self.play_match = play_match
+        self.on_update = on_update
+        self.match_timeout = match_timeout
+        self.on_error = on_error  # 試合中の例外の報告先（既定はログに出す。試合は抽選で決着させる）
+
+    async def _play(self, match: Match) -> Tuple[Match, object, str]:
+        a, b = match.slots
+        try:
+            winner = await asyncio.wait_for(self.play_match(a, b), timeout=self.match_timeout)
+        except asyncio.TimeoutError:
+            return match, random.choice(match.slots), "時間切れのため抽選"
+        except Exception as e:
+            self.on_error(match, e)
+            return match, random.choice(match.slots), "エラーのため抽選"
+        if winner not in match.slots:
+            return match, random.choice(match.slots), "中断のため抽選"
+        return match, winner, ""
+
+    async def _notify(self):
+        if self.on_update is None:
+            return
+        try:
+            await self.on_update()
+        except Exception as e:
+            print(f"Error updating tournament board: {e}")
+
+    async def run(self):
+        """優勝者を返す"""
+        pending = {asyncio.create_task(self._play(match)) for match in self.bracket.take_ready()}
+        await self._notify()
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                match, winner, note = task.result()
+                for ready in self.bracket.complete(match, winner, note):
+                    pending.add(asyncio.create_task(self._play(ready)))
+            await self._notify()
+        return self.bracket.champion
+
+# テスト
+def test_bracket(trials: int = 30):
+    class _Entrant:
+        def __init__(self, i: int):
+            self.display_name = f"P{i}"
+
+    rng = random.Random(0)
+
+    async def run(count: int, fmt: str, fail_rate: float = 0.0):
+        entrants = [_Entrant(i) for i in range(count)]
+        bracket = Bracket(entrants, fmt)
+        started = []
+        errors = []
+
+        async def play(a, b):
+            started.append(time.perf_counter())
+            await asyncio.sleep(rng.random() * 0.002)
+            if rng.random() < fail_rate:
+                raise RuntimeError("match crashed")
+            return a if rng.random() < 0.5 else b
+
+        runner = TournamentRunner(bracket, play, on_error=lambda match, e: errors.append(match))
+        champion = await runner.run()
+        assert bracket.finished and champion in entrants
+        # 落ちた試合は報告され、どれも抽選で決着している
+        assert len(errors) == sum(m.note == "エラーのため抽選" for m in bracket.matches)
+        assert all(m.note == "エラーのため抽選" for m in errors)
+        losses = bracket.losses()
+        limit = 1 if fmt == "single" else 2
+        assert all(n <= limit for n in losses.values())
+        # 優勝者だけが敗退の敗戦数に届かず、他は全員ちょうど敗退している
+        assert losses[entrants.index(champion)] <= limit - 1
+        assert sum(n == limit for n in losses.values()) == count - 1
+        return bracket
+
+    async def main():
+        for _ in range(trials):
+            for fmt in FORMATS:
+                for count in (2, 3, 5, 8, rng.randint(2, 64), 64):
+                    await run(count, fmt, fail_rate=0.1)
+
+        # 試合数: シングルは n-1、ダブルは 2n-2 か 2n-1
+        bracket = await run(64, "single")
+        assert sum(m.needs_play for m in bracket.matches) == 63
+        bracket = await run(64, "double")
+        played = sum(m.needs_play and m.state == DONE for m in bracket.matches)
+        assert played in (126, 127)
+        assert len(bracket.render()) <= 2000
+
+        # 遅い試合があっても、勝ち上がり元が終わった次の回戦は先に始まる
+        entrants = [_Entrant(i) for i in range(8)]
+        bracket = Bracket(entrants, "single")
+
+        async def play(a, b):
+            # 1回戦の第1試合（シード1位 vs 8位）だけ長引く
+            await asyncio.sleep(0.2 if (a, b) == (entrants[0], entrants[7]) else 0.01)
+            return a
+
+        await TournamentRunner(bracket, play).run()
+        slow, independent = bracket.matches[0], bracket.matches[5]  # 2回戦の第2試合は第1試合に依存しない
+        assert slow.dependents[0][0] is not independent
+        assert independent.started_at < slow.finished_at
+
+    asyncio.run(main())
@@ -4,15 +4,21 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import asyncio
+import json
 import os
 import random
+import time
 from dotenv import load_dotenv
 from collections import Counter
 from datetime import datetime, timedelta
-from typing import Dict, Set, List, Optional, Union, Tuple, FrozenSet
-from functools import lru_cache
+from typing import Dict, Set, List, NamedTuple, Optional, Union, Tuple
 from discord.ext import tasks
 
+from werewolf_engine import (
+    ROLE_PRESETS, WIN_MESSAGES, WOLF, WOLF_TEAM, GameState, deal_roles, fill_missing_actions,
+    first_night_seer_target, new_night_actions, night_actors, resolve_night, resolve_vote, seer_result, tally_votes,
+)
+
 # === 定数定義 ===
 VOTE_WARNING_TIME = 30  # 投票終了30秒前に警告
 VOTE_TIME = 180  # 投票時間3分
@@ -20,11 +26,25 @@ DISCUSSION_TIME = 300  # 議論時間5分
 NIGHT_TIME = 180  # 夜のアクション時間3分
 FIRST_NIGHT_TIME = 60  # 初日夜のアクション時間1分
 JOIN_TIMEOUT = 180  # 参加募集のタイムアウト時間3分
+VOTE_STATUS_DEBOUNCE = 5.0  # 投票状況メッセージを編集する最短間隔（秒）
+DM_CONCURRENCY = 4  # 同時に送るDMの上限
+
+# 進行中のゲームの保存（再起動後に再開する）
+SNAPSHOT_SETTINGS = {
+    "ENABLED": True,
+    "DIR": "werewolf_snapshots",  # 保存先（チャンネルごとに1ファイル）
+    "FSYNC": True,                # ディスクに書き切ってから置き換える
+    "WARN_MS": 5.0,               # これより遅い書き込みはログに出す
+    "ACTION_DELAY": 1.0,          # フェーズ中の行動はこの秒数ごとの1回の保存にまとめる
+    "MIN_RESUME_SECONDS": 30,     # 再開したフェーズに最低限残す時間
+}
+SNAPSHOT_VERSION = 1
 
 # フェーズの定数定義を追加
 PHASE_NIGHT = "night"    # 夜フェーズ
 PHASE_DAY = "day"       # 昼フェーズ（議論）
 PHASE_VOTE = "vote"     # 投票フェーズ
+PHASE_NAMES = {PHASE_NIGHT: "夜", PHASE_DAY: "議論", PHASE_VOTE: "投票"}
 
 # グローバル変数の定義
 werewolf_bot = None
@@ -46,7 +66,7 @@ class GameStats:
 
     def add_result(self, role: str, is_win: bool):
         """戦績を更新する"""
-        team = "人狼陣営" if role in ["人狼", "狂人"] else "村人陣営"
+        team = "人狼陣営" if role in WOLF_TEAM else "村人陣営"
         if is_win:
             self.stats[team]["wins"] += 1
         else:
@@ -69,36 +89,6 @@ class GameStats:
                 )
         return "\n".join(display) if display else "まだ対戦記録がありません"
 
-# =============================
-# 役職プリセットを改善（バランス調整）
-# =============================
-ROLE_PRESETS = {
-    4: [
-        ["村人", "村人", "占い師", "人狼"],  # 基本セット
-        ["村人", "占い師", "狂人", "人狼"],  # 狂人セット
-        ["村人", "騎士", "占い師", "人狼"],  # 騎士セット
-    ],
-    5: [
-        ["村人", "村人", "占い師", "狂人", "人狼"],  # 基本セット
-        ["村人", "騎士", "占い師", "狂人", "人狼"],  # 騎士セット
-        ["村人", "霊媒師", "占い師", "狂人", "人狼"],  # 霊媒師セット
-    ],
-    6: [
-        ["村人", "村人", "占い師", "騎士", "狂人", "人狼"],  # 基本セット
-        ["村人", "村人", "占い師", "霊媒師", "狂人", "人狼"],  # 霊媒師セット
-        ["村人", "騎士", "占い師", "霊媒師", "狂人", "人狼"],  # フルセット
-    ],
-    7: [
-        ["村人", "村人", "占い師", "騎士", "霊媒師", "狂人", "人狼"],  # 基本セット
-        ["村人", "村人", "占い師", "騎士", "狂人", "人狼", "人狼"],  # 人狼2セット
-        ["村人", "村人", "占い師", "霊媒師", "狂人", "人狼", "人狼"],  # 霊媒師セット
-    ],
-    8: [  # 8人用セットを追加
-        ["村人", "村人", "村人", "占い師", "騎士", "霊媒師", "狂人", "人狼"],  # バランスセット
-        ["村人", "村人", "占い師", "騎士", "霊媒師", "狂人", "人狼", "人狼"],  # 人狼2セット
-    ]
-}
-
 # 役職の説明文を改善（より詳細な説明）
 ROLE_DESCRIPTIONS = {
     "村人": "特別な能力は持ちませんが、話し合いで人狼を見つけ出しましょう。投票の際は、各プレイヤーの発言や行動を注意深く観察することが重要です。",
@@ -121,26 +111,169 @@ PHASE_TIMERS = {
 # =============================
 # 部屋（ルーム）データ構造
 # =============================
-# werewolf_rooms[channel_id] = {
-#   "role_set": [...],        # 選択された役職リスト
-#   "players": [...],         # 参加者のdiscord.Userオブジェクトリスト
-#   "role_map": {user_id: role},  # 役職割当てマップ
-#   "alive": set(user_id, ...),   # 生存者のID集合
-#   "dead": set(),                # 死亡者のID集合
-#   "phase": str,                 # "night" / "day" / "vote"
-#   "day_count": int,            # 経過日数（1日目から開始）
-#   "night_actions": {
-#       "werewolf_targets": [user_id, ...],  # 人狼が襲撃したID
-#       "seer_target": Optional[user_id],    # 占い師が占ったID
-#       "knight_target": Optional[user_id],  # 騎士が守ったID
-#       "medium_result": Optional[str],      # 霊媒結果
-#       "madman_info": Optional[str],        # 狂人が得た情報
-#   },
-#   "votes": {voter_id: target_id, ...},     # 投票マップ
-#   "vote_deadline": datetime,               # 投票期限
-#   "last_executed": Optional[user_id],      # 最後に処刑された人のID
-# }
-werewolf_rooms: dict[int, dict] = {}
+class WerewolfRoom(GameState):
+    """
+    1チャンネル分の人狼ゲームの状態
+    役職・生死・日数とルールの処理は GameState（werewolf_engine）が持ち、ここには Discord での進行に要るものだけを足す
+    """
+    __slots__ = (
+        "channel_id",       # チャンネルID
+        "role_set",         # 選択された役職リスト
+        "players",          # 参加者のdiscord.Userオブジェクトリスト
+        "members",          # ゲーム開始時に解決したプレイヤー情報 {user_id: PlayerInfo}
+        "phase",            # "night" / "day" / "vote"
+        "phase_deadline",   # 今のフェーズの締切（UNIX時刻）
+        "night_actions",    # {"werewolf_targets": [...], "seer_target", "knight_target", "medium_result", "madman_info"}
+        "night_pending",    # 今夜まだ行動していないプレイヤーのID集合
+        "votes",            # 投票マップ {voter_id: target_id}
+        "voted_players",    # 投票済みのID集合
+        "attacked_by_wolf", # 今夜襲撃を選んだ人狼のID集合
+        "used_seer",        # 今夜占った占い師のID集合
+        "used_knight",      # 今夜護衛した騎士のID集合
+        "last_executed",    # 最後に処刑された人のID
+        "started",          # ゲーム中か
+        "start_time",       # ゲーム開始時刻
+        "last_activity",    # 最後にフェーズが進んだ時刻
+        "vote_start_time",  # 投票フェーズの開始時刻
+        "vote_status",      # 投票状況メッセージ（VoteStatusMessage）
+        "machine",          # フェーズ進行（PhaseMachine）
+        "active_views",     # 今のフェーズのボタン（遷移時に止める）
+        "save_handle",      # まとめて保存する予定（save_room_soon）
+    )
+
+    def __init__(self, channel_id: int, role_set: list):
+        super().__init__()
+        self.channel_id = channel_id
+        self.role_set = role_set
+        self.players = []
+        self.members = {}
+        self.phase = None
+        self.phase_deadline = None
+        self.night_actions = new_night_actions()
+        self.night_pending = None
+        self.votes = {}
+        self.voted_players = set()
+        self.attacked_by_wolf = set()
+        self.used_seer = set()
+        self.used_knight = set()
+        self.last_executed = None
+        self.started = False
+        self.start_time = None
+        self.last_activity = None
+        self.vote_start_time = None
+        self.vote_status = None
+        self.machine = None
+        self.active_views = []
+        self.save_handle = None
+
+    def name(self, uid: int) -> str:
+        """プレイヤーの表示名（ゲーム開始時のもの）"""
+        return self.members[uid].name
+
+    def to_snapshot(self) -> dict:
+        """保存用の形（IDと名前と数値だけ。Discordのオブジェクトやタスクは含めない）"""
+        return {
+            "v": SNAPSHOT_VERSION,
+            "cid": self.channel_id,
+            "role_set": self.role_set,
+            "players": [[uid, member.name, self.role_map[uid]] for uid, member in self.members.items()],
+            "dead": list(self.dead),
+            "phase": self.phase,
+            "gen": current_generation(self),
+            "deadline": self.phase_deadline,
+            "day": self.day_count,
+            "night": self.night_actions,
+            "pending": None if self.night_pending is None else list(self.night_pending),
+            "votes": list(self.votes.items()),
+            "acted": [list(self.attacked_by_wolf), list(self.used_seer), list(self.used_knight)],
+            "last_executed": self.last_executed,
+            "start": self.start_time.timestamp() if self.start_time else None,
+            "vote_start": self.vote_start_time.timestamp() if self.vote_start_time else None,
+            "status_message": self.vote_status.message.id if self.vote_status else None,
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: dict) -> "WerewolfRoom":
+        """to_snapshot の逆（DM先は未解決。フェーズ進行は呼び出し側で作り直す）"""
+        room = cls(data["cid"], data["role_set"])
+        room.members = {uid: PlayerInfo(uid, name, f"<@{uid}>", None) for uid, name, _ in data["players"]}
+        room.players = list(room.members.values())
+        room.assign_roles({uid: role for uid, _, role in data["players"]})
+        for uid in data["dead"]:
+            room.kill(uid)
+        room.started = True
+        room.phase = data["phase"]
+        room.phase_deadline = data["deadline"]
+        room.day_count = data["day"]
+        room.night_actions = data["night"]
+        room.night_pending = None if data["pending"] is None else set(data["pending"])
+        room.votes = {voter: target for voter, target in data["votes"]}
+        room.voted_players = set(room.votes)
+        room.attacked_by_wolf, room.used_seer, room.used_knight = (set(ids) for ids in data["acted"])
+        room.last_executed = data["last_executed"]
+        room.start_time = datetime.fromtimestamp(data["start"]) if data["start"] else datetime.now()
+        room.vote_start_time = datetime.fromtimestamp(data["vote_start"]) if data["vote_start"] else None
+        room.last_activity = datetime.now()
+        return room
+
+class PlayerInfo(NamedTuple):
+    """ゲーム開始時に1度だけ解決したプレイヤーの情報（ゲーム中はキャッシュを引き直さない）"""
+    id: int
+    name: str                                 # 表示名
+    mention: str                              # <@id>
+    dm: Optional[discord.abc.Messageable]     # DMの送り先（取得できなかった人は None）
+
+    async def send(self, **kwargs):
+        """DMを送る（送り先がない人は PlayerNotFoundError）"""
+        if self.dm is None:
+            raise PlayerNotFoundError(f"プレイヤー(ID: {self.id})が見つかりません")
+        return await self.dm.send(**kwargs)
+
+    @classmethod
+    def from_user(cls, user: discord.abc.User) -> "PlayerInfo":
+        return cls(user.id, user.display_name, user.mention, user)
+
+    @classmethod
+    def unknown(cls, uid: int) -> "PlayerInfo":
+        return cls(uid, f"ID:{uid}", f"<@{uid}>", None)
+
+async def snapshot_members(channel: discord.abc.GuildChannel, players: list[Union[discord.abc.User, int]]) -> dict[int, PlayerInfo]:
+    """
+    参加者の表示名・メンション・DM先を1度だけ解決する
+    ユーザーオブジェクトはそのまま使い、IDだけの人はキャッシュ → サーバーへのまとめての問い合わせ → 個別取得の順に探す
+    """
+    guild = getattr(channel, "guild", None)
+    users: dict[int, discord.abc.User] = {}
+    missing = []
+    for player in players:
+        if not isinstance(player, int):
+            users[player.id] = player
+            continue
+        user = (guild.get_member(player) if guild else None) or werewolf_bot.get_user(player)
+        if user is None:
+            missing.append(player)
+        else:
+            users[player] = user
+
+    # キャッシュにいない人は100人ずつまとめて問い合わせる
+    if missing and guild is not None:
+        for i in range(0, len(missing), 100):
+            try:
+                for member in await guild.query_members(user_ids=missing[i:i + 100], cache=True):
+                    users[member.id] = member
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                print(f"メンバー取得エラー: {e}")
+    still_missing = [uid for uid in missing if uid not in users]
+    if still_missing:
+        fetched = await asyncio.gather(*(werewolf_bot.fetch_user(uid) for uid in still_missing), return_exceptions=True)
+        for uid, user in zip(still_missing, fetched):
+            if not isinstance(user, BaseException):
+                users[uid] = user
+
+    ids = [player if isinstance(player, int) else player.id for player in players]
+    return {uid: PlayerInfo.from_user(users[uid]) if uid in users else PlayerInfo.unknown(uid) for uid in ids}
+
+werewolf_rooms: dict[int, WerewolfRoom] = {}
 
 # === エラーメッセージ定数 ===
 ERROR_MESSAGES = {
@@ -154,6 +287,8 @@ ERROR_MESSAGES = {
     "game_in_progress": "⚠️ このチャンネルではすでにゲームが進行中です。",
     "no_game_in_progress": "⚠️ このチャンネルでは人狼ゲームが進行していません。",
     "not_player": "⚠️ このゲームの参加者ではありません。",
+    "phase_over": "⚠️ このフェーズの受付は終了しました。",
+    "phase_failed": "❌ フェーズの進行中にエラーが発生したため、ゲームを中断しました。`/じんろう` で新しいゲームを始めてください。",
 }
 
 def setup_werewolf(bot: commands.Bot):
@@ -163,6 +298,9 @@ def setup_werewolf(bot: commands.Bot):
     global werewolf_bot
     werewolf_bot = bot
 
+    # ゲーム中のボタン（再起動前に送ったものも含めて custom_id で部屋に振り分ける）
+    bot.add_dynamic_items(WolfKillButton, SeerCheckButton, KnightProtectButton, VoteButton, PhaseSkipButton)
+
     # エラーハンドリング付きのコマンド実行
     @bot.tree.error
     async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
@@ -198,14 +336,14 @@ def setup_werewolf(bot: commands.Bot):
         
         for channel_id, room in werewolf_rooms.items():
             # 最後のアクティビティから30分以上経過したゲームを終了
-            if "last_activity" in room:
-                inactive_time = (current_time - room["last_activity"]).total_seconds()
+            if room.last_activity is not None:
+                inactive_time = (current_time - room.last_activity).total_seconds()
                 if inactive_time > 1800:  # 30分
                     inactive_channels.append(channel_id)
         
         # 非アクティブなゲームを削除
         for channel_id in inactive_channels:
-            del werewolf_rooms[channel_id]
+            close_room(channel_id)
 
     # 定期的なクリーンアップタスク
     @tasks.loop(minutes=15)
@@ -214,12 +352,18 @@ def setup_werewolf(bot: commands.Bot):
         cleanup_inactive_games()
 
     # === イベントリスナー定義 ===
-    @bot.event
-    async def on_ready():
+    async def start_on_ready():
+        """コマンドの同期、放置されたゲームのクリーンアップ開始、再起動前に進行中だったゲームの再開"""
         await bot.tree.sync()
         print(f"{bot.user} 起動完了")
         # クリーンアップタスクを開始
-        cleanup_task.start()
+        if not cleanup_task.is_running():
+            cleanup_task.start()
+        resumed = await resume_saved_games()
+        if resumed:
+            print(f"人狼ゲームを{resumed}件再開しました")
+
+    bot.add_listener(start_on_ready, "on_ready")
 
     # === コマンド定義 ===
     @bot.tree.command(name="じんろう", description="人狼ゲームを始めます")
@@ -283,38 +427,28 @@ def setup_werewolf(bot: commands.Bot):
     @bot.tree.command(name="じんろう中断", description="進行中の人狼ゲームを中断します")
     async def cancel_game(interaction: discord.Interaction):
         # 進行中のゲームを探す
-        channel_rooms = [room for room in werewolf_rooms.values() if room["channel"].id == interaction.channel.id]
-        if not channel_rooms:
+        room = werewolf_rooms.get(interaction.channel.id)
+        if not room:
             await interaction.response.send_message("⚠️ このチャンネルで進行中のゲームはありません。", ephemeral=True)
             return
 
-        room = channel_rooms[0]
         # 参加者かどうかチェック
-        if not any(p.user.id == interaction.user.id for p in room["players"]):
+        if not any(p.id == interaction.user.id for p in room.players):
             await interaction.response.send_message("⚠️ このゲームの参加者ではありません。", ephemeral=True)
             return
 
-        # ゲームを中断
-        room["started"] = False
-        
-        # アクティブなビューを全て停止
-        if hasattr(room, "active_views"):
-            for view in room.get("active_views", []):
-                if not view.is_finished():
-                    view.stop()
+        # ゲームを中断（フェーズ進行とアクティブなビューを全て停止）
+        room.started = False
+        close_room(interaction.channel.id)
         
         # メッセージを送信
         await interaction.response.send_message("🛑 人狼ゲームを中断しました。")
-        
-        # 部屋情報を削除
-        room_id = next(k for k, v in werewolf_rooms.items() if v is room)
-        del werewolf_rooms[room_id]
 
     @bot.tree.command(name="じんろうリセット", description="人狼ゲームを強制終了し、部屋情報をクリアします")
     async def reset_werewolf(interaction: discord.Interaction):
         cid = interaction.channel.id
         if cid in werewolf_rooms:
-            del werewolf_rooms[cid]
+            close_room(cid)
             await interaction.response.send_message("🔄 部屋をリセットしました。人狼ゲームを強制終了しました。", ephemeral=False)
         else:
             await interaction.response.send_message("❌ このチャンネルでは進行中の人狼ゲームがありません。", ephemeral=True)
@@ -384,15 +518,15 @@ class JoinView(discord.ui.View):
             return
 
         # 参加者が0人の場合は部屋を削除
-        if len(room["players"]) == 0:
+        if len(room.players) == 0:
             del werewolf_rooms[self.channel_id]
             await channel.send("⏰ 参加者が集まらなかったため、募集を終了します。")
             return
 
         # 参加者が揃っていない場合は部屋を削除
-        if len(room["players"]) < len(room["role_set"]):
-            player_count = len(room["players"])
-            needed_count = len(room["role_set"])
+        if len(room.players) < len(room.role_set):
+            player_count = len(room.players)
+            needed_count = len(room.role_set)
             del werewolf_rooms[self.channel_id]
             await channel.send(f"⏰ 制限時間（3分）が経過しました。（{player_count}/{needed_count}人）\n募集を終了します。")
             return
@@ -407,25 +541,25 @@ class JoinView(discord.ui.View):
                 return
 
             # 参加済みチェック
-            if interaction.user.id in [u.id for u in room["players"]]:
+            if interaction.user.id in [u.id for u in room.players]:
                 await interaction.response.send_message("⚠️ すでに参加しています。", ephemeral=True)
                 return
 
             # 定員チェック
-            if len(room["players"]) >= len(room["role_set"]):
+            if len(room.players) >= len(room.role_set):
                 await interaction.response.send_message("⚠️ 定員に達しています。", ephemeral=True)
                 return
 
             # 参加者リストに追加
-            room["players"].append(interaction.user)
-            remaining = len(room["role_set"]) - len(room["players"])
+            room.players.append(interaction.user)
+            remaining = len(room.role_set) - len(room.players)
             
             try:
                 # 参加メッセージを送信
                 if remaining > 0:
                     await interaction.response.send_message(
                         f"✅ {interaction.user.mention} が参加しました！\n"
-                        f"あと{remaining}人必要です。（制限時間: 残り約{int(JOIN_TIMEOUT - len(room['players']) * 10)}秒）", 
+                        f"あと{remaining}人必要です。（制限時間: 残り約{int(JOIN_TIMEOUT - len(room.players) * 10)}秒）", 
                         ephemeral=False
                     )
                 else:
@@ -442,7 +576,7 @@ class JoinView(discord.ui.View):
                 )
 
             # 参加者数が役職数と揃ったら、役職配布 → 夜フェーズへ
-            if len(room["players"]) == len(room["role_set"]):
+            if len(room.players) == len(room.role_set):
                 await asyncio.sleep(1)
                 await send_roles_and_start(cid)
 
@@ -463,24 +597,285 @@ class JoinView(discord.ui.View):
 # =============================
 # フェーズ処理のヘルパー関数群
 # =============================
-@lru_cache(maxsize=128)
-def check_win_condition_cached(alive_players: FrozenSet[int], wolf_players: FrozenSet[int]) -> Tuple[str, str]:
-    """勝利条件のチェック（キャッシュ付き）"""
-    wolf_count = len(wolf_players & alive_players)
-    villager_count = len(alive_players) - wolf_count
-    
-    if wolf_count == 0:
-        return "villagers", "人狼が全滅したため、村人陣営の勝利です！"
-    elif wolf_count >= villager_count:
-        return "werewolves", "人狼が村人の数以上になったため、人狼陣営の勝利です！"
-    return "", ""
-
-def check_win_condition(room: dict) -> Tuple[str, str]:
-    """勝利条件のチェック（メインロジック）"""
-    # キャッシュ用にFrozenSetに変換
-    alive = frozenset(room["alive"])
-    wolves = frozenset(uid for uid, role in room["role_map"].items() if role == "人狼")
-    return check_win_condition_cached(alive, wolves)
+def check_win_condition(room: WerewolfRoom) -> Tuple[str, str]:
+    """勝利条件のチェック（生存者の数だけで決まる）"""
+    winner = room.winner()
+    return winner, WIN_MESSAGES.get(winner, "")
+
+# =============================
+# フェーズ進行（部屋ごとの状態機械）
+# =============================
+class PhaseMachine:
+    """
+    部屋ごとのフェーズ進行
+    タイマー・スキップボタン・全員の行動完了からの「今のフェーズを終える」要求をキューに入れ、1つのタスクが順番に遷移する
+    遷移のたびに世代番号が進むので、同じフェーズへの2つ目以降の要求や古いタイマー・ボタンは捨てられる
+    """
+
+    def __init__(self, cid: int, generation: int = 0):
+        self.cid = cid
+        self.generation = generation  # 今のフェーズの世代番号（再開時は保存した値から続ける）
+        self.transitions = 0  # 実行した遷移の数
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._closed = False
+        self._task = asyncio.create_task(self._run())
+
+    def request(self, generation: int, reason: str):
+        """generation のフェーズを終える要求（reason: "timeout" / "skip" / "complete"）"""
+        if generation == self.generation and not self._closed:
+            self.queue.put_nowait((generation, reason))
+
+    def enter(self, room: WerewolfRoom, phase: str, seconds: float):
+        """新しいフェーズに入り、時間切れのタイマーを1つだけ掛ける"""
+        room.phase = phase
+        room.phase_deadline = time.time() + seconds
+        self._cancel_timer()
+        self._timer = asyncio.get_running_loop().call_later(seconds, self.request, self.generation, "timeout")
+
+    def close(self):
+        """ゲーム終了・中断時に止める"""
+        self._closed = True
+        self._cancel_timer()
+        self.queue.put_nowait((None, "close"))  # 待機中のタスクを起こして終わらせる
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def _run(self):
+        while True:
+            generation, reason = await self.queue.get()
+            if self._closed:
+                return
+            if generation != self.generation:
+                continue
+            room = werewolf_rooms.get(self.cid)
+            if room is None:
+                return
+
+            # ここから先に来た同じフェーズへの要求はすべて古い世代になる
+            self.generation += 1
+            self._cancel_timer()
+            for view in room.active_views:
+                if not view.is_finished():
+                    view.stop()
+            room.active_views = []
+            room.last_activity = datetime.now()
+            try:
+                await PHASE_TRANSITIONS[room.phase](self.cid, reason)
+                self.transitions += 1
+            except Exception as e:
+                # 途中まで進んだ遷移はやり直せない（襲撃や処刑が二重になる）ので、止まった部屋を残さず中断する
+                print(f"フェーズ進行エラー: {e}")
+                await abort_room(self.cid)
+                return
+            # ゲームが続いていれば遷移後の状態を保存する（終了時は close_room が消している）
+            if werewolf_rooms.get(self.cid) is room:
+                save_room(room)
+
+def current_generation(room: Optional[WerewolfRoom]) -> int:
+    """部屋の今のフェーズの世代番号（ゲームが始まっていなければ -1）"""
+    machine = room.machine if room else None
+    return machine.generation if machine else -1
+
+def request_phase_end(room: WerewolfRoom, reason: str):
+    """今のフェーズを終える要求を出す"""
+    machine = room.machine
+    if machine is not None:
+        machine.request(machine.generation, reason)
+
+def close_room(cid: int) -> Optional[WerewolfRoom]:
+    """部屋を片付ける（フェーズ進行と残っているビューを止める）"""
+    room = werewolf_rooms.pop(cid, None)
+    if room is None:
+        return None
+    if room.save_handle is not None:
+        room.save_handle.cancel()
+        room.save_handle = None
+    delete_room_snapshot(cid)
+    machine = room.machine
+    if machine is not None:
+        machine.close()
+    for view in room.active_views:
+        if not view.is_finished():
+            view.stop()
+    return room
+
+async def abort_room(cid: int):
+    """進行できなくなった部屋を片付け、チャンネルに知らせる"""
+    close_room(cid)
+    channel = werewolf_bot.get_channel(cid) if werewolf_bot else None
+    if channel is None:
+        return
+    try:
+        await channel.send(ERROR_MESSAGES["phase_failed"])
+    except discord.HTTPException as e:
+        print(f"中断の通知に失敗しました: {e}")
+
+# =============================
+# 進行中のゲームの保存と再開
+# =============================
+snapshot_timings = {"writes": 0, "total_ms": 0.0, "max_ms": 0.0}
+
+def snapshot_path(cid: int) -> str:
+    return os.path.join(SNAPSHOT_SETTINGS["DIR"], f"{cid}.json")
+
+def save_room(room: WerewolfRoom) -> Optional[float]:
+    """
+    部屋の状態をアトミックに書き出し、かかった時間（ミリ秒）を返す
+    一時ファイルに書いてから置き換えるので、途中で落ちても前の状態か新しい状態のどちらかが必ず残る
+    """
+    if room.save_handle is not None:
+        room.save_handle.cancel()  # 予定していた保存もこの書き込みに含まれる
+        room.save_handle = None
+    if not SNAPSHOT_SETTINGS["ENABLED"]:
+        return None
+    start = time.perf_counter()
+    path = snapshot_path(room.channel_id)
+    tmp_path = path + ".tmp"
+    try:
+        data = json.dumps(room.to_snapshot(), ensure_ascii=False, separators=(",", ":"))
+        os.makedirs(SNAPSHOT_SETTINGS["DIR"], exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+            if SNAPSHOT_SETTINGS["FSYNC"]:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"ゲーム保存エラー(チャンネル: {room.channel_id}): {e}")
+        return None
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    snapshot_timings["writes"] += 1
+    snapshot_timings["total_ms"] += elapsed_ms
+    snapshot_timings["max_ms"] = max(snapshot_timings["max_ms"], elapsed_ms)
+    if elapsed_ms > SNAPSHOT_SETTINGS["WARN_MS"]:
+        print(f"ゲーム保存が遅延しました(チャンネル: {room.channel_id}): {elapsed_ms:.1f}ms")
+    return elapsed_ms
+
+def save_room_soon(room: WerewolfRoom):
+    """フェーズ中の行動の保存（続けて来た行動は ACTION_DELAY 秒ごとの1回の書き込みにまとめる）"""
+    if room.save_handle is None and SNAPSHOT_SETTINGS["ENABLED"]:
+        room.save_handle = asyncio.get_running_loop().call_later(
+            SNAPSHOT_SETTINGS["ACTION_DELAY"], _save_if_active, room
+        )
+
+def _save_if_active(room: WerewolfRoom):
+    room.save_handle = None
+    if werewolf_rooms.get(room.channel_id) is room:
+        save_room(room)
+
+def delete_room_snapshot(cid: int):
+    try:
+        os.remove(snapshot_path(cid))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"ゲーム保存の削除エラー(チャンネル: {cid}): {e}")
+
+def load_room_snapshots() -> list[dict]:
+    """保存されているゲームを読み込む（壊れたもの・古い形式のものは飛ばす）"""
+    directory = SNAPSHOT_SETTINGS["DIR"]
+    if not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, filename), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"ゲーム保存の読み込みエラー({filename}): {e}")
+            continue
+        if data.get("v") == SNAPSHOT_VERSION:
+            snapshots.append(data)
+    return snapshots
+
+async def resume_saved_games() -> int:
+    """
+    起動時に保存されたゲームを再開する
+    ボタンは custom_id に部屋と世代番号を持つので、再起動前に送ったボタンもそのまま使える
+    """
+    resumed = 0
+    for data in load_room_snapshots():
+        cid = data["cid"]
+        channel = werewolf_bot.get_channel(cid)
+        if channel is None:
+            delete_room_snapshot(cid)
+            continue
+        if cid in werewolf_rooms:
+            continue
+        try:
+            room = WerewolfRoom.from_snapshot(data)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"ゲーム再開エラー(チャンネル: {cid}): {e}")
+            continue
+
+        # DM先を解決し直す（取得できなかった人は保存した名前のまま）
+        resolved = await snapshot_members(channel, list(room.members))
+        for uid, member in resolved.items():
+            if member.dm is not None:
+                room.members[uid] = member
+        room.players = list(room.members.values())
+
+        werewolf_rooms[cid] = room
+        room.machine = PhaseMachine(cid, data["gen"])
+        remaining = (room.phase_deadline or 0) - time.time()
+        room.machine.enter(room, room.phase, max(remaining, SNAPSHOT_SETTINGS["MIN_RESUME_SECONDS"]))
+        view = PhaseSkipView(cid)  # 通知を送っている間に古いボタンで世代が進んでも、このフェーズのボタンにする
+        room.active_views.append(view)
+        resumed += 1
+
+        await channel.send(
+            f"🔄 ボットが再起動したため、{room.day_count}日目の{PHASE_NAMES.get(room.phase, room.phase)}から再開します。\n"
+            f"再起動前に届いたボタンはそのまま使えます（締切: <t:{int(room.phase_deadline)}:R>）。"
+        )
+        if room.phase == PHASE_VOTE:
+            # 再起動前の投票状況メッセージがあれば、それを引き続き編集する
+            message = None
+            if data.get("status_message"):
+                try:
+                    message = await channel.fetch_message(data["status_message"])
+                except discord.HTTPException:
+                    pass
+            if message is None:
+                await post_vote_status(room, channel)
+            else:
+                room.vote_status = VoteStatusMessage(message)
+                room.vote_status.update(vote_status_text(room))
+        await channel.send("⏩ 全員の準備が整ったら、次のフェーズへスキップできます：", view=view)
+        if room.phase == PHASE_NIGHT and not room.night_pending:
+            request_phase_end(room, "complete")
+        save_room(room)
+    return resumed
+
+async def end_night(cid: int, reason: str):
+    """夜 → 朝（議論）"""
+    room = werewolf_rooms[cid]
+    if reason == "timeout":
+        await fill_missing_night_actions(room, cid)
+    await process_night_results(cid)
+
+async def end_discussion(cid: int, reason: str):
+    """議論 → 投票"""
+    await start_voting_phase(cid)
+
+async def end_vote(cid: int, reason: str):
+    """投票 → 処刑 → 夜またはゲーム終了"""
+    if reason == "timeout":
+        channel = werewolf_bot.get_channel(cid)
+        await channel.send("⏰ 投票時間が終了しました。")
+    await process_vote_results(cid)
+
+PHASE_TRANSITIONS = {
+    PHASE_NIGHT: end_night,
+    PHASE_DAY: end_discussion,
+    PHASE_VOTE: end_vote,
+}
 
 async def process_night_results(cid: int):
     """夜フェーズの結果を処理"""
@@ -489,44 +884,34 @@ async def process_night_results(cid: int):
     if not room:
         return
 
+    room.night_pending = None
+
     # アクション履歴をリセット
-    room["voted_players"] = set()
-    room["attacked_by_wolf"] = set()
-    room["used_seer"] = set()
-    room["used_knight"] = set()
-    room.setdefault("active_views", [])
+    room.voted_players = set()
+    room.attacked_by_wolf = set()
+    room.used_seer = set()
+    room.used_knight = set()
 
     # 初日の夜は最低待機時間を設ける
-    if room["day_count"] == 1:
+    first_night = room.day_count == 1
+    if first_night:
         await asyncio.sleep(1)  # 初日は1秒だけ待機
 
-    # 騎士の護衛を処理
-    protected_id = room["night_actions"].get("knight_target")
-    
-    # 襲撃処理（騎士に守られていない場合のみ）
-    killed_ids = room["night_actions"]["werewolf_targets"][:]
-    unique_killed = set(killed_ids)
-    actually_killed = set()
-    
-    for victim_id in unique_killed:
-        if victim_id != protected_id and victim_id in room["alive"]:
-            room["alive"].remove(victim_id)
-            room["dead"].add(victim_id)
-            actually_killed.add(victim_id)
+    # 襲撃処理（騎士に守られていない場合のみ）。夜が明けて日数が進む
+    actually_killed = resolve_night(room, room.night_actions)
 
     # 朝の通知
-    if room["day_count"] == 1:
+    if first_night:
         await channel.send("🌅 初日の朝になりました。昨夜は襲撃がありませんでした。")
     else:
         if actually_killed:
-            killed_mentions = "、".join(f"{werewolf_bot.get_user(uid).display_name}" for uid in actually_killed)
+            killed_mentions = "、".join(room.name(uid) for uid in actually_killed)
             await channel.send(f"🌅 朝になりました。昨夜、{killed_mentions} が襲撃されました。")
         else:
             await channel.send("🌅 朝になりました。昨夜の襲撃は失敗したようです。")
 
     # 次のフェーズへ
-    room["phase"] = PHASE_DAY
-    room["day_count"] = room.get("day_count", 1) + 1
+    room.machine.enter(room, PHASE_DAY, PHASE_TIMERS["discussion"])
     
     # 議論フェーズの説明
     await channel.send(
@@ -538,69 +923,9 @@ async def process_night_results(cid: int):
 
     # 新しいフェーズスキップボタンを表示
     skip_view = PhaseSkipView(cid)
-    room["active_views"].append(skip_view)  # アクティブなビューを記録
+    room.active_views.append(skip_view)  # アクティブなビューを記録
     await channel.send("⏩ 議論が終わったら、次のフェーズへスキップできます：", view=skip_view)
 
-async def process_day_results(cid: int):
-    """昼フェーズの投票結果を集計し、吊るし処理 → 勝敗判定 → 夜へ移行または終了。"""
-    room = werewolf_rooms.get(cid)
-    channel = werewolf_bot.get_channel(cid)
-    if not room:
-        return
-
-    vote_map = room.get("votes", {})
-    target_id, count, vote_details = get_vote_results(vote_map, room)
-    
-    # 投票結果を表示
-    if channel and vote_details:
-        await send_vote_results(channel, vote_details)
-    
-    if target_id is None:
-        # 投票なし→ランダム吊り
-        if room["alive"]:
-            chosen = random.choice(list(room["alive"]))
-            room["alive"].remove(chosen)
-            room["dead"].add(chosen)
-            chosen_name = werewolf_bot.get_user(chosen).display_name
-            await channel.send(f"🔨 誰も投票しなかったため、ランダムで {chosen_name} を吊りました。")
-    else:
-        if target_id in room["alive"]:
-            room["alive"].remove(target_id)
-            room["dead"].add(target_id)
-            target_name = werewolf_bot.get_user(target_id).display_name
-            # 同数得票の場合はその旨を表示
-            max_voted = [uid for uid, v_count in Counter(vote_map.values()).items() if v_count == count]
-            if len(max_voted) > 1:
-                await channel.send(f"🔨 同数得票のため、ランダムで {target_name} が選ばれ、{count} 票で吊られました。")
-            else:
-                await channel.send(f"🔨 投票の結果、{target_name} に {count} 票が入り、吊られました。")
-
-    # 勝敗判定
-    winner, message = check_win_condition(room)
-    if winner:
-        await channel.send(message)
-        await show_game_summary(cid)
-        del werewolf_rooms[cid]
-        return
-
-    # 次の夜へ
-    room["phase"] = PHASE_NIGHT
-    room["night_actions"] = {
-        "werewolf_targets": [],
-        "seer_target": None,
-        "knight_target": None,
-        "medium_result": None,
-        "madman_info": None
-    }
-    await channel.send("🌙 夜になります。各役職は DM を確認してください。")
-
-    # 夜アクションの送信
-    await send_night_actions(cid)
-
-    # 新しいフェーズスキップボタンを表示
-    view = PhaseSkipView(cid)
-    await channel.send("⏩ 全員の準備が整ったら、次のフェーズへスキップできます：", view=view)
-
 async def start_voting_phase(cid: int):
     """投票フェーズを開始する（UI改善版）"""
     room = werewolf_rooms.get(cid)
@@ -609,10 +934,10 @@ async def start_voting_phase(cid: int):
         return
 
     # フェーズを投票フェーズに変更
-    room["phase"] = PHASE_VOTE
-    room["votes"] = {}
-    room["voted_players"] = set()
-    room["vote_start_time"] = datetime.now()
+    room.machine.enter(room, PHASE_VOTE, PHASE_TIMERS["vote"])
+    room.votes = {}
+    room.voted_players = set()
+    room.vote_start_time = datetime.now()
 
     # 投票フェーズの開始を通知（改善版）
     embed = discord.Embed(
@@ -633,64 +958,100 @@ async def start_voting_phase(cid: int):
     )
     embed.add_field(
         name="📊 現在の生存者",
-        value=str(len(room["alive"])) + "人",
+        value=str(len(room.alive)) + "人",
         inline=True
     )
     
     await channel.send(embed=embed)
 
-    # 生存者のみに投票ボタンを表示（DMで）
-    for user_id in room["alive"]:
-        user = werewolf_bot.get_user(user_id)
-        if user:
-            view = VoteView(cid)
-            # 生存者のみをボタンとして追加（自分以外）
-            for target_id in room["alive"]:
-                if target_id != user_id:
-                    target_user = werewolf_bot.get_user(target_id)
-                    if target_user:
-                        view.add_item(VoteButton(target_user))
-            try:
-                await user.send(
-                    "👇 投票する相手を選んでください。\n"
-                    "投票は1回限りで変更できません。慎重に選択してください。",
-                    view=view
-                )
-            except discord.Forbidden:
-                # DMが送れない場合はチャンネルでメンション付きで表示
-                await channel.send(f"<@{user_id}> 投票する相手を選んでください：", view=view)
-
-    # 投票状況の定期更新タスクを開始
-    asyncio.create_task(update_vote_status(cid))
+    # 生存者のみに投票ボタンを表示（DMで全員に同時に送る）
+    deliveries = []
+    for user_id in room.alive:
+        member = room.members[user_id]
+        view = VoteView(cid)
+        room.active_views.append(view)
+        # 生存者のみをボタンとして追加（自分以外）
+        for target_id in room.alive:
+            if target_id != user_id:
+                view.add_item(VoteButton(cid, view.generation, target_id, room.name(target_id)))
+        deliveries.append((
+            member,
+            [{"content": "👇 投票する相手を選んでください。\n"
+                         "投票は1回限りで変更できません。慎重に選択してください。", "view": view}],
+            # DMが送れない場合はチャンネルでメンション付きで表示
+            {"content": f"{member.mention} 投票する相手を選んでください：", "view": view}
+        ))
+    await fan_out_dms(channel, deliveries)
+
+    # 投票状況メッセージ（フェーズ中はこの1通を編集して更新する）
+    await post_vote_status(room, channel)
 
     # 新しいフェーズスキップボタンを表示
     skip_view = PhaseSkipView(cid)
-    room["active_views"].append(skip_view)
+    room.active_views.append(skip_view)
     await channel.send("⏩ 全員の投票が完了したら、次のフェーズへスキップできます：", view=skip_view)
 
-async def update_vote_status(cid: int):
-    """投票状況を定期的に更新（30秒ごと）"""
-    room = werewolf_rooms.get(cid)
-    channel = werewolf_bot.get_channel(cid)
-    if not room:
-        return
+async def post_vote_status(room: WerewolfRoom, channel: discord.TextChannel):
+    """投票状況メッセージを送ってピン留めする"""
+    message = await channel.send(vote_status_text(room))
+    try:
+        await message.pin()
+    except discord.HTTPException:
+        pass  # ピン留めの権限がなくても編集での更新は続ける
+    room.vote_status = VoteStatusMessage(message)
 
-    while room["phase"] == PHASE_VOTE:
-        # 残り時間を計算
-        elapsed = datetime.now() - room["vote_start_time"]
-        remaining = PHASE_TIMERS["vote"] - int(elapsed.total_seconds())
-        
-        if remaining <= 0:
-            # タイムアウト処理
-            await process_vote_results(cid)
-            break
-        
-        # 投票状況を更新
-        status = get_vote_status_display(room)
-        status += f"\n\n⏰ 残り時間: {remaining // 60}分{remaining % 60}秒"
-        
-        await channel.send(status)
-        await asyncio.sleep(30)  # 30秒待機
+def vote_status_text(room: WerewolfRoom) -> str:
+    """投票状況メッセージの本文（締切はDiscordの相対時刻表示なので、残り時間のための編集は要らない）"""
+    status = get_vote_status_display(room)
+    return status + f"\n\n⏰ 締切: <t:{int(room.phase_deadline)}:R>"
+
+class VoteStatusMessage:
+    """
+    投票フェーズごとに1つだけ送る投票状況メッセージ（以降は編集で更新する）
+    投票が続けて入っても編集は debounce 秒に1回まで。間の状態は飛ばして最新の内容だけを反映する
+    """
+
+    def __init__(self, message: discord.Message, debounce: float = VOTE_STATUS_DEBOUNCE):
+        self.message = message
+        self.debounce = debounce
+        self.pending: Optional[str] = None  # まだ反映していない最新の内容
+        self.edits = 0
+        self._last_edit = float("-inf")
+        self._task: Optional[asyncio.Task] = None
+
+    def update(self, content: str):
+        self.pending = content
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        loop = asyncio.get_running_loop()
+        while self.pending is not None:
+            delay = self._last_edit + self.debounce - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            content, self.pending = self.pending, None
+            try:
+                await self.message.edit(content=content)
+            except discord.HTTPException as e:
+                print(f"投票状況の更新エラー: {e}")
+            self._last_edit = loop.time()
+            self.edits += 1
+
+    async def close(self, content: str):
+        """締切の内容を反映してピン留めを外す"""
+        self.update(content)
+        await self._task
+        try:
+            await self.message.unpin()
+        except discord.HTTPException:
+            pass
+
+async def close_vote_status(room: WerewolfRoom):
+    """投票フェーズの状況メッセージを締め切る（既に締め切っていれば何もしない）"""
+    board, room.vote_status = room.vote_status, None
+    if board is not None:
+        await board.close(get_vote_status_display(room) + "\n\n🔒 投票は締め切られました")
 
 async def process_vote_results(cid: int):
     """投票結果を処理し、次のフェーズへ移行する"""
@@ -699,50 +1060,36 @@ async def process_vote_results(cid: int):
     if not room:
         return
 
-    vote_map = room.get("votes", {})
-    target_id, count, vote_details = get_vote_results(vote_map, room)
-    
+    await close_vote_status(room)
+
     # 投票結果を表示
-    if channel and vote_details:
-        await send_vote_results(channel, vote_details)
-    
-    if target_id is None:
-        # 投票なし→ランダム吊り
-        if room["alive"]:
-            chosen = random.choice(list(room["alive"]))
-            room["alive"].remove(chosen)
-            room["dead"].add(chosen)
-            chosen_name = werewolf_bot.get_user(chosen).display_name
-            await channel.send(f"🔨 誰も投票しなかったため、ランダムで {chosen_name} を吊りました。")
-    else:
-        if target_id in room["alive"]:
-            room["alive"].remove(target_id)
-            room["dead"].add(target_id)
-            target_name = werewolf_bot.get_user(target_id).display_name
+    if channel and room.votes:
+        await send_vote_results(channel, format_vote_details(room, room.votes))
+
+    outcome = resolve_vote(room, room.votes, random)
+    if outcome.executed is not None:
+        target_name = room.name(outcome.executed)
+        if outcome.random_hang:
+            # 投票なし→ランダム吊り
+            await channel.send(f"🔨 誰も投票しなかったため、ランダムで {target_name} を吊りました。")
+        elif len(outcome.tied) > 1:
             # 同数得票の場合はその旨を表示
-            max_voted = [uid for uid, v_count in Counter(vote_map.values()).items() if v_count == count]
-            if len(max_voted) > 1:
-                await channel.send(f"🔨 同数得票のため、ランダムで {target_name} が選ばれ、{count} 票で吊られました。")
-            else:
-                await channel.send(f"🔨 投票の結果、{target_name} に {count} 票が入り、吊られました。")
+            await channel.send(f"🔨 同数得票のため、ランダムで {target_name} が選ばれ、{outcome.votes} 票で吊られました。")
+        else:
+            await channel.send(f"🔨 投票の結果、{target_name} に {outcome.votes} 票が入り、吊られました。")
 
     # 勝敗判定
     winner, message = check_win_condition(room)
     if winner:
         await channel.send(message)
         await show_game_summary(cid)
-        del werewolf_rooms[cid]
+        close_room(cid)
         return
 
     # 次の夜へ
-    room["phase"] = PHASE_NIGHT
-    room["night_actions"] = {
-        "werewolf_targets": [],
-        "seer_target": None,
-        "knight_target": None,
-        "medium_result": None,
-        "madman_info": None
-    }
+    room.machine.enter(room, PHASE_NIGHT, PHASE_TIMERS["night"])
+    room.night_actions = new_night_actions()
+    begin_night(room)
     await channel.send("🌙 夜になります。各役職は DM を確認してください。")
 
     # 夜アクションの送信
@@ -750,6 +1097,7 @@ async def process_vote_results(cid: int):
 
     # 新しいフェーズスキップボタンを表示
     view = PhaseSkipView(cid)
+    room.active_views.append(view)
     await channel.send("⏩ 全員の準備が整ったら、次のフェーズへスキップできます：", view=view)
 
 async def show_game_summary(cid: int):
@@ -766,29 +1114,29 @@ async def show_game_summary(cid: int):
     is_werewolf_win = winner == "werewolves"
 
     # 戦績を更新
-    for user in room["players"]:
+    for user in room.players:
         uid = user.id
-        role = room["role_map"][uid]
-        is_werewolf_team = role in ["人狼", "狂人"]
+        role = room.role_map[uid]
+        is_werewolf_team = role in WOLF_TEAM
         is_win = (is_werewolf_win and is_werewolf_team) or (not is_werewolf_win and not is_werewolf_team)
         GameStats(uid).add_result(role, is_win)
 
     # サマリーを生成
     summary = [
         "📊 **ゲーム結果**",
-        f"🌅 経過日数: {room['day_count']}日",
-        f"⌛ 総プレイ時間: {int((datetime.now() - room['start_time']).total_seconds() // 60)}分\n"
+        f"🌅 経過日数: {room.day_count}日",
+        f"⌛ 総プレイ時間: {int((datetime.now() - room.start_time).total_seconds() // 60)}分\n"
     ]
 
     # 陣営ごとにプレイヤーを分類
     villagers = []
     wolves = []
-    for user in room["players"]:
+    for user in room.players:
         uid = user.id
-        role = room["role_map"][uid]
-        status = "💀" if uid in room["dead"] else "🏃"
-        player_info = f"{status} <@{uid}>: {role}"
-        if role in ["人狼", "狂人"]:
+        role = room.role_map[uid]
+        status = "💀" if uid in room.dead else "🏃"
+        player_info = f"{status} {room.members[uid].mention}: {role}"
+        if role in WOLF_TEAM:
             wolves.append(player_info)
         else:
             villagers.append(player_info)
@@ -802,181 +1150,119 @@ async def show_game_summary(cid: int):
 
     # 戦績を追加
     summary.append("\n**📈 プレイヤー戦績**")
-    for user in room["players"]:
+    for user in room.players:
         uid = user.id
         stats = GameStats(uid)
-        summary.append(f"\n<@{uid}> の戦績:\n{stats.get_stats_display()}")
+        summary.append(f"\n{room.members[uid].mention} の戦績:\n{stats.get_stats_display()}")
 
     await channel.send("\n".join(summary))
 
-async def wait_for_votes(cid: int):
+def begin_night(room: WerewolfRoom):
     """
-    投票の待機処理（1分）
+    夜の開始時に、行動が必要なプレイヤー（生存している人狼・騎士・未占いの占い師）を1度だけ数える
+    全員の行動が揃ったら（最初から誰もいなければすぐに）夜を終える要求を出す（初日は人狼・騎士の行動なし）
     """
-    room = werewolf_rooms.get(cid)
-    channel = werewolf_bot.get_channel(cid)
-    if not room:
+    pending = night_actors(room, room.night_actions)
+    room.night_pending = pending
+    if not pending:
+        request_phase_end(room, "complete")
+
+def mark_night_action(room: WerewolfRoom, uid: int):
+    """夜のアクションを受け付けたら呼ぶ（状態の保存を予約し、最後の1人で夜を終える要求を出す）"""
+    save_room_soon(room)
+    pending = room.night_pending
+    if not pending or uid not in pending:
         return
+    pending.discard(uid)
+    if not pending:
+        request_phase_end(room, "complete")
 
-    await asyncio.sleep(60)  # 1分待機
-
-    if room["phase"] == "day":  # まだ昼フェーズなら
-        await process_day_results(cid)
-
-async def wait_for_night_actions(cid: int):
-    """
-    夜フェーズで人狼・占い師のアクションが揃ったら朝処理を呼び出す
-    """
-    room = werewolf_rooms.get(cid)
-    if not room:
-        return
-
-    # 生存している人狼の数を数える
-    num_wolves = sum(1 for uid, role in room["role_map"].items() 
-                    if role == "人狼" and uid in room["alive"])
-
-    # 初日は人狼の襲撃なし
-    is_first_night = room["day_count"] == 1
-    if is_first_night:
-        room["night_actions"]["werewolf_targets"] = []  # 初日は襲撃なし
-
-    # アクションが揃うまで待機（初日は1分、それ以外は2分）
-    wait_time = FIRST_NIGHT_TIME if is_first_night else NIGHT_TIME
-    for _ in range(wait_time):
-        if room["phase"] != "night":  # 夜フェーズが終了していたら
-            return
-
-        w_targets = room["night_actions"]["werewolf_targets"]
-        s_target = room["night_actions"]["seer_target"]
-        
-        # 人狼の投票と占い師の占いが揃ったら（初日は人狼の投票は不要）
-        if (is_first_night or len(w_targets) >= num_wolves) and (
-            s_target is not None or  # 占い師の占い完了
-            not any(uid for uid, role in room["role_map"].items()  # または生存占い師なし
-                   if role == "占い師" and uid in room["alive"])
-        ):
-            await process_night_results(cid)
-            return
-        
-        await asyncio.sleep(1)
-
-    # タイムアウト処理
-    if room["phase"] == "night":
-        await handle_night_timeout(room, cid)
-
-async def handle_night_timeout(room: dict, cid: int):
-    """夜フェーズのタイムアウト処理"""
+async def fill_missing_night_actions(room: WerewolfRoom, cid: int):
+    """夜フェーズのタイムアウト処理（未選択の襲撃・占いをランダムに決める）"""
     channel = werewolf_bot.get_channel(cid)
     await channel.send("⏰ 時間切れです。未投票はランダムに決定されます。")
-    
-    is_first_night = room["day_count"] == 1
-    num_wolves = sum(1 for uid, role in room["role_map"].items() 
-                    if role == "人狼" and uid in room["alive"])
-
-    # 人狼の未投票をランダム決定（初日以外）
-    if not is_first_night and len(room["night_actions"]["werewolf_targets"]) < num_wolves:
-        alive_targets = [uid for uid in room["alive"] 
-                       if room["role_map"][uid] != "人狼"]
-        if alive_targets:
-            room["night_actions"]["werewolf_targets"].append(
-                random.choice(alive_targets)
-            )
-    
-    # 占い師の未投票をランダム決定
-    if room["night_actions"]["seer_target"] is None:
-        for uid, role in room["role_map"].items():
-            if role == "占い師" and uid in room["alive"]:
-                alive_targets = [tid for tid in room["alive"] if tid != uid]
-                if alive_targets:
-                    room["night_actions"]["seer_target"] = random.choice(alive_targets)
-                break
-    
-    await process_night_results(cid)
+    fill_missing_actions(room, room.night_actions, random)
 
 # =============================
 # ==== 夜フェーズ用 View / Button クラス ====
 # =============================
+# ボタンは custom_id（ww:種類:チャンネルID:世代番号:対象ID）から部屋を引く DynamicItem なので、
+# 再起動後に起動時の登録だけで古いメッセージのボタンも受け付けられる
+
+def disable_all(view: discord.ui.View):
+    """ビューのボタンをすべて無効化する（メッセージから復元したビューにも使える）"""
+    for child in view.children:
+        getattr(child, "item", child).disabled = True
 
 class WolfNightView(discord.ui.View):
     def __init__(self, cid: int, uid: int):
-        super().__init__(timeout=60)
+        super().__init__(timeout=None)  # 締切はフェーズ進行のタイマーが決める
         self.cid = cid
         self.user_id = uid
         room = werewolf_rooms.get(cid)
+        self.generation = current_generation(room)  # どの夜のボタンか
         if not room:
             return
-
-        # 襲撃済みプレイヤーのセットを初期化
-        if "attacked_by_wolf" not in room:
-            room["attacked_by_wolf"] = set()
+        room.active_views.append(self)
 
         # 生存プレイヤーのみを表示（自分以外）
-        for target_id in room["alive"]:
-            if target_id != uid and room["role_map"].get(target_id) != "人狼":
-                target_user = werewolf_bot.get_user(target_id)
-                if target_user:
-                    button = WolfKillButton(cid, target_user)
-                    # 既に襲撃済みの場合はボタンを無効化
-                    if uid in room.get("attacked_by_wolf", set()):
-                        button.disabled = True
-                    self.add_item(button)
+        for target_id in room.alive:
+            if target_id != uid and room.role_map.get(target_id) != "人狼":
+                # 既に襲撃済みの場合はボタンを無効化
+                self.add_item(WolfKillButton(cid, self.generation, target_id, f"襲撃: {room.name(target_id)}",
+                                   disabled=uid in room.attacked_by_wolf))
 
 class SeerNightView(discord.ui.View):
     def __init__(self, cid: int, uid: int):
-        super().__init__(timeout=60)
+        super().__init__(timeout=None)  # 締切はフェーズ進行のタイマーが決める
         self.cid = cid
         self.user_id = uid
         room = werewolf_rooms.get(cid)
+        self.generation = current_generation(room)  # どの夜のボタンか
         if not room:
             return
-
-        # 占い済みプレイヤーのセットを初期化
-        if "used_seer" not in room:
-            room["used_seer"] = set()
+        room.active_views.append(self)
 
         # 生存プレイヤーのみを表示（自分以外）
-        for target_id in room["alive"]:
+        for target_id in room.alive:
             if target_id != uid:
-                target_user = werewolf_bot.get_user(target_id)
-                if target_user:
-                    button = SeerCheckButton(cid, target_user)
-                    # 既に占い済みの場合はボタンを無効化
-                    if uid in room.get("used_seer", set()):
-                        button.disabled = True
-                    self.add_item(button)
+                # 既に占い済みの場合はボタンを無効化
+                self.add_item(SeerCheckButton(cid, self.generation, target_id, f"占う: {room.name(target_id)}",
+                                   disabled=uid in room.used_seer))
 
 class KnightNightView(discord.ui.View):
     def __init__(self, cid: int, uid: int):
-        super().__init__(timeout=60)
+        super().__init__(timeout=None)  # 締切はフェーズ進行のタイマーが決める
         self.cid = cid
         self.user_id = uid
         room = werewolf_rooms.get(cid)
+        self.generation = current_generation(room)  # どの夜のボタンか
         if not room:
             return
-
-        # 護衛済みプレイヤーのセットを初期化
-        if "used_knight" not in room:
-            room["used_knight"] = set()
+        room.active_views.append(self)
 
         # 生存プレイヤーのみを表示（自分以外）
-        for target_id in room["alive"]:
+        for target_id in room.alive:
             if target_id != uid:
-                target_user = werewolf_bot.get_user(target_id)
-                if target_user:
-                    button = KnightProtectButton(cid, target_user)
-                    # 既に護衛済みの場合はボタンを無効化
-                    if uid in room.get("used_knight", set()):
-                        button.disabled = True
-                    self.add_item(button)
-
-class WolfKillButton(discord.ui.Button):
-    def __init__(self, cid: int, target_user: discord.User):
-        super().__init__(
-            label=f"襲撃: {target_user.display_name}",
-            style=discord.ButtonStyle.danger
-        )
+                # 既に護衛済みの場合はボタンを無効化
+                self.add_item(KnightProtectButton(cid, self.generation, target_id, f"護衛: {room.name(target_id)}",
+                                   disabled=uid in room.used_knight))
+
+class WolfKillButton(discord.ui.DynamicItem[discord.ui.Button], template=r"ww:wolf:(?P<cid>\d+):(?P<gen>\d+):(?P<target>\d+)"):
+    def __init__(self, cid: int, generation: int, target_id: int, label: str, disabled: bool = False):
+        super().__init__(discord.ui.Button(
+            label=label,
+            style=discord.ButtonStyle.danger,
+            disabled=disabled,
+            custom_id=f"ww:wolf:{cid}:{generation}:{target_id}"
+        ))
         self.cid = cid
-        self.target_user = target_user
+        self.generation = generation
+        self.target_id = target_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(int(match["cid"]), int(match["gen"]), int(match["target"]), item.label)
 
     async def callback(self, interaction: discord.Interaction):
         uid = interaction.user.id
@@ -984,34 +1270,43 @@ class WolfKillButton(discord.ui.Button):
         if not room:
             await interaction.response.send_message("❌ この部屋は存在しません。", ephemeral=True)
             return
-        if room["role_map"].get(uid) != "人狼":
+        if room.role_map.get(uid) != "人狼":
             await interaction.response.send_message("⚠️ あなたには襲撃権限がありません。", ephemeral=True)
             return
 
         # 襲撃済みチェック
-        if uid in room.get("attacked_by_wolf", set()):
+        if uid in room.attacked_by_wolf:
             await interaction.response.send_message("⚠️ あなたは既に襲撃済みです。", ephemeral=True)
             return
+        if self.generation != current_generation(room):
+            await interaction.response.send_message(ERROR_MESSAGES["phase_over"], ephemeral=True)
+            return
 
-        room["night_actions"]["werewolf_targets"].append(self.target_user.id)
-        room.setdefault("attacked_by_wolf", set()).add(uid)
+        room.night_actions["werewolf_targets"].append(self.target_id)
+        room.attacked_by_wolf.add(uid)
+        mark_night_action(room, uid)
         
         # 全てのボタンを無効化
-        for child in self.view.children:
-            child.disabled = True
+        disable_all(self.view)
         await interaction.response.edit_message(view=self.view)
         
-        await interaction.followup.send(f"✅ {self.target_user.display_name} を襲撃対象に選択しました。", ephemeral=True)
-        self.view.stop()
-
-class SeerCheckButton(discord.ui.Button):
-    def __init__(self, cid: int, target_user: discord.User):
-        super().__init__(
-            label=f"占う: {target_user.display_name}",
-            style=discord.ButtonStyle.primary
-        )
+        await interaction.followup.send(f"✅ {room.name(self.target_id)} を襲撃対象に選択しました。", ephemeral=True)
+
+class SeerCheckButton(discord.ui.DynamicItem[discord.ui.Button], template=r"ww:seer:(?P<cid>\d+):(?P<gen>\d+):(?P<target>\d+)"):
+    def __init__(self, cid: int, generation: int, target_id: int, label: str, disabled: bool = False):
+        super().__init__(discord.ui.Button(
+            label=label,
+            style=discord.ButtonStyle.primary,
+            disabled=disabled,
+            custom_id=f"ww:seer:{cid}:{generation}:{target_id}"
+        ))
         self.cid = cid
-        self.target_user = target_user
+        self.generation = generation
+        self.target_id = target_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(int(match["cid"]), int(match["gen"]), int(match["target"]), item.label)
 
     async def callback(self, interaction: discord.Interaction):
         uid = interaction.user.id
@@ -1019,38 +1314,45 @@ class SeerCheckButton(discord.ui.Button):
         if not room:
             await interaction.response.send_message("❌ この部屋は存在しません。", ephemeral=True)
             return
-        if room["role_map"].get(uid) != "占い師":
+        if room.role_map.get(uid) != "占い師":
             await interaction.response.send_message("⚠️ あなたには占い権限がありません。", ephemeral=True)
             return
 
         # 占い済みチェック
-        if uid in room.get("used_seer", set()):
+        if uid in room.used_seer:
             await interaction.response.send_message("⚠️ あなたは既に占い済みです。", ephemeral=True)
             return
+        if self.generation != current_generation(room):
+            await interaction.response.send_message(ERROR_MESSAGES["phase_over"], ephemeral=True)
+            return
 
-        room["night_actions"]["seer_target"] = self.target_user.id
-        room.setdefault("used_seer", set()).add(uid)
+        room.night_actions["seer_target"] = self.target_id
+        room.used_seer.add(uid)
+        mark_night_action(room, uid)
         
         # 全てのボタンを無効化
-        for child in self.view.children:
-            child.disabled = True
+        disable_all(self.view)
         await interaction.response.edit_message(view=self.view)
         
         # 占い結果をすぐに通知
-        target_role = room["role_map"][self.target_user.id]
-        is_werewolf = target_role == "人狼"
-        result = "人狼" if is_werewolf else "村人陣営"
-        await interaction.followup.send(f"🔮 {self.target_user.display_name} を占いました。\n結果：**{result}**", ephemeral=True)
-        self.view.stop()
-
-class KnightProtectButton(discord.ui.Button):
-    def __init__(self, cid: int, target_user: discord.User):
-        super().__init__(
-            label=f"護衛: {target_user.display_name}",
-            style=discord.ButtonStyle.success
-        )
+        result = seer_result(room, self.target_id)
+        await interaction.followup.send(f"🔮 {room.name(self.target_id)} を占いました。\n結果：**{result}**", ephemeral=True)
+
+class KnightProtectButton(discord.ui.DynamicItem[discord.ui.Button], template=r"ww:knight:(?P<cid>\d+):(?P<gen>\d+):(?P<target>\d+)"):
+    def __init__(self, cid: int, generation: int, target_id: int, label: str, disabled: bool = False):
+        super().__init__(discord.ui.Button(
+            label=label,
+            style=discord.ButtonStyle.success,
+            disabled=disabled,
+            custom_id=f"ww:knight:{cid}:{generation}:{target_id}"
+        ))
         self.cid = cid
-        self.target_user = target_user
+        self.generation = generation
+        self.target_id = target_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(int(match["cid"]), int(match["gen"]), int(match["target"]), item.label)
 
     async def callback(self, interaction: discord.Interaction):
         uid = interaction.user.id
@@ -1058,25 +1360,27 @@ class KnightProtectButton(discord.ui.Button):
         if not room:
             await interaction.response.send_message("❌ この部屋は存在しません。", ephemeral=True)
             return
-        if room["role_map"].get(uid) != "騎士":
+        if room.role_map.get(uid) != "騎士":
             await interaction.response.send_message("⚠️ あなたには護衛権限がありません。", ephemeral=True)
             return
 
         # 護衛済みチェック
-        if uid in room.get("used_knight", set()):
+        if uid in room.used_knight:
             await interaction.response.send_message("⚠️ あなたは既に護衛済みです。", ephemeral=True)
             return
+        if self.generation != current_generation(room):
+            await interaction.response.send_message(ERROR_MESSAGES["phase_over"], ephemeral=True)
+            return
 
-        room["night_actions"]["knight_target"] = self.target_user.id
-        room.setdefault("used_knight", set()).add(uid)
+        room.night_actions["knight_target"] = self.target_id
+        room.used_knight.add(uid)
+        mark_night_action(room, uid)
         
         # 全てのボタンを無効化
-        for child in self.view.children:
-            child.disabled = True
+        disable_all(self.view)
         await interaction.response.edit_message(view=self.view)
         
-        await interaction.followup.send(f"🛡️ {self.target_user.display_name} を護衛対象に選択しました。", ephemeral=True)
-        self.view.stop()
+        await interaction.followup.send(f"🛡️ {room.name(self.target_id)} を護衛対象に選択しました。", ephemeral=True)
 
 # =============================
 # ==== 昼フェーズ用 View / Button クラス ====
@@ -1084,87 +1388,75 @@ class KnightProtectButton(discord.ui.Button):
 
 class VoteView(discord.ui.View):
     def __init__(self, cid: int):
-        super().__init__(timeout=180)  # 3分でタイムアウト
+        super().__init__(timeout=None)  # 締切はフェーズ進行のタイマーが決める
         self.cid = cid
         self.room = werewolf_rooms.get(cid)
-        self.button_states = {}  # ユーザーごとのボタン状態を保持
+        self.generation = current_generation(self.room)  # どの投票フェーズのボタンか
         if not self.room:
             return
-        
-        # 投票済みプレイヤーのセットを初期化
-        if "voted_players" not in self.room:
-            self.room["voted_players"] = set()
-
-    async def on_timeout(self):
-        """タイムアウト時の処理"""
-        room = werewolf_rooms.get(self.cid)
-        # 部屋が存在しない、または中断されている場合は何もしない
-        if not room or not room.get("started", False):
-            return
-
-        channel = werewolf_bot.get_channel(self.cid)
-        if channel:
-            await channel.send("⏰ 投票時間が終了しました。未投票者は自動的にランダム投票となります。")
-            await process_day_results(self.cid)
 
     def stop(self):
         """ビューを停止する際の処理"""
-        self.timeout = None  # タイムアウトを無効化
         super().stop()
 
-class VoteButton(discord.ui.Button):
-    def __init__(self, target_player: discord.User):
-        super().__init__(
-            label=f"{target_player.display_name}",
+class VoteButton(discord.ui.DynamicItem[discord.ui.Button], template=r"ww:vote:(?P<cid>\d+):(?P<gen>\d+):(?P<target>\d+)"):
+    def __init__(self, cid: int, generation: int, target_id: int, label: str):
+        super().__init__(discord.ui.Button(
+            label=label,
             style=discord.ButtonStyle.danger,
-            custom_id=str(target_player.id)
-        )
-        self.target_player = target_player
+            custom_id=f"ww:vote:{cid}:{generation}:{target_id}"
+        ))
+        self.cid = cid
+        self.generation = generation
+        self.target_id = target_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(int(match["cid"]), int(match["gen"]), int(match["target"]), item.label)
 
     async def callback(self, interaction: discord.Interaction):
         try:
-            cid = interaction.channel.id
+            cid = self.cid  # DMで押されるので、チャンネルではなくボタンの部屋を見る
             room = werewolf_rooms.get(cid)
-            if not room or room["phase"] != PHASE_VOTE:  # フェーズ判定を修正
+            if not room or room.phase != PHASE_VOTE:  # フェーズ判定を修正
                 await interaction.response.send_message("⚠️ 今は投票フェーズではありません。", ephemeral=True)
                 return
+            if self.generation != current_generation(room):
+                await interaction.response.send_message(ERROR_MESSAGES["phase_over"], ephemeral=True)
+                return
 
             voter_id = interaction.user.id
             
             # 生存者チェック
-            if voter_id not in room["alive"]:
+            if voter_id not in room.alive:
                 await interaction.response.send_message("⚠️ 死亡したプレイヤーは投票できません。", ephemeral=True)
                 return
 
             # 投票を記録
-            room.setdefault("votes", {})[voter_id] = int(self.custom_id)
-            room.setdefault("voted_players", set()).add(voter_id)
-
-            # このユーザーのカスタムビューを作成（ボタンの状態を個別に管理）
-            custom_view = VoteView(cid)
-            for button in custom_view.children:
-                if isinstance(button, VoteButton):
-                    # 投票済みのユーザーには全ボタンを無効化
-                    button.disabled = True
-            
-            # このユーザーにのみ無効化されたビューを表示
-            await interaction.response.edit_message(view=custom_view)
+            room.votes[voter_id] = self.target_id
+            room.voted_players.add(voter_id)
+            save_room_soon(room)
+
+            # 投票済みのユーザーには全ボタンを無効化して表示
+            disable_all(self.view)
+            await interaction.response.edit_message(view=self.view)
             
             # 投票完了メッセージ
             await interaction.followup.send(
-                f"✅ {self.target_player.display_name} に投票しました。",
+                f"✅ {room.name(self.target_id)} に投票しました。",
                 ephemeral=True
             )
 
-            # 投票状況を全体に通知
-            channel = interaction.channel
-            total_voters = len(room["alive"])  # 生存者数
-            current_votes = len(room["votes"])
-            await channel.send(f"💫 投票状況: {current_votes}/{total_voters} 人が投票済み")
+            # 投票状況メッセージを更新（連続した投票はまとめて1回の編集にする）
+            total_voters = len(room.alive)  # 生存者数
+            current_votes = len(room.votes)
+            board = room.vote_status
+            if board is not None:
+                board.update(vote_status_text(room))
 
-            # 全員が投票したかチェック
+            # 全員が投票したら投票フェーズを終える（処理はフェーズ進行のタスクが1回だけ行う）
             if current_votes == total_voters:
-                await process_vote_results(cid)
+                request_phase_end(room, "complete")
 
         except Exception as e:
             try:
@@ -1219,103 +1511,131 @@ async def send_roles_and_start(cid: int):
     if not room:
         return
 
-    players = room["players"]
-    roles = room["role_set"][:]
-    random.shuffle(roles)
+    players = room.players
     random.shuffle(players)
 
     # 役職配布と初期化
-    room["role_map"] = {user.id: role for user, role in zip(players, roles)}
-    room["alive"] = set(user.id for user in players)
-    room["dead"] = set()
-    room["phase"] = PHASE_NIGHT
-    room["day_count"] = 1
-    room["night_actions"] = {
-        "werewolf_targets": [],
-        "seer_target": None,
-        "knight_target": None,
-        "medium_result": None,
-        "madman_info": None
-    }
-    room["votes"] = {}
-    room["last_executed"] = None
-
-    # 役職通知とアクション要求
+    room.assign_roles(deal_roles([user.id for user in players], room.role_set, random))
+    room.day_count = 1
+    room.active_views = []
+    room.machine = PhaseMachine(cid)
+    room.machine.enter(room, PHASE_NIGHT, PHASE_TIMERS["first_night"])
+    room.night_actions = new_night_actions()
+    room.votes = {}
+    room.last_executed = None
+    room.start_time = datetime.now()
+    room.members = await snapshot_members(channel, players)
+
+    # 役職通知とアクション要求（全員に同時に送る）
+    wolves = room.alive_with(WOLF)
+    deliveries = []
     for user in players:
         uid = user.id
-        role = room["role_map"][uid]
-        
+        role = room.role_map[uid]
+
         # 基本の役職説明
         role_desc = ROLE_DESCRIPTIONS.get(role, "役職の説明がありません")
-        try:
-            await user.send(f"🎭 あなたの役職は **{role}** です。\n{role_desc}")
-        except discord.Forbidden:
-            await channel.send(f"⚠️ <@{uid}> に DM が送れませんでした。")
-            continue
+        messages = [{"content": f"🎭 あなたの役職は **{role}** です。\n{role_desc}"}]
 
         # 特殊役職の追加情報
         if role == "人狼":
             # 人狼同士を知らせる
-            wolves = [uid for uid, r in room["role_map"].items() if r == "人狼"]
             other_wolves = [wid for wid in wolves if wid != uid]
             if other_wolves:
-                wolf_info = "、".join(f"{werewolf_bot.get_user(wid).display_name}" for wid in other_wolves)
-                await user.send(f"🐺 仲間の人狼は {wolf_info} です。")
+                wolf_info = "、".join(room.name(wid) for wid in other_wolves)
+                messages.append({"content": f"🐺 仲間の人狼は {wolf_info} です。"})
             # 初日は襲撃なしを通知
-            await user.send("🌙 初日の夜は襲撃できません。")
+            messages.append({"content": "🌙 初日の夜は襲撃できません。"})
         elif role == "占い師":
             # 初日は人狼以外（白）のプレイヤーからランダムに占う
-            possible_targets = [pid for pid in room["alive"] 
-                              if pid != uid and room["role_map"][pid] != "人狼"]
-            if possible_targets:
-                target = random.choice(possible_targets)
-                room["night_actions"]["seer_target"] = target
-                target_role = room["role_map"][target]
-                is_werewolf = target_role == "人狼"  # 必ずFalseになるはず
-                result = "人狼" if is_werewolf else "村人陣営"
-                target_name = werewolf_bot.get_user(target).display_name
-                await user.send(f"🔮 初日の占い対象は {target_name} にランダムで決定されました。\n結果：**{result}**")
+            target = first_night_seer_target(room, uid, random)
+            if target is not None:
+                room.night_actions["seer_target"] = target
+                result = seer_result(room, target)
+                target_name = room.name(target)
+                messages.append({"content": f"🔮 初日の占い対象は {target_name} にランダムで決定されました。\n結果：**{result}**"})
+
+        # 役職はチャンネルに出せないので、DMが届かなければその旨だけ知らせる
+        deliveries.append((room.members[uid], messages, None))
+    await fan_out_dms(channel, deliveries)
+
+    # スキップボタンは夜の世代番号で先に作る（begin_night が夜を終える要求を出すと、次の await の間に世代が進む）
+    view = PhaseSkipView(cid)
+    room.active_views.append(view)
+
+    # 行動が必要なプレイヤーを数える（初日の占いは自動で済んでいる）
+    begin_night(room)
+    save_room(room)
 
     # 全体通知
     await channel.send("🌙 初日の夜です。各役職は DM を確認してください。")
 
     # 新しいフェーズスキップボタンを表示
-    view = PhaseSkipView(cid)
     await channel.send("⏩ 全員の準備が整ったら、次のフェーズへスキップできます：", view=view)
-    
-    # 夜アクション待機（初日は1分）
-    asyncio.create_task(wait_for_night_actions(cid))
 
 # === 投票処理の改善 ===
-def get_vote_results(votes: dict, room: dict) -> tuple[int, int, list]:
+def get_vote_results(votes: dict, room: WerewolfRoom) -> tuple[int, int, list]:
     """
     投票結果から最多得票者とその得票数を返す。
     同数の場合はランダムに選択。
     """
-    if not votes:
-        return None, 0, []
-    
-    # 投票結果を集計
-    counter = Counter(votes.values())
-    max_votes = max(counter.values())
-    max_voted = [uid for uid, count in counter.items() if count == max_votes]
-    
-    # 投票状況の詳細を生成
-    vote_details = []
-    for voter_id, target_id in votes.items():
-        voter = werewolf_bot.get_user(voter_id)
-        target = werewolf_bot.get_user(target_id)
-        if voter and target:
-            vote_details.append(f"{voter.display_name} → {target.display_name}")
-    
-    chosen = random.choice(max_voted)
-    return chosen, max_votes, vote_details
+    chosen, max_votes, _ = tally_votes(votes, random)
+    return chosen, max_votes, format_vote_details(room, votes)
+
+def format_vote_details(room: WerewolfRoom, votes: dict) -> list:
+    """投票状況の詳細（投票者 → 投票先）"""
+    return [f"{room.name(voter_id)} → {room.name(target_id)}" for voter_id, target_id in votes.items()]
 
 async def send_vote_results(channel: discord.TextChannel, vote_details: list):
     """投票結果をチャンネルに表示"""
     vote_summary = "\n".join(vote_details)
     await channel.send(f"📊 **投票結果**\n{vote_summary}")
 
+class DMResult(NamedTuple):
+    """fan_out_dms の宛先ごとの結果"""
+    user_id: int
+    delivered: bool                # DMで届いたか（False ならチャンネルに代替表示した）
+    seconds: float                 # 送信開始から最後の1通が届くまでの時間
+    error: Optional[Exception]     # 失敗した場合の例外
+
+def dm_with_fallback(user: discord.User, message: str, view: discord.ui.View = None) -> tuple:
+    """send_dm_or_channel と同じ振る舞いの fan_out_dms 用の宛先（DMが拒否されたらメンション付きでチャンネルへ）"""
+    kwargs = {"view": view} if view else {}
+    return user, [{"content": message, **kwargs}], {"content": f"<@{user.id}> {message}", **kwargs}
+
+async def fan_out_dms(channel: discord.TextChannel, deliveries: list[tuple[discord.User, list[dict], Optional[dict]]],
+                      limit: int = DM_CONCURRENCY) -> list[DMResult]:
+    """
+    (宛先, 送るメッセージの引数リスト, 代替表示) をまとめて並行に送る（同時送信は limit 人まで、1人宛ての複数通は順番通り）
+    DMが拒否されたら代替表示をチャンネルに送る（None なら届かなかったことだけ知らせる）
+    1人の失敗は他の人に影響せず、宛先ごとの結果を同じ順で返す
+    """
+    semaphore = asyncio.Semaphore(limit)
+    start = time.perf_counter()
+
+    async def deliver(user: discord.User, messages: list[dict], fallback: Optional[dict]) -> DMResult:
+        async with semaphore:
+            try:
+                for kwargs in messages:
+                    await user.send(**kwargs)
+                return DMResult(user.id, True, time.perf_counter() - start, None)
+            except (discord.Forbidden, PlayerNotFoundError) as e:
+                error = e
+            except discord.HTTPException as e:
+                print(f"DM送信エラー(ユーザー: {user.id}): {e}")
+                return DMResult(user.id, False, time.perf_counter() - start, e)
+        # チャンネルへの代替表示はDMの同時送信数に数えない
+        try:
+            if fallback is not None:
+                await channel.send(**fallback)
+            else:
+                await channel.send(f"⚠️ <@{user.id}> に DM が送れませんでした。")
+        except discord.HTTPException as e:
+            print(f"チャンネル送信エラー: {e}")
+        return DMResult(user.id, False, time.perf_counter() - start, error)
+
+    return await asyncio.gather(*(deliver(*delivery) for delivery in deliveries))
+
 async def send_dm_or_channel(user: discord.User, channel: discord.TextChannel, message: str, view: discord.ui.View = None) -> bool:
     """
     DMを送信し、失敗した場合はチャンネルにメンションで送信。
@@ -1339,52 +1659,46 @@ class PhaseSkipView(discord.ui.View):
     def __init__(self, cid: int):
         super().__init__(timeout=None)
         self.cid = cid
+        self.generation = current_generation(werewolf_rooms.get(cid))  # どのフェーズのボタンか
+        self.add_item(PhaseSkipButton(cid, self.generation))
 
-    def stop(self):
-        """ビューを停止する際の処理"""
-        super().stop()
+class PhaseSkipButton(discord.ui.DynamicItem[discord.ui.Button], template=r"ww:skip:(?P<cid>\d+):(?P<gen>\d+)"):
+    def __init__(self, cid: int, generation: int):
+        super().__init__(discord.ui.Button(
+            label="次のフェーズへ",
+            style=discord.ButtonStyle.danger,
+            custom_id=f"ww:skip:{cid}:{generation}"
+        ))
+        self.cid = cid
+        self.generation = generation
 
-    @discord.ui.button(label="次のフェーズへ", style=discord.ButtonStyle.danger)
-    async def skip_phase(self, interaction: discord.Interaction, button: discord.ui.Button):
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(int(match["cid"]), int(match["gen"]))
+
+    async def callback(self, interaction: discord.Interaction):
         room = werewolf_rooms.get(self.cid)
         if not room:
             await interaction.response.send_message("❌ この部屋は存在しません。", ephemeral=True)
             return
 
         # 参加者チェック
-        if interaction.user.id not in [p.id for p in room["players"]]:
+        if interaction.user.id not in room.members:
             await interaction.response.send_message("⚠️ このゲームの参加者ではありません。", ephemeral=True)
             return
 
+        # 前のフェーズのボタンや、すでに誰かが押した後のボタン
+        if self.generation != current_generation(room):
+            await interaction.response.send_message(ERROR_MESSAGES["phase_over"], ephemeral=True)
+            return
+
         # ボタンを無効化して再クリックを防止
-        button.disabled = True
-        await interaction.response.edit_message(view=self)
+        disable_all(self.view)
+        await interaction.response.edit_message(view=self.view)
 
-        try:
-            # アクティブなビューを全て停止
-            for view in room.get("active_views", []):
-                if not view.is_finished():
-                    view.stop()
-            room["active_views"] = []  # リセット
-
-            if room["phase"] == "night":
-                # 初日の夜は特別処理
-                if room["day_count"] == 1:
-                    # 初日の夜は襲撃なしで朝に移行
-                    room["night_actions"]["werewolf_targets"] = []
-                    await process_night_results(self.cid)
-                else:
-                    await process_night_results(self.cid)
-            elif room["phase"] == "day":
-                # 議論フェーズから投票フェーズへ
-                await start_voting_phase(self.cid)
-            elif room["phase"] == "vote":
-                # 投票フェーズから結果処理へ
-                await process_vote_results(self.cid)
-
-            await interaction.followup.send("⏩ フェーズをスキップしました。", ephemeral=False)
-        except Exception as e:
-            await interaction.followup.send(f"⚠️ エラーが発生しました: {str(e)}", ephemeral=True)
+        # 遷移はフェーズ進行のタスクが行う（同時に押されても、タイマーと重なっても1回だけ）
+        room.machine.request(self.generation, "skip")
+        await interaction.followup.send("⏩ フェーズをスキップしました。", ephemeral=False)
 
 # =============================
 # ==== 夜フェーズでの役職アクション通知を改善 ====
@@ -1395,59 +1709,44 @@ async def send_night_actions(cid: int):
     if not room:
         return
 
-    for user in room["players"]:
+    deliveries = []
+    for user in room.players:
         uid = user.id
-        if uid not in room["alive"]:
+        if uid not in room.alive:
             continue
 
-        role = room["role_map"][uid]
+        role = room.role_map[uid]
+        view = None
         if role == "人狼":
-            if room["day_count"] == 1:
-                await send_dm_or_channel(user, channel, "🌙 初日の夜は襲撃できません。")
+            if room.day_count == 1:
+                message = "🌙 初日の夜は襲撃できません。"
             else:
                 view = WolfNightView(cid, uid)
-                await send_dm_or_channel(user, channel, "🌙 襲撃する相手を選んでください：", view)
+                message = "🌙 襲撃する相手を選んでください："
         elif role == "占い師":
             view = SeerNightView(cid, uid)
-            await send_dm_or_channel(user, channel, "🌙 占う相手を選んでください：", view)
+            message = "🌙 占う相手を選んでください："
         elif role == "騎士":
             view = KnightNightView(cid, uid)
-            await send_dm_or_channel(user, channel, "🌙 護衛する相手を選んでください：", view)
+            message = "🌙 護衛する相手を選んでください："
         elif role == "狂人":
-            await send_dm_or_channel(user, channel, "🌙 あなたは狂人です。人狼陣営の勝利のために行動してください。")
+            message = "🌙 あなたは狂人です。人狼陣営の勝利のために行動してください。"
         else:
-            await send_dm_or_channel(user, channel, "🌙 あなたは特別な行動はできません。")
+            message = "🌙 あなたは特別な行動はできません。"
+        deliveries.append(dm_with_fallback(room.members[uid], message, view))
+
+    # 全員に同時に送る（DMが拒否された人はチャンネルにメンション付きで表示）
+    await fan_out_dms(channel, deliveries)
 
 # =============================
 # ==== 部屋の初期化処理を改善 ====
 # =============================
-def initialize_room(cid: int, role_set: list):
+def initialize_room(cid: int, role_set: list) -> WerewolfRoom:
     """部屋の初期化処理を共通化"""
-    return {
-        "role_set": role_set,
-        "players": [],
-        "role_map": {},
-        "alive": set(),
-        "dead": set(),
-        "phase": None,
-        "day_count": 1,
-        "night_actions": {
-            "werewolf_targets": [],
-            "seer_target": None,
-            "knight_target": None,
-            "medium_result": None
-        },
-        "votes": {},
-        "voted_players": set(),
-        "attacked_by_wolf": set(),
-        "used_seer": set(),
-        "used_knight": set(),
-        "last_executed": None,
-        "channel_id": cid
-    }
+    return WerewolfRoom(cid, role_set)
 
 # ゲーム進行状況の表示を改善
-def get_game_status_display(room: dict) -> str:
+def get_game_status_display(room: WerewolfRoom) -> str:
     """ゲームの現在の状態を表示する文字列を生成"""
     phase_emojis = {
         PHASE_NIGHT: "🌙",
@@ -1456,29 +1755,26 @@ def get_game_status_display(room: dict) -> str:
     }
     
     status = [
-        f"{phase_emojis.get(room['phase'], '❓')} **{room['day_count']}日目 {room['phase']}フェーズ**",
-        f"👥 生存者: {len(room['alive'])}人",
-        f"💀 死亡者: {len(room['dead'])}人",
-        f"⏱️ 経過時間: {int((datetime.now() - room['start_time']).total_seconds() // 60)}分"
+        f"{phase_emojis.get(room.phase, '❓')} **{room.day_count}日目 {room.phase}フェーズ**",
+        f"👥 生存者: {len(room.alive)}人",
+        f"💀 死亡者: {len(room.dead)}人",
+        f"⏱️ 経過時間: {int((datetime.now() - room.start_time).total_seconds() // 60)}分"
     ]
     
     # 死亡者一覧（いる場合のみ）
-    if room['dead']:
+    if room.dead:
         dead_players = []
-        for uid in room['dead']:
-            user = werewolf_bot.get_user(uid)
-            role = room['role_map'][uid]
-            if user:
-                dead_players.append(f"{user.display_name}({role})")
+        for uid in room.dead:
+            dead_players.append(f"{room.name(uid)}({room.role_map[uid]})")
         status.append(f"\n☠️ 死亡者一覧: {', '.join(dead_players)}")
     
     return "\n".join(status)
 
 # 投票フェーズの表示を改善
-def get_vote_status_display(room: dict) -> str:
+def get_vote_status_display(room: WerewolfRoom) -> str:
     """投票状況の表示を生成"""
-    voted = len(room.get('votes', {}))
-    total = len(room['alive'])
+    voted = len(room.votes)
+    total = len(room.alive)
     remaining = total - voted
     
     status = [
@@ -1491,10 +1787,8 @@ def get_vote_status_display(room: dict) -> str:
     # 投票済みプレイヤーを表示
     if voted > 0:
         voted_players = []
-        for voter_id in room['votes'].keys():
-            voter = werewolf_bot.get_user(voter_id)
-            if voter:
-                voted_players.append(voter.display_name)
+        for voter_id in room.votes.keys():
+            voted_players.append(room.name(voter_id))
         status.append(f"\n投票済みプレイヤー: {', '.join(voted_players)}")
     
     return "\n".join(status)
@@ -1524,7 +1818,7 @@ def get_player_safely(user_id: int) -> discord.User:
         raise PlayerNotFoundError(f"プレイヤー(ID: {user_id})が見つかりません")
     return user
 
-def get_room_safely(channel_id: int) -> dict:
+def get_room_safely(channel_id: int) -> WerewolfRoom:
     """ゲームルームを安全に取得"""
     room = werewolf_rooms.get(channel_id)
     if not room:
@@ -1544,20 +1838,20 @@ async def safe_dm(user: discord.User, content: str, **kwargs) -> bool:
         return False
 
 # ゲーム状態の検証
-def validate_game_state(room: dict) -> None:
+def validate_game_state(room: WerewolfRoom) -> None:
     """ゲーム状態の整合性を検証"""
     # プレイヤー情報の検証
-    for user_id in room["players"]:
-        if user_id not in room["role_map"]:
+    for user_id in room.players:
+        if user_id not in room.role_map:
             raise WerewolfGameError(f"プレイヤー(ID: {user_id})の役職が未設定です")
     
     # 生存者と死亡者の重複チェック
-    if set(room["alive"]) & set(room["dead"]):
+    if set(room.alive) & set(room.dead):
         raise WerewolfGameError("生存者と死亡者が重複しています")
     
     # 全プレイヤーが生存または死亡に含まれているか確認
-    all_players = set(room["players"])
-    accounted_players = set(room["alive"]) | set(room["dead"])
+    all_players = set(room.players)
+    accounted_players = set(room.alive) | set(room.dead)
     if all_players != accounted_players:
         raise WerewolfGameError("プレイヤーの状態が不正です")
 
@@ -1575,14 +1869,14 @@ async def start_game(interaction: discord.Interaction):
         room = get_room_safely(channel_id)
         
         # ゲーム開始前の検証
-        if len(room["players"]) not in ROLE_PRESETS:
-            raise WerewolfGameError(f"プレイヤー数({len(room['players'])})が不正です")
+        if len(room.players) not in ROLE_PRESETS:
+            raise WerewolfGameError(f"プレイヤー数({len(room.players)})が不正です")
         
         # ゲーム状態の初期化
-        room["phase"] = PHASE_NIGHT
-        room["day_count"] = 1
-        room["start_time"] = datetime.now()
-        room["last_activity"] = datetime.now()
+        room.phase = PHASE_NIGHT
+        room.day_count = 1
+        room.start_time = datetime.now()
+        room.last_activity = datetime.now()
         
         # 役職の割り当て
         await assign_roles(channel_id)
@@ -1597,15 +1891,15 @@ async def start_game(interaction: discord.Interaction):
         )
         
         # 各プレイヤーに役職を通知
-        for user_id in room["players"]:
+        for user_id in room.players:
             user = get_player_safely(user_id)
-            role = room["role_map"][user_id]
+            role = room.role_map[user_id]
             
             # 役職に応じた追加情報を付加
             additional_info = ""
             if role == "人狼":
                 # 他の人狼を通知
-                other_wolves = [uid for uid, r in room["role_map"].items() if r == "人狼" and uid != user_id]
+                other_wolves = room.alive_with("人狼") - {user_id}
                 if other_wolves:
                     wolf_names = [get_player_safely(uid).display_name for uid in other_wolves]
                     additional_info = f"\n\n🐺 仲間の人狼: {', '.join(wolf_names)}"
@@ -1625,3 +1919,634 @@ async def start_game(interaction: discord.Interaction):
     except Exception as e:
         await interaction.channel.send("❌ 予期せぬエラーが発生しました。")
         print(f"ゲーム開始エラー: {e}")
+
+# テスト
+def test_vote_status_debounce(votes: int = 7, interval: float = 0.05) -> dict:
+    """続けて入った投票が interval ごとの1回の編集にまとまり、締切時の内容が必ず反映されることを確認"""
+    class _FakeMessage:
+        def __init__(self):
+            self.content = None
+            self.edited_at = []
+            self.pinned = True
+
+        async def edit(self, content=None, **kwargs):
+            self.edited_at.append(asyncio.get_running_loop().time())
+            await asyncio.sleep(0.001)
+            self.content = content
+
+        async def unpin(self, **kwargs):
+            self.pinned = False
+
+    async def run():
+        message = _FakeMessage()
+        board = VoteStatusMessage(message, debounce=interval)
+        # 全員がほぼ同時に投票（まとめて最新の1回だけ編集される）
+        for i in range(votes):
+            board.update(f"{i + 1}/{votes}")
+        await asyncio.sleep(interval * 2)
+        burst_edits = len(message.edited_at)
+        assert message.content == f"{votes}/{votes}"
+        # 間隔をあけた投票はそれぞれ反映される
+        for i in range(3):
+            board.update(f"late {i}")
+            await asyncio.sleep(interval * 1.5)
+        await board.close("closed")
+
+        gaps = [b - a for a, b in zip(message.edited_at, message.edited_at[1:])]
+        assert burst_edits == 1, burst_edits
+        assert all(gap >= interval * 0.95 for gap in gaps), gaps
+        assert message.content == "closed" and not message.pinned
+        return {"updates": votes + 4, "edits": len(message.edited_at)}
+
+    result = asyncio.run(run())
+    print(f"✅ 投票状況メッセージのテスト完了: {result}")
+    return result
+
+def test_room_indexes(games: int = 500) -> dict:
+    """kill() で更新する役職ごとの生存者・勝敗判定が、毎回 role_map から数え直した結果と一致することを確認"""
+    rng = random.Random(0)
+    checks = 0
+    for g in range(games):
+        roles = rng.choice(list(ROLE_PRESETS.values()))[0][:]
+        rng.shuffle(roles)
+        room = WerewolfRoom(g, roles)
+        room.assign_roles({uid: role for uid, role in enumerate(roles)})
+        order = list(room.role_map)
+        rng.shuffle(order)
+        for uid in order:
+            for role in set(roles):
+                assert room.alive_with(role) == {u for u in room.alive if room.role_map[u] == role}
+            wolves = sum(1 for u in room.alive if room.role_map[u] == "人狼")
+            expected = "villagers" if wolves == 0 else "werewolves" if wolves >= len(room.alive) - wolves else ""
+            assert check_win_condition(room)[0] == expected
+            checks += 1
+            assert room.kill(uid) and not room.kill(uid)
+        assert not room.alive and room.dead == set(room.role_map)
+    print(f"✅ 部屋の生存者インデックスのテスト完了: {games}ゲーム / {checks}回の判定")
+    return {"games": games, "checks": checks}
+
+def test_member_snapshot(players: int = 7) -> dict:
+    """
+    キャッシュにいない参加者はまとめて1回の問い合わせで解決され、ゲーム開始後にキャッシュが消えても表示できることを確認
+    取得できなかった人はIDで表示し、DMはチャンネルへの代替表示になる
+    """
+    class _FakeUser:
+        def __init__(self, uid: int):
+            self.id = uid
+            self.display_name = f"user{uid}"
+            self.mention = f"<@{uid}>"
+            self.received = []
+
+        async def send(self, content=None, **kwargs):
+            self.received.append(content)
+
+    class _FakeGuild:
+        def __init__(self, known: dict):
+            self.known = known
+            self.queries = []
+
+        def get_member(self, uid: int):
+            return None
+
+        async def query_members(self, user_ids=None, cache=True):
+            self.queries.append(list(user_ids))
+            return [self.known[uid] for uid in user_ids if uid in self.known]
+
+    class _FakeChannel:
+        def __init__(self, guild):
+            self.guild = guild
+            self.sent = []
+
+        async def send(self, content=None, **kwargs):
+            self.sent.append(content)
+
+    class _FakeBot:
+        def __init__(self, cached: dict, fetchable: dict):
+            self.cached = cached
+            self.fetchable = fetchable
+            self.lookups = 0
+            self.fetches = 0
+
+        def get_user(self, uid: int):
+            self.lookups += 1
+            return self.cached.get(uid)
+
+        async def fetch_user(self, uid: int):
+            self.fetches += 1
+            if uid not in self.fetchable:
+                raise discord.NotFound(type("_Response", (), {"status": 404, "reason": "Not Found"})(), "Unknown User")
+            return self.fetchable[uid]
+
+    global werewolf_bot
+    users = {uid: _FakeUser(uid) for uid in range(1, players + 1)}
+    cached = {1: users[1], 2: users[2]}
+    in_guild = {uid: users[uid] for uid in range(3, players - 1)}
+    fetchable = {players - 1: users[players - 1]}  # 最後の1人はどこからも取得できない
+    original_bot = werewolf_bot
+    werewolf_bot = bot = _FakeBot(cached, fetchable)
+    try:
+        guild = _FakeGuild(in_guild)
+        channel = _FakeChannel(guild)
+        room = WerewolfRoom(-1, ["村人"] * players)
+        room.members = asyncio.run(snapshot_members(channel, list(users)))
+        room.assign_roles({uid: "村人" for uid in users})
+        assert len(guild.queries) == 1 and bot.fetches == 2
+        assert room.name(3) == "user3" and room.name(players) == f"ID:{players}"
+
+        # 開始後はキャッシュが空でも表示・DMが引き直しなしで動く
+        bot.cached.clear()
+        lookups = bot.lookups
+        room.votes = {uid: 1 for uid in users}
+        text = get_vote_status_display(room)
+        _, _, details = get_vote_results(room.votes, room)
+        results = asyncio.run(fan_out_dms(channel, [dm_with_fallback(room.members[uid], "投票してください") for uid in users]))
+        assert bot.lookups == lookups
+        assert "user2" in text and len(details) == players
+        assert [r.delivered for r in results] == [True] * (players - 1) + [False]
+        assert channel.sent == [f"<@{players}> 投票してください"]
+    finally:
+        werewolf_bot = original_bot
+    result = {"players": players, "queries": len(guild.queries), "fetches": bot.fetches}
+    print(f"✅ 参加者スナップショットのテスト完了: {result}")
+    return result
+
+def test_room_snapshot(rounds: int = 200) -> dict:
+    """
+    保存した部屋が同じ状態に戻り、ボタンの custom_id から部屋・世代・対象が復元できることを確認
+    あわせて1回の保存にかかる時間を測る（fsync あり）
+    """
+    import re
+    import tempfile
+
+    roles = ROLE_PRESETS[7][0]
+    room = WerewolfRoom(123456789012345678, roles)
+    room.members = {uid: PlayerInfo(uid, f"プレイヤー{uid}", f"<@{uid}>", None) for uid in range(1, len(roles) + 1)}
+    room.assign_roles(dict(zip(room.members, roles)))
+    room.kill(2)
+    room.phase, room.phase_deadline, room.day_count = PHASE_VOTE, time.time() + 60, 3
+    room.night_actions["werewolf_targets"] = [2]
+    room.votes = {1: 3, 4: 3}
+    room.start_time = datetime.now()
+
+    original_dir = SNAPSHOT_SETTINGS["DIR"]
+    timings = []
+    with tempfile.TemporaryDirectory() as tmp:
+        SNAPSHOT_SETTINGS["DIR"] = os.path.join(tmp, "snapshots")
+        try:
+            for _ in range(rounds):
+                timings.append(save_room(room))
+            size = os.path.getsize(snapshot_path(room.channel_id))
+            restored = WerewolfRoom.from_snapshot(load_room_snapshots()[0])
+            delete_room_snapshot(room.channel_id)
+            assert load_room_snapshots() == []
+        finally:
+            SNAPSHOT_SETTINGS["DIR"] = original_dir
+
+    for name in ("role_map", "alive", "dead", "alive_by_role", "phase", "day_count", "night_actions", "votes"):
+        assert getattr(restored, name) == getattr(room, name), name
+    assert restored.name(5) == "プレイヤー5" and check_win_condition(restored) == check_win_condition(room)
+
+    # 再起動後に届いたクリックは custom_id だけから同じボタンとして組み立てられる
+    button = VoteButton(room.channel_id, 7, 3, restored.name(3))
+    match = re.fullmatch(VoteButton.__discord_ui_compiled_template__, button.custom_id)
+    rebuilt = asyncio.run(VoteButton.from_custom_id(None, button.item, match))
+    assert (rebuilt.cid, rebuilt.generation, rebuilt.target_id) == (room.channel_id, 7, 3)
+
+    timings.sort()
+    result = {
+        "bytes": size,
+        "median_ms": timings[len(timings) // 2],
+        "p99_ms": timings[int(len(timings) * 0.99) - 1],
+        "max_ms": timings[-1],
+    }
+    assert result["median_ms"] < SNAPSHOT_SETTINGS["WARN_MS"], result
+    print(f"✅ ゲーム保存のテスト完了: {size}バイト / 中央値 {result['median_ms']:.2f}ms / p99 {result['p99_ms']:.2f}ms")
+    return result
+
+def test_phase_machine_once(rounds: int = 50) -> dict:
+    """スキップ・全員完了・時間切れが重なっても、1つのフェーズは1回だけ遷移することを確認"""
+    cid = -1
+    calls = []
+
+    async def transition(cid: int, reason: str):
+        calls.append(reason)
+        await asyncio.sleep(0)  # 遷移中に次の要求が来ても二重に進まない
+        room = werewolf_rooms[cid]
+        room.machine.enter(room, PHASE_NIGHT, 60)
+
+    async def run():
+        room = initialize_room(cid, ["村人"])
+        werewolf_rooms[cid] = room
+        room.machine = machine = PhaseMachine(cid)
+        original = dict(PHASE_TRANSITIONS)
+        PHASE_TRANSITIONS[PHASE_NIGHT] = transition
+        persistence = SNAPSHOT_SETTINGS["ENABLED"]
+        SNAPSHOT_SETTINGS["ENABLED"] = False
+        try:
+            for _ in range(rounds):
+                machine.enter(room, PHASE_NIGHT, 0.002)  # すぐ切れるタイマー
+                generation = machine.generation
+                machine.request(generation, "skip")
+                request_phase_end(room, "complete")
+                machine.request(generation, "skip")
+                await asyncio.sleep(0.005)
+                machine.request(generation, "skip")  # 前のフェーズのボタン
+            # 誰も何もしなければ時間切れで1回だけ進む
+            machine.enter(room, PHASE_NIGHT, 0.002)
+            await asyncio.sleep(0.01)
+        finally:
+            PHASE_TRANSITIONS.update(original)
+            SNAPSHOT_SETTINGS["ENABLED"] = persistence
+            close_room(cid)
+        assert machine.transitions == rounds + 1, machine.transitions
+        assert calls == ["skip"] * rounds + ["timeout"], calls[-3:]
+        return {"rounds": rounds, "transitions": machine.transitions}
+
+    async def run_failure():
+        # 遷移が例外で止まったら、受付が閉じたまま残さず部屋を片付けてチャンネルに知らせる
+        global werewolf_bot
+        sent = []
+
+        class _FakeChannel:
+            async def send(self, content=None, **kwargs):
+                sent.append(content)
+
+        class _FakeBot:
+            def get_channel(self, channel_id):
+                return _FakeChannel()
+
+        async def broken(cid: int, reason: str):
+            raise RuntimeError("broken transition")
+
+        room = initialize_room(cid, ["村人"])
+        werewolf_rooms[cid] = room
+        room.machine = machine = PhaseMachine(cid)
+        original, original_bot = dict(PHASE_TRANSITIONS), werewolf_bot
+        PHASE_TRANSITIONS[PHASE_VOTE] = broken
+        werewolf_bot = _FakeBot()
+        persistence = SNAPSHOT_SETTINGS["ENABLED"]
+        SNAPSHOT_SETTINGS["ENABLED"] = False
+        try:
+            machine.enter(room, PHASE_VOTE, 60)
+            request_phase_end(room, "skip")
+            await asyncio.wait_for(machine._task, 1)
+        finally:
+            PHASE_TRANSITIONS.update(original)
+            werewolf_bot = original_bot
+            SNAPSHOT_SETTINGS["ENABLED"] = persistence
+            close_room(cid)
+        assert cid not in werewolf_rooms and machine._timer is None
+        assert sent == [ERROR_MESSAGES["phase_failed"]], sent
+
+    result = asyncio.run(run())
+    asyncio.run(run_failure())
+    print(f"✅ フェーズ進行のテスト完了: {result}")
+    return result
+
+def test_first_night_skip_button(players: int = 4) -> dict:
+    """
+    初日の夜に行動する人がいなくてすぐに夜が終わっても、夜のスキップボタンは夜の世代番号を持つことを確認
+    （議論のボタンと同じ世代になると、夜のボタンで議論が飛ばされる）
+    """
+    class _FakeUser:
+        def __init__(self, uid: int):
+            self.id = uid
+            self.display_name = f"user{uid}"
+            self.mention = f"<@{uid}>"
+
+        async def send(self, content=None, **kwargs):
+            await asyncio.sleep(0)
+
+    class _FakeGuild:
+        def get_member(self, uid: int):
+            return None
+
+    class _FakeChannel:
+        guild = _FakeGuild()
+
+        def __init__(self):
+            self.views = []  # (内容, スキップボタンの世代番号)
+
+        async def send(self, content=None, view=None, **kwargs):
+            await asyncio.sleep(0)
+            if isinstance(view, PhaseSkipView):
+                self.views.append((content, view.generation))
+
+    channel = _FakeChannel()
+    users = [_FakeUser(uid) for uid in range(1, players + 1)]
+
+    class _FakeBot:
+        def get_channel(self, channel_id):
+            return channel
+
+        def get_user(self, uid: int):
+            return users[uid - 1]
+
+    async def end_first_night(cid: int, reason: str):
+        room = werewolf_rooms[cid]
+        room.machine.enter(room, PHASE_DAY, 60)
+        view = PhaseSkipView(cid)
+        room.active_views.append(view)
+        await channel.send("議論", view=view)
+
+    async def run():
+        global werewolf_bot
+        cid = 999  # ボタンの custom_id は正のチャンネルIDしか受け付けない
+        room = initialize_room(cid, ["村人"] * (players - 1) + ["人狼"])  # 初日は誰も行動しない
+        room.players = list(users)
+        werewolf_rooms[cid] = room
+        original, original_bot = dict(PHASE_TRANSITIONS), werewolf_bot
+        PHASE_TRANSITIONS[PHASE_NIGHT] = end_first_night
+        werewolf_bot = _FakeBot()
+        persistence = SNAPSHOT_SETTINGS["ENABLED"]
+        SNAPSHOT_SETTINGS["ENABLED"] = False
+        try:
+            await send_roles_and_start(cid)
+            for _ in range(20):
+                await asyncio.sleep(0)
+            machine = room.machine
+        finally:
+            PHASE_TRANSITIONS.update(original)
+            werewolf_bot = original_bot
+            SNAPSHOT_SETTINGS["ENABLED"] = persistence
+            close_room(cid)
+        night = [generation for content, generation in channel.views if content != "議論"]
+        day = [generation for content, generation in channel.views if content == "議論"]
+        assert night == [0] and day == [1] and machine.transitions == 1, channel.views
+        return {"night": night[0], "day": day[0]}
+
+    result = asyncio.run(run())
+    print(f"✅ 初日のスキップボタンのテスト完了: {result}")
+    return result
+
+def test_dm_fanout_skew(players: int = 8, latency: float = 0.05) -> dict:
+    """
+    役職・夜・投票のDMが最初の人と最後の人に届く時刻の差を、1人ずつ送る旧方式と fan_out_dms で比べる
+    Discord API の代わりに latency 秒かかる偽のDMを使う
+    """
+    class _Response:
+        status = 403
+        reason = "Forbidden"
+
+    class _FakeUser:
+        def __init__(self, uid: int, blocked: bool = False):
+            self.id = uid
+            self.blocked = blocked
+            self.received = 0
+
+        async def send(self, content=None, **kwargs):
+            await asyncio.sleep(latency * random.uniform(0.8, 1.2))
+            if self.blocked:
+                raise discord.Forbidden(_Response(), "Cannot send messages to this user")
+            self.received += 1
+
+    class _FakeChannel:
+        def __init__(self):
+            self.sent = []
+
+        async def send(self, content=None, **kwargs):
+            self.sent.append(content)
+
+    async def sequential(users) -> list[float]:
+        start = time.perf_counter()
+        arrived = []
+        for user in users:
+            await user.send("🌙 占う相手を選んでください：")
+            arrived.append(time.perf_counter() - start)
+        return arrived
+
+    async def concurrent(users) -> list[float]:
+        results = await fan_out_dms(_FakeChannel(), [dm_with_fallback(user, "🌙 占う相手を選んでください：")
+                                                     for user in users])
+        return [result.seconds for result in results]
+
+    async def run():
+        users = [_FakeUser(i) for i in range(players)]
+        skews = {}
+        for name, send in (("sequential", sequential), ("concurrent", concurrent)):
+            arrived = await send(users)
+            skews[name] = (max(arrived) - min(arrived)) * 1000
+
+        # DMを拒否した人の分はチャンネルへ代替表示され、他の人には影響しない
+        channel = _FakeChannel()
+        blocked, ok = _FakeUser(1, blocked=True), _FakeUser(2)
+        results = await fan_out_dms(channel, [dm_with_fallback(blocked, "投票してください"), (ok, [{"content": "a"}, {"content": "b"}], None)])
+        assert not results[0].delivered and isinstance(results[0].error, discord.Forbidden)
+        assert results[1].delivered and ok.received == 2
+        assert channel.sent == ["<@1> 投票してください"]
+        role_results = await fan_out_dms(channel, [(blocked, [{"content": "役職"}], None)])
+        assert not role_results[0].delivered and channel.sent[-1] == "⚠️ <@1> に DM が送れませんでした。"
+        return skews
+
+    skews = asyncio.run(run())
+    # 同時送信の上限(4)ごとに1回分の遅延しか増えない
+    assert skews["concurrent"] < skews["sequential"] / 2, skews
+    print(f"✅ DM一斉送信のテスト完了: 到着時刻の差 {skews['sequential']:.0f}ms → {skews['concurrent']:.0f}ms")
+    return skews
+
+# ベンチマーク
+def benchmark_night_wakeups(room_count: int = 200, action_delay: float = 2.5) -> dict:
+    """
+    room_count 部屋が同時に夜を迎え、action_delay 秒後に全員が行動したときの
+    タイマー登録数・CPU時間・最後の行動から朝処理までの遅延（旧: 1秒ごとのポーリング / 新: フェーズ進行の完了要求）
+    """
+    import time
+
+    class _CountingLoop(asyncio.SelectorEventLoop):
+        """call_later / call_at で登録されたタイマーを数える"""
+        timers = 0
+
+        def call_at(self, when, callback, *args, context=None):
+            self.timers += 1
+            return super().call_at(when, callback, *args, context=context)
+
+    roles = ["村人", "村人", "占い師", "騎士", "狂人", "人狼", "人狼"]
+
+    def make_room(cid: int) -> WerewolfRoom:
+        room = initialize_room(cid, roles)
+        uids = [cid * 10 + i for i in range(len(roles))]
+        room.assign_roles(dict(zip(uids, roles)))
+        room.phase = PHASE_NIGHT
+        room.day_count = 2
+        return room
+
+    async def poll_night(cid: int):
+        # 旧実装: 1秒ごとに role_map を数え直して揃ったか確認する
+        room = werewolf_rooms[cid]
+        num_wolves = sum(1 for uid, role in room.role_map.items() if role == "人狼" and uid in room.alive)
+        for _ in range(NIGHT_TIME):
+            if room.phase != PHASE_NIGHT:
+                return
+            if len(room.night_actions["werewolf_targets"]) >= num_wolves and (
+                room.night_actions["seer_target"] is not None
+                or not any(uid for uid, role in room.role_map.items() if role == "占い師" and uid in room.alive)
+            ):
+                await process_night_results(cid)
+                return
+            await asyncio.sleep(1)
+
+    async def run(loop: _CountingLoop, polling: bool) -> dict:
+        resolved_at = {}
+
+        all_resolved = asyncio.Event()
+
+        async def resolve(cid: int):
+            resolved_at[cid] = time.perf_counter()
+            werewolf_rooms[cid].phase = PHASE_DAY
+            if len(resolved_at) == room_count:
+                all_resolved.set()
+
+        cids = list(range(1, room_count + 1))
+        for cid in cids:
+            werewolf_rooms[cid] = make_room(cid)
+        globals()["process_night_results"], original = resolve, process_night_results
+        persistence = SNAPSHOT_SETTINGS["ENABLED"]
+        SNAPSHOT_SETTINGS["ENABLED"] = False  # 保存の時間は test_room_snapshot で測る
+        try:
+            timers_before, cpu_before = loop.timers, time.process_time()
+            if polling:
+                waiters = [asyncio.create_task(poll_night(cid)) for cid in cids]
+            else:
+                for cid in cids:
+                    room = werewolf_rooms[cid]
+                    room.machine = PhaseMachine(cid)
+                    room.machine.enter(room, PHASE_NIGHT, NIGHT_TIME)
+                    begin_night(room)
+                waiters = [asyncio.create_task(all_resolved.wait())]
+            await asyncio.sleep(action_delay)
+            acted_at = time.perf_counter()
+            for cid in cids:
+                room = werewolf_rooms[cid]
+                for uid, role in room.role_map.items():
+                    if role == "人狼":
+                        room.night_actions["werewolf_targets"].append(cid * 10)
+                    elif role == "占い師":
+                        room.night_actions["seer_target"] = cid * 10
+                    elif role == "騎士":
+                        room.night_actions["knight_target"] = cid * 10 + 1
+                    mark_night_action(room, uid)
+            await asyncio.gather(*waiters)
+            cpu = time.process_time() - cpu_before
+            timers = loop.timers - timers_before - 1  # 行動前の sleep を除く
+        finally:
+            globals()["process_night_results"] = original
+            SNAPSHOT_SETTINGS["ENABLED"] = persistence
+            for cid in cids:
+                close_room(cid)
+
+        assert len(resolved_at) == room_count
+        latencies = sorted(resolved_at[cid] - acted_at for cid in cids)
+        return {
+            "timers": timers,
+            "cpu_ms": cpu * 1000,
+            "median_latency_ms": latencies[len(latencies) // 2] * 1000,
+            "max_latency_ms": latencies[-1] * 1000,
+        }
+
+    results = {}
+    for name, polling in (("polling", True), ("event", False)):
+        loop = _CountingLoop()
+        try:
+            results[name] = loop.run_until_complete(run(loop, polling))
+        finally:
+            loop.close()
+    return results
+
+def benchmark_vote_status_calls(games: int = 10, players: int = 7, seed: int = 0, scale: float = 0.001) -> dict:
+    """
+    投票状況のAPI呼び出し（送信・編集・ピン留め/解除）を、偽のREST（呼び出しを数えるだけのチャンネル）で旧方式と比べる
+    旧方式: フェーズ開始から30秒ごとに新しいメッセージ + 投票のたびに「💫 投票状況」メッセージ
+    新方式: post_vote_status → VoteStatusMessage の編集（VOTE_STATUS_DEBOUNCE）→ close_vote_status
+    時間は scale 倍に縮めて流す。投票フェーズの数と投票者数は werewolf_engine の claim 方針のゲームから決める
+    投票の入り方は「フェーズ全体にばらける」と「締切間際にまとめて入る」の2通り
+    """
+    from werewolf_engine import claim_policy, play
+
+    class _FakeMessage:
+        def __init__(self, channel, content):
+            self.channel = channel
+            self.id = len(channel.calls)
+            self.content = content
+
+        async def edit(self, content=None, **kwargs):
+            self.channel.calls["edit"] += 1
+            self.content = content
+
+        async def pin(self, **kwargs):
+            self.channel.calls["pin"] += 1
+
+        async def unpin(self, **kwargs):
+            self.channel.calls["unpin"] += 1
+
+    class _FakeChannel:
+        def __init__(self):
+            self.calls = Counter()
+
+        async def send(self, content=None, **kwargs):
+            self.calls["send"] += 1
+            return _FakeMessage(self, content)
+
+    duration = PHASE_TIMERS["vote"]
+    rng = random.Random(seed)
+    phases = []  # 各投票フェーズの投票者数
+    for _ in range(games):
+        result = play(ROLE_PRESETS[players][0], claim_policy, claim_policy, rng)
+        phases.extend(max(2, players - 2 * k) for k in range(result.days - 1))
+
+    def vote_times(voters: int, pattern: str) -> List[float]:
+        if pattern == "spread":
+            return sorted(rng.uniform(0, duration) for _ in range(voters))
+        return sorted(rng.uniform(duration * 0.9, duration) for _ in range(voters))
+
+    async def old_phase(channel: _FakeChannel, times: List[float]):
+        # 旧 update_vote_status（30秒ごとに新しいメッセージ）と、投票ごとの通知
+        async def ticker():
+            for _ in range(0, duration, 30):
+                await channel.send("投票状況")
+                await asyncio.sleep(30 * scale)
+
+        async def voter(at: float):
+            await asyncio.sleep(at * scale)
+            await channel.send("💫 投票状況")
+
+        await asyncio.gather(ticker(), *(voter(at) for at in times))
+
+    async def new_phase(channel: _FakeChannel, times: List[float]):
+        room = WerewolfRoom(0, [])
+        room.members = {uid: PlayerInfo.unknown(uid) for uid in range(len(times))}
+        room.assign_roles({uid: "村人" for uid in range(len(times))})
+        room.phase_deadline = time.time() + duration
+        await post_vote_status(room, channel)
+        room.vote_status.debounce = VOTE_STATUS_DEBOUNCE * scale
+        start = asyncio.get_running_loop().time()
+        for uid, at in enumerate(times):
+            await asyncio.sleep(max(0.0, start + at * scale - asyncio.get_running_loop().time()))
+            room.votes[uid] = (uid + 1) % len(times)
+            room.vote_status.update(vote_status_text(room))
+        await asyncio.sleep(max(0.0, start + duration * scale - asyncio.get_running_loop().time()))
+        await close_vote_status(room)
+
+    async def run(pattern: str) -> dict:
+        results = {}
+        schedules = [vote_times(voters, pattern) for voters in phases]
+        for name, phase in (("before", old_phase), ("after", new_phase)):
+            channel = _FakeChannel()
+            await asyncio.gather(*(phase(channel, times) for times in schedules))
+            calls = sum(channel.calls.values())
+            results[name] = {
+                "calls_per_phase": calls / len(phases),
+                "messages_per_phase": channel.calls["send"] / len(phases),
+                "calls_per_game": calls / games,
+                **channel.calls,
+            }
+        return results
+
+    report = {"games": games, "vote_phases": len(phases)}
+    for pattern in ("spread", "burst"):
+        report[pattern] = asyncio.run(run(pattern))
+    for pattern in ("spread", "burst"):
+        before, after = report[pattern]["before"], report[pattern]["after"]
+        print(f"{pattern}: {before['calls_per_phase']:.1f} → {after['calls_per_phase']:.1f} 回/投票フェーズ, "
+              f"{before['calls_per_game']:.1f} → {after['calls_per_game']:.1f} 回/ゲーム, "
+              f"新規メッセージ {before['messages_per_phase']:.1f} → {after['messages_per_phase']:.1f}")
+    return report
@@ -0,0 +1,377 @@
+# werewolf_engine.py
+# 人狼ゲームのルール本体（discordに依存しない。werewolf.py はこの結果をDiscordに表示するだけ）
+#
+# 例:
+#   state = GameState()
+#   state.assign_roles(deal_roles(range(7), ROLE_PRESETS[7][0], rng))
+#   killed = resolve_night(state, actions)      # 騎士の護衛を反映して襲撃を解決
+#   outcome = resolve_vote(state, votes, rng)   # 同数なら乱数で1人を選んで処刑
+#   result = play_seeded(ROLE_PRESETS[7][0], "claim", "claim", seed=1)   # 方針を決めて1ゲームを最後まで進める
+
+import random
+import time
+from collections import Counter
+from typing import Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+WOLF = "人狼"
+MADMAN = "狂人"
+SEER = "占い師"
+KNIGHT = "騎士"
+MEDIUM = "霊媒師"
+VILLAGER = "村人"
+WOLF_TEAM = frozenset({WOLF, MADMAN})  # 勝敗で人狼陣営として数える役職
+
+VILLAGERS_WIN = "villagers"
+WEREWOLVES_WIN = "werewolves"
+WIN_MESSAGES = {
+    VILLAGERS_WIN: "人狼が全滅したため、村人陣営の勝利です！",
+    WEREWOLVES_WIN: "人狼が村人の数以上になったため、人狼陣営の勝利です！",
+}
+MAX_DAYS = 30  # これを超えたら打ち切り（シミュレーション用の上限）
+RULES_VERSION = 1  # ルールや方針の挙動を変えたら上げる（werewolf_sim のバランス集計のキャッシュを作り直す）
+
+# =============================
+# 役職プリセット（バランス調整）
+# =============================
+ROLE_PRESETS = {
+    4: [
+        ["村人", "村人", "占い師", "人狼"],  # 基本セット
+        ["村人", "占い師", "狂人", "人狼"],  # 狂人セット
+        ["村人", "騎士", "占い師", "人狼"],  # 騎士セット
+    ],
+    5: [
+        ["村人", "村人", "占い師", "狂人", "人狼"],  # 基本セット
+        ["村人", "騎士", "占い師", "狂人", "人狼"],  # 騎士セット
+        ["村人", "霊媒師", "占い師", "狂人", "人狼"],  # 霊媒師セット
+    ],
+    6: [
+        ["村人", "村人", "占い師", "騎士", "狂人", "人狼"],  # 基本セット
+        ["村人", "村人", "占い師", "霊媒師", "狂人", "人狼"],  # 霊媒師セット
+        ["村人", "騎士", "占い師", "霊媒師", "狂人", "人狼"],  # フルセット
+    ],
+    7: [
+        ["村人", "村人", "占い師", "騎士", "霊媒師", "狂人", "人狼"],  # 基本セット
+        ["村人", "村人", "占い師", "騎士", "狂人", "人狼", "人狼"],  # 人狼2セット
+        ["村人", "村人", "占い師", "霊媒師", "狂人", "人狼", "人狼"],  # 霊媒師セット
+    ],
+    8: [  # 8人用セットを追加
+        ["村人", "村人", "村人", "占い師", "騎士", "霊媒師", "狂人", "人狼"],  # バランスセット
+        ["村人", "村人", "占い師", "騎士", "霊媒師", "狂人", "人狼", "人狼"],  # 人狼2セット
+    ]
+}
+
+# =============================
+# 局面
+# =============================
+EMPTY_IDS: FrozenSet[int] = frozenset()
+
+class GameState:
+    """
+    ルールに関わる状態（役職・生死・日数）
+    生存者は役職ごとの集合でも持ち、kill() で死亡と同時に更新するので、勝敗判定や役職ごとの生存者は数え直さずに引ける
+    """
+    __slots__ = (
+        "role_map",       # 役職割当てマップ {user_id: role}
+        "alive",          # 生存者のID集合（kill() 以外で変更しない）
+        "dead",           # 死亡者のID集合
+        "alive_by_role",  # 役職ごとの生存者のID集合 {role: set(user_id)}
+        "day_count",      # 経過日数（1日目から開始。夜が明けるたびに進む）
+    )
+
+    def __init__(self):
+        self.role_map = {}
+        self.alive = set()
+        self.dead = set()
+        self.alive_by_role = {}
+        self.day_count = 1
+
+    def assign_roles(self, role_map: Dict[int, str]):
+        """役職を配って全員を生存にする"""
+        self.role_map = role_map
+        self.alive = set(role_map)
+        self.dead = set()
+        self.alive_by_role = {}
+        for uid, role in role_map.items():
+            self.alive_by_role.setdefault(role, set()).add(uid)
+
+    def kill(self, uid: int) -> bool:
+        """uid を死亡させる（すでに死亡していれば False）"""
+        if uid not in self.alive:
+            return False
+        self.alive.remove(uid)
+        self.dead.add(uid)
+        self.alive_by_role[self.role_map[uid]].discard(uid)
+        return True
+
+    def alive_with(self, role: str) -> Set[int]:
+        """role の生存者（変更しないこと）"""
+        return self.alive_by_role.get(role, EMPTY_IDS)
+
+    @property
+    def wolf_count(self) -> int:
+        return len(self.alive_with(WOLF))
+
+    def winner(self) -> str:
+        """勝った陣営（VILLAGERS_WIN / WEREWOLVES_WIN、続行中は ""）"""
+        wolf_count = self.wolf_count
+        if wolf_count == 0:
+            return VILLAGERS_WIN
+        if wolf_count >= len(self.alive) - wolf_count:
+            return WEREWOLVES_WIN
+        return ""
+
+def deal_roles(player_ids: Iterable[int], role_set: List[str], rng: random.Random) -> Dict[int, str]:
+    """役職をシャッフルして配る"""
+    roles = list(role_set)
+    rng.shuffle(roles)
+    return dict(zip(player_ids, roles))
+
+def seer_result(state: GameState, target: int) -> str:
+    """占い結果の表示（狂人は村人陣営と出る）"""
+    return "人狼" if state.role_map[target] == WOLF else "村人陣営"
+
+# =============================
+# 夜
+# =============================
+def new_night_actions() -> dict:
+    """夜ごとのアクション記録"""
+    return {
+        "werewolf_targets": [],
+        "seer_target": None,
+        "knight_target": None,
+        "medium_result": None,
+        "madman_info": None
+    }
+
+def legal_targets(state: GameState, uid: int, action: str) -> Tuple[int, ...]:
+    """選べる相手（action: "wolf" / "seer" / "knight" / "vote"。人狼は人狼を襲えず、誰も自分は選べない）"""
+    if action == "wolf":
+        wolves = state.alive_with(WOLF)
+        return tuple(t for t in state.alive if t not in wolves)
+    return tuple(t for t in state.alive if t != uid)
+
+def first_night_seer_target(state: GameState, seer: int, rng: random.Random) -> Optional[int]:
+    """初日の占い先（人狼以外からランダム。結果は必ず村人陣営）"""
+    candidates = [t for t in state.alive if t != seer and state.role_map[t] != WOLF]
+    return rng.choice(candidates) if candidates else None
+
+def night_actors(state: GameState, actions: dict) -> Set[int]:
+    """今夜行動が必要なプレイヤー（初日は人狼・騎士の行動なし。自動で占った初日の占い師も除く）"""
+    pending = set()
+    if state.day_count != 1:
+        pending |= state.alive_with(WOLF) | state.alive_with(KNIGHT)
+    if actions["seer_target"] is None:
+        pending |= state.alive_with(SEER)
+    return pending
+
+def fill_missing_actions(state: GameState, actions: dict, rng: random.Random):
+    """時間切れの夜に、未選択の襲撃（1人分）と占いをランダムに決める"""
+    if state.day_count != 1 and len(actions["werewolf_targets"]) < state.wolf_count:
+        targets = list(state.alive - state.alive_with(WOLF))
+        if targets:
+            actions["werewolf_targets"].append(rng.choice(targets))
+    if actions["seer_target"] is None:
+        for seer in state.alive_with(SEER):
+            targets = [t for t in state.alive if t != seer]
+            if targets:
+                actions["seer_target"] = rng.choice(targets)
+            break
+
+def resolve_night(state: GameState, actions: dict) -> Set[int]:
+    """
+    夜を解決して夜明けにする（人狼ごとに選んだ相手は全員襲撃され、騎士が守った1人だけは助かる）
+    死亡した人を返す
+    """
+    protected = actions.get("knight_target")
+    killed = set()
+    for victim in set(actions["werewolf_targets"]):
+        if victim != protected and state.kill(victim):
+            killed.add(victim)
+    state.day_count += 1
+    return killed
+
+# =============================
+# 投票
+# =============================
+class VoteOutcome(NamedTuple):
+    executed: Optional[int]   # 処刑された人（生存者がいなければ None）
+    votes: int                # 処刑された人の得票数
+    tied: Tuple[int, ...]     # 最多得票で並んだ人（1人なら同数なし）
+    random_hang: bool         # 誰も投票しなかったのでランダムに吊った
+
+def tally_votes(votes: Dict[int, int], rng: random.Random) -> Tuple[Optional[int], int, Tuple[int, ...]]:
+    """最多得票者（同数ならランダムに1人）・その得票数・同数で並んだ人"""
+    if not votes:
+        return None, 0, ()
+    counter = Counter(votes.values())
+    max_votes = max(counter.values())
+    tied = tuple(uid for uid, count in counter.items() if count == max_votes)
+    return rng.choice(tied), max_votes, tied
+
+def resolve_vote(state: GameState, votes: Dict[int, int], rng: random.Random) -> VoteOutcome:
+    """投票を集計して処刑する（誰も投票しなければ生存者からランダムに吊る）"""
+    target, count, tied = tally_votes(votes, rng)
+    if target is None:
+        if not state.alive:
+            return VoteOutcome(None, 0, (), True)
+        chosen = rng.choice(list(state.alive))
+        state.kill(chosen)
+        return VoteOutcome(chosen, 0, (), True)
+    if not state.kill(target):
+        return VoteOutcome(None, count, tied, False)
+    return VoteOutcome(target, count, tied, False)
+
+# =============================
+# 方針（エージェント）と1ゲームの進行
+# =============================
+class Table:
+    """1ゲーム分の、方針が参照できる情報"""
+    __slots__ = ("seer_results", "claims", "claimant")
+
+    def __init__(self):
+        self.seer_results: Dict[int, bool] = {}  # 占い師だけが知っている結果 {対象: 人狼か}
+        self.claims: Dict[int, bool] = {}        # 占い師が公開した結果（全員が見る）
+        self.claimant: Optional[int] = None      # 結果を公開した占い師
+
+# (局面, 自分のID, 行動の種類, 選べる相手, 公開情報, 乱数) -> 選んだ相手
+Policy = Callable[[GameState, int, str, Tuple[int, ...], Table, random.Random], int]
+
+def random_policy(state: GameState, uid: int, action: str, targets: Tuple[int, ...], table: Table, rng: random.Random) -> int:
+    """選べる相手から一様に選ぶ"""
+    return rng.choice(targets)
+
+def claim_policy(state: GameState, uid: int, action: str, targets: Tuple[int, ...], table: Table, rng: random.Random) -> int:
+    """
+    占い師が毎朝結果を公開する前提で動く
+    村人陣営は黒と出た人に投票し、騎士は占い師を守る。人狼陣営は占い師を襲撃・投票で狙う
+    """
+    role = state.role_map[uid]
+    claimant = table.claimant if table.claimant in targets else None
+    if action == "seer":
+        unknown = [t for t in targets if t not in table.seer_results]
+        return rng.choice(unknown or targets)
+    if action == "knight":
+        return claimant if claimant is not None else rng.choice(targets)
+    if action == "wolf" or role in WOLF_TEAM:
+        return claimant if claimant is not None else rng.choice(targets)
+    black = [t for t in targets if table.claims.get(t)]
+    if black:
+        return rng.choice(black)
+    grey = [t for t in targets if t not in table.claims and t != table.claimant]
+    return rng.choice(grey or targets)
+
+POLICIES: Dict[str, Policy] = {"random": random_policy, "claim": claim_policy}
+
+class GameResult(NamedTuple):
+    winner: str   # VILLAGERS_WIN / WEREWOLVES_WIN（MAX_DAYS で打ち切りなら ""）
+    days: int     # 決着した日
+    deaths: int   # 襲撃と処刑で死亡した人数
+
+def play(role_set: List[str], village: Policy, wolves: Policy, rng: random.Random, max_days: int = MAX_DAYS) -> GameResult:
+    """
+    werewolf.py と同じ順番で1ゲームを進める
+    夜（初日は自動占いのみ）→ 朝 → 全員投票 → 処刑 → 勝敗判定（勝敗は処刑の後にだけ判定する）
+    """
+    state = GameState()
+    state.assign_roles(deal_roles(range(len(role_set)), role_set, rng))
+    table = Table()
+    role_map = state.role_map
+    policies = {uid: wolves if role in WOLF_TEAM else village for uid, role in role_map.items()}
+
+    while state.day_count <= max_days:
+        # 夜
+        actions = new_night_actions()
+        first_night = state.day_count == 1
+        for seer in state.alive_with(SEER):
+            if first_night:
+                target = first_night_seer_target(state, seer, rng)
+            else:
+                target = policies[seer](state, seer, "seer", legal_targets(state, seer, "seer"), table, rng)
+            if target is not None:
+                actions["seer_target"] = target
+                table.seer_results[target] = role_map[target] == WOLF
+        if not first_night:
+            for wolf in list(state.alive_with(WOLF)):
+                targets = legal_targets(state, wolf, "wolf")
+                if targets:
+                    actions["werewolf_targets"].append(policies[wolf](state, wolf, "wolf", targets, table, rng))
+            for knight in state.alive_with(KNIGHT):
+                targets = legal_targets(state, knight, "knight")
+                if targets:
+                    actions["knight_target"] = policies[knight](state, knight, "knight", targets, table, rng)
+        resolve_night(state, actions)
+
+        # 朝: 生きている占い師は結果を公開する
+        for seer in state.alive_with(SEER):
+            table.claimant = seer
+            table.claims.update(table.seer_results)
+
+        # 投票
+        votes = {}
+        for uid in state.alive:
+            targets = legal_targets(state, uid, "vote")
+            if targets:
+                votes[uid] = policies[uid](state, uid, "vote", targets, table, rng)
+        resolve_vote(state, votes, rng)
+        winner = state.winner()
+        if winner:
+            return GameResult(winner, state.day_count, len(state.dead))
+    return GameResult("", state.day_count, len(state.dead))
+
+def play_seeded(role_set: List[str], village: str, wolves: str, seed: int) -> GameResult:
+    """方針を名前で指定し、seed から決まる1ゲーム（同じ seed なら同じ結果）"""
+    return play(role_set, POLICIES[village], POLICIES[wolves], random.Random(seed))
+
+# テスト
+def test_rules():
+    """騎士の護衛・同数のランダム処刑・勝敗判定・初日の占いを確認"""
+    rng = random.Random(0)
+    state = GameState()
+    state.assign_roles({1: WOLF, 2: WOLF, 3: KNIGHT, 4: SEER, 5: VILLAGER, 6: MADMAN})
+
+    # 騎士が守った人は襲撃されず、人狼ごとに別の相手を選んだら両方死ぬ
+    actions = new_night_actions()
+    actions["werewolf_targets"] = [4, 5]
+    actions["knight_target"] = 4
+    assert resolve_night(state, actions) == {5} and state.day_count == 2
+    assert state.alive_with(VILLAGER) == set() and state.winner() == ""
+
+    # 同数なら並んだ人からランダムに1人（何度やっても並んだ人の中から選ばれる）
+    chosen = {tally_votes({1: 3, 2: 6, 3: 1}, rng)[0] for _ in range(50)}
+    assert chosen == {1, 3, 6}, chosen
+    outcome = resolve_vote(state, {1: 3, 2: 3, 3: 1, 4: 1, 6: 2}, rng)
+    assert outcome.executed in (1, 3) and outcome.tied and outcome.votes == 2
+    assert resolve_vote(GameState(), {}, rng).executed is None
+
+    # 人狼 2 / 村人陣営 2（狂人を含む）で人狼陣営の勝ち。人狼が全滅すれば村人陣営の勝ち
+    state = GameState()
+    state.assign_roles({1: WOLF, 2: WOLF, 3: SEER, 4: VILLAGER, 5: MADMAN})
+    assert state.winner() == ""
+    state.kill(4)
+    assert state.winner() == WEREWOLVES_WIN
+    state = GameState()
+    state.assign_roles({1: WOLF, 2: SEER, 3: VILLAGER})
+    state.kill(1)
+    assert state.winner() == VILLAGERS_WIN
+
+    # 初日の占いは人狼以外、行動待ちは占い師だけ
+    state = GameState()
+    state.assign_roles({1: WOLF, 2: SEER, 3: KNIGHT, 4: VILLAGER})
+    assert {first_night_seer_target(state, 2, rng) for _ in range(30)} == {3, 4}
+    assert night_actors(state, new_night_actions()) == {2}
+    state.day_count = 2
+    assert night_actors(state, new_night_actions()) == {1, 2, 3}
+
+    # 同じ seed からは同じゲームになる
+    assert play_seeded(ROLE_PRESETS[7][1], "claim", "claim", 5) == play_seeded(ROLE_PRESETS[7][1], "claim", "claim", 5)
+    print("✅ 人狼ルールのテスト完了")
+
+def benchmark_engine(games: int = 20000) -> Dict[str, float]:
+    """1プロセスで1秒あたりに進められるゲーム数（7人・基本セット・claim 方針）"""
+    rng = random.Random(0)
+    role_set = ROLE_PRESETS[7][0]
+    start = time.perf_counter()
+    for _ in range(games):
+        play(role_set, claim_policy, claim_policy, rng)
+    seconds = time.perf_counter() - start
+    return {"games": games, "seconds": seconds, "games_per_second": games / seconds}
@@ -0,0 +1,303 @@
+# werewolf_sim.py
+# 人狼の役職セットのバランス検証用シミュレーター（werewolf_engine のルールで大量のゲームをプロセス並列で進める）
+#
+# 例:
+#   from werewolf_sim import simulate
+#   simulate(ROLE_PRESETS[7][1], village="claim", wolves="claim", games=200_000, seed=0)
+#   print(format_balance_report(balance_report()))   # 全プリセットの勝率（計算済みのセットはキャッシュから）
+
+import json
+import math
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from werewolf_engine import (
+    KNIGHT, MADMAN, MAX_DAYS, POLICIES, ROLE_PRESETS, RULES_VERSION, SEER, VILLAGER, VILLAGERS_WIN, WEREWOLVES_WIN, WOLF,
+    play,
+)
+
+CHUNK_GAMES = 20_000  # 1ワーカーに渡す単位（結果は chunk ごとの seed で決まるので、ワーカー数を変えても同じ）
+
+# バランス集計
+BALANCE_SETTINGS = {
+    "CACHE_PATH": "werewolf_balance.json",  # 集計結果のキャッシュ（RULES_VERSION ごと）
+    "REPORT_GAMES": 100_000,                # プリセット1つあたりのゲーム数
+    "SEARCH_GAMES": 20_000,                 # 候補探しでの1セットあたりのゲーム数
+    "Z": 1.96,                              # 信頼区間（95%）
+}
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) - 1))
+    return _executor
+
+def run_games(role_set: List[str], village: str = "claim", wolves: str = "claim",
+              games: int = CHUNK_GAMES, seed: str = "0", max_days: int = MAX_DAYS) -> Dict[str, object]:
+    """
+    games ゲームを1プロセスで最後まで進める（ワーカーで動かすので方針は名前で受け取る）
+    戻り値: 陣営ごとの勝利数（打ち切りは ""）と、決着したゲームの決着した日の分布
+    """
+    rng = random.Random(seed)
+    village_policy, wolves_policy = POLICIES[village], POLICIES[wolves]
+    wins = Counter()
+    days = Counter()
+    for _ in range(games):
+        result = play(role_set, village_policy, wolves_policy, rng, max_days)
+        wins[result.winner] += 1
+        if result.winner:
+            days[result.days] += 1
+    return {"wins": wins, "days": days}
+
+def simulate(role_set: List[str], village: str = "claim", wolves: str = "claim", games: int = 100_000,
+             seed: int = 0, parallel: bool = True, max_days: int = MAX_DAYS) -> Dict[str, object]:
+    """
+    陣営ごとの勝率・決着までの日数をまとめる
+    CHUNK_GAMES ごとに seed を分けて get_executor() のプロセスに配る（parallel=False ならこのプロセスで順に進める）
+    """
+    return simulate_many([role_set], village, wolves, games, seed, parallel, max_days)[0]
+
+def simulate_many(role_sets: List[List[str]], village: str = "claim", wolves: str = "claim", games: int = 100_000,
+                  seed: int = 0, parallel: bool = True, max_days: int = MAX_DAYS) -> List[Dict[str, object]]:
+    """
+    複数の役職セットの chunk をまとめて1度にプロセスへ配る（セットごとのゲーム数が少なくても全コアを使う）
+    セットごとの結果は simulate() と同じ
+    """
+    start = time.perf_counter()
+    args, owners = [], []
+    for index, role_set in enumerate(role_sets):
+        for i, offset in enumerate(range(0, games, CHUNK_GAMES)):
+            args.append((list(role_set), village, wolves, min(CHUNK_GAMES, games - offset), f"{seed}-{i}", max_days))
+            owners.append(index)
+    if parallel and len(args) > 1:
+        results = list(get_executor().map(run_games, *zip(*args)))
+    else:
+        results = [run_games(*a) for a in args]
+    seconds = time.perf_counter() - start
+
+    merged = [(Counter(), Counter()) for _ in role_sets]
+    for index, result in zip(owners, results):
+        merged[index][0].update(result["wins"])
+        merged[index][1].update(result["days"])
+    return [summarize(games, wins, days, seconds / len(role_sets)) for wins, days in merged]
+
+def summarize(games: int, wins: Counter, days: Counter, seconds: float) -> Dict[str, object]:
+    """勝利数と決着日の分布を、勝率・平均日数などの表にまとめる"""
+    decided = games - wins[""]
+    return {
+        "games": games,
+        "villagers_win": wins[VILLAGERS_WIN] / games,
+        "werewolves_win": wins[WEREWOLVES_WIN] / games,
+        "draw": wins[""] / games,
+        "days_mean": sum(day * count for day, count in days.items()) / decided if decided else 0.0,
+        "days_histogram": {day: days[day] for day in sorted(days)},
+        "seconds": seconds,
+        "games_per_second": games / seconds if seconds else 0.0,
+    }
+
+def compare_presets(players: int, village: str = "claim", wolves: str = "claim",
+                    games: int = 100_000, seed: int = 0) -> List[Dict[str, object]]:
+    """その人数のプリセットを同じ方針・同じ seed で並べる"""
+    rows = []
+    for index, role_set in enumerate(ROLE_PRESETS[players]):
+        report = simulate(role_set, village, wolves, games, seed)
+        report.pop("days_histogram")
+        rows.append({"players": players, "index": index, "role_set": role_set, **report})
+    return rows
+
+# =============================
+# バランス集計
+# =============================
+def wilson_interval(wins: float, games: int, z: float = BALANCE_SETTINGS["Z"]) -> Tuple[float, float]:
+    """勝率の信頼区間（Wilson）"""
+    if not games:
+        return 0.0, 1.0
+    rate = wins / games
+    denominator = 1 + z * z / games
+    center = (rate + z * z / (2 * games)) / denominator
+    half = z * math.sqrt(rate * (1 - rate) / games + z * z / (4 * games * games)) / denominator
+    return max(0.0, center - half), min(1.0, center + half)
+
+def cache_key(role_set: List[str], village: str, wolves: str, games: int, seed: int) -> str:
+    """同じルール・方針・ゲーム数・seed・役職の組み合わせなら同じキー（並び順は問わない）"""
+    return f"v{RULES_VERSION}|{village}|{wolves}|{games}|{seed}|{MAX_DAYS}|{','.join(sorted(role_set))}"
+
+def load_balance_cache(path: str) -> Dict[str, dict]:
+    """今の RULES_VERSION で集計した結果だけを読む（壊れていれば空）"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != RULES_VERSION:
+        return {}
+    return data.get("results", {})
+
+def save_balance_cache(path: str, results: Dict[str, dict]):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": RULES_VERSION, "results": results}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+def evaluate_role_sets(role_sets: List[List[str]], village: str = "claim", wolves: str = "claim",
+                       games: int = BALANCE_SETTINGS["REPORT_GAMES"], seed: int = 0,
+                       cache_path: Optional[str] = BALANCE_SETTINGS["CACHE_PATH"]) -> List[Dict[str, object]]:
+    """
+    役職セットごとの勝率・信頼区間・平均日数
+    キャッシュにないセットだけを simulate_many でまとめて計算し、結果をキャッシュに足す（cache_path=None なら使わない）
+    """
+    cache = load_balance_cache(cache_path) if cache_path else {}
+    keys = [cache_key(role_set, village, wolves, games, seed) for role_set in role_sets]
+    missing = {}
+    for key, role_set in zip(keys, role_sets):
+        if key not in cache:
+            missing.setdefault(key, role_set)
+    if missing:
+        reports = simulate_many(list(missing.values()), village, wolves, games, seed)
+        for key, report in zip(missing, reports):
+            cache[key] = {name: report[name] for name in ("villagers_win", "werewolves_win", "draw", "days_mean", "seconds")}
+        if cache_path:
+            save_balance_cache(cache_path, cache)
+
+    rows = []
+    for key, role_set in zip(keys, role_sets):
+        report = cache[key]
+        low, high = wilson_interval(report["villagers_win"] * games, games)
+        rows.append({
+            "players": len(role_set),
+            "policies": f"{village}/{wolves}",
+            "games": games,
+            "role_set": list(role_set),
+            "villagers_win": report["villagers_win"],
+            "villagers_low": low,
+            "villagers_high": high,
+            "werewolves_win": report["werewolves_win"],
+            "draw": report["draw"],
+            "days_mean": report["days_mean"],
+            "cached": key not in missing,
+        })
+    return rows
+
+def balance_report(players: Iterable[int] = tuple(ROLE_PRESETS), village: str = "claim", wolves: str = "claim",
+                   games: int = BALANCE_SETTINGS["REPORT_GAMES"], seed: int = 0,
+                   cache_path: Optional[str] = BALANCE_SETTINGS["CACHE_PATH"]) -> List[Dict[str, object]]:
+    """ROLE_PRESETS の全セットの勝率（人数・プリセット番号つき）"""
+    targets = [(count, index, role_set) for count in players for index, role_set in enumerate(ROLE_PRESETS[count])]
+    rows = evaluate_role_sets([role_set for _, _, role_set in targets], village, wolves, games, seed, cache_path)
+    for (count, index, _), row in zip(targets, rows):
+        row["index"] = index
+    return rows
+
+def candidate_role_sets(players: int) -> List[List[str]]:
+    """
+    その人数で作れる役職セット（人狼は開始時点で勝ちにならない数まで、占い師・騎士・狂人は0〜1人、残りは村人）
+    霊媒師は今のルールでは夜の行動がなく村人と同じ結果になるので、候補には入れない
+    """
+    candidates = []
+    for wolves in range(1, (players + 1) // 2):
+        for seer in (0, 1):
+            for knight in (0, 1):
+                for madman in (0, 1):
+                    villagers = players - wolves - seer - knight - madman
+                    if villagers < 0:
+                        continue
+                    candidates.append([VILLAGER] * villagers + [SEER] * seer + [KNIGHT] * knight
+                                      + [MADMAN] * madman + [WOLF] * wolves)
+    return candidates
+
+def search_balanced(players: int, village: str = "claim", wolves: str = "claim", top: int = 3,
+                    search_games: int = BALANCE_SETTINGS["SEARCH_GAMES"], games: int = BALANCE_SETTINGS["REPORT_GAMES"],
+                    seed: int = 0, cache_path: Optional[str] = BALANCE_SETTINGS["CACHE_PATH"]) -> List[Dict[str, object]]:
+    """
+    村人陣営の勝率が50%に近い役職セットを探す
+    全候補を search_games で粗く測り、近い順に top 件だけ games で測り直す
+    """
+    candidates = candidate_role_sets(players)
+    rough = evaluate_role_sets(candidates, village, wolves, search_games, seed, cache_path)
+    rough.sort(key=lambda row: abs(row["villagers_win"] - 0.5))
+    best = [row["role_set"] for row in rough[:top]]
+    rows = evaluate_role_sets(best, village, wolves, games, seed, cache_path)
+    rows.sort(key=lambda row: abs(row["villagers_win"] - 0.5))
+    return rows
+
+def describe_role_set(role_set: List[str]) -> str:
+    """役職セットを「人狼2・占い師1・村人3」のように表示する"""
+    counts = Counter(role_set)
+    return "・".join(f"{role}{count}" for role, count in counts.most_common())
+
+def format_balance_report(rows: List[Dict[str, object]], title: str = "📊 役職セットのバランス") -> str:
+    """集計結果を人数ごとに並べた表示用テキスト"""
+    lines = [f"**{title}**"]
+    if rows:
+        lines.append(f"方針（村人陣営/人狼陣営）: {rows[0]['policies']} / {rows[0]['games']:,}ゲーム / ルール v{RULES_VERSION}")
+    current = None
+    for row in rows:
+        if row["players"] != current:
+            current = row["players"]
+            lines.append(f"\n**{current}人**")
+        label = f"#{row['index'] + 1} " if "index" in row else ""
+        lines.append(
+            f"{label}{describe_role_set(row['role_set'])}: 村人陣営 {row['villagers_win'] * 100:.1f}% "
+            f"({row['villagers_low'] * 100:.1f}〜{row['villagers_high'] * 100:.1f}%) / "
+            f"人狼陣営 {row['werewolves_win'] * 100:.1f}% / 平均 {row['days_mean']:.2f}日"
+        )
+    return "\n".join(lines)
+
+# テスト
+def test_simulator(games: int = 50_000):
+    """同じ seed ならプロセス並列でも順に進めても同じ結果になり、勝率の合計が1になること"""
+    role_set = ROLE_PRESETS[7][0]
+    serial = simulate(role_set, games=games, seed=3, parallel=False)
+    pooled = simulate(role_set, games=games, seed=3, parallel=True)
+    for key in ("villagers_win", "werewolves_win", "draw", "days_histogram"):
+        assert serial[key] == pooled[key], key
+    assert abs(serial["villagers_win"] + serial["werewolves_win"] + serial["draw"] - 1) < 1e-9
+    assert sum(serial["days_histogram"].values()) == round(games * (1 - serial["draw"]))
+    assert simulate(role_set, games=games, seed=4, parallel=False)["days_histogram"] != serial["days_histogram"]
+    print("✅ 人狼シミュレーターのテスト完了")
+
+def test_balance_cache(games: int = 2_000):
+    """2回目の集計はキャッシュから同じ値を返し、RULES_VERSION が変われば計算し直すこと"""
+    import tempfile
+    import werewolf_engine
+
+    global RULES_VERSION
+    low, high = wilson_interval(50, 100)
+    assert low < 0.5 < high and abs((low + high) / 2 - 0.5) < 1e-9
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "balance.json")
+        first = balance_report((4, 5), games=games, cache_path=path)
+        assert not any(row["cached"] for row in first)
+        second = balance_report((4, 5), games=games, cache_path=path)
+        assert all(row["cached"] for row in second)
+        assert [row["villagers_win"] for row in first] == [row["villagers_win"] for row in second]
+        # 1セットだけ増えた場合は、増えたセットだけを計算する
+        extra = evaluate_role_sets([ROLE_PRESETS[4][0], [VILLAGER, VILLAGER, VILLAGER, WOLF]], games=games, cache_path=path)
+        assert [row["cached"] for row in extra] == [True, False]
+
+        saved = RULES_VERSION
+        RULES_VERSION = werewolf_engine.RULES_VERSION + 1
+        try:
+            assert not any(row["cached"] for row in balance_report((4,), games=games, cache_path=path))
+        finally:
+            RULES_VERSION = saved
+    rows = search_balanced(6, top=2, search_games=games, games=games, cache_path=None)
+    assert len(rows) == 2 and all(row["players"] == 6 for row in rows)
+    print(format_balance_report(rows, "テスト"))
+    print("✅ バランス集計のテスト完了")
+
+def benchmark_simulator(games: int = 200_000) -> Dict[str, Dict[str, float]]:
+    """方針の組み合わせごとの処理速度と結果（7人・基本セット）"""
+    results = {}
+    for village, wolves in (("random", "random"), ("claim", "random"), ("claim", "claim")):
+        report = simulate(ROLE_PRESETS[7][0], village, wolves, games=games, seed=0)
+        results[f"{village}_vs_{wolves}"] = {
+            key: report[key] for key in ("villagers_win", "werewolves_win", "draw", "days_mean", "seconds", "games_per_second")
+        }
+    return results